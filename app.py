@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Single entry point for all the stacks of the repository.  Every stack (and
+# every per-environment variant of it) is synthesized in its own process and
+# the results are merged into one cloud assembly in cdk.out.
+#
+# Per-environment variants come from the "environments" context value, e.g.
+#   "environments": {"dev": {"region": "eu-central-1"},
+#                    "prod": {"account": "123456789012", "region": "eu-west-1",
+#                             "context": {"instance_profile": "compute"}}}
+# yields create-basic-vpc-dev, create-basic-vpc-prod, ...  The "context" of an
+# environment sets defaults for its stacks (-c and cdk.json values still win).
+# A region/account matrix ({"regions": [...], "accounts": [...]}) or a JSON
+# file holding either works too, see cdk_common/environments.py.
+
+import os
+import time
+
+from cdk_common.entrypoint import select_specs
+from cdk_common.environments import load_environments, prefetch_lookups
+from cdk_common.lookups import Lookups
+from cdk_common.parallel_synth import StackSpec, print_timings, synth_parallel
+from cdk_common.synth_cache import COMMON_DIR, SynthCache, app_context
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+STACKS = [
+    ("create-basic-vpc", "create_basic_vpc", "create_basic_vpc.create_basic_vpc_stack:CreateBasicVpcStack"),
+    ("instance-creation", "instance_creation", "instance_creation.instance_creation_stack:InstanceCreationStack"),
+    ("AppLbSampleStack", "app_lb_sample", "app_lb_sample.app_lb_sample_stack:AppLbSampleStack"),
+    # Image pipelines baking the configure.sh scripts, see cdk_common/ami_pipeline.py
+    ("instance-creation-ami", "instance_creation", "instance_creation.ami_stack:InstanceCreationAmiStack"),
+    ("AppLbSampleAmi", "app_lb_sample", "app_lb_sample.ami_stack:AppLbSampleAmiStack"),
+]
+
+
+def stack_specs(context: dict) -> list:
+    environments = load_environments(context.get("environments"), ROOT)
+    specs = []
+    for index, (stack_id, project, target) in enumerate(STACKS):
+        if not environments:
+            specs.append(StackSpec(stack_id, target, paths=(os.path.join(ROOT, project),)))
+        for env in environments:
+            specs.append(StackSpec(stack_id=f"{stack_id}-{env.name}",
+                                   target=target,
+                                   paths=(os.path.join(ROOT, project),),
+                                   account=env.account,
+                                   region=env.region,
+                                   # The env's context defaults and the VPC CIDR of the stack in its block
+                                   context=env.stack_context(index)))
+    # -c stacks=create-basic-vpc-* builds only the matching stacks
+    return select_specs(specs, context)
+
+
+def lookups(context: dict) -> dict:
+    """Lookups of the default region and of every environment's region, all
+    of which end up in the templates (and so in the synth cache key)."""
+    regions = prefetch_lookups(load_environments(context.get("environments"), ROOT), context.get)
+    return {"default": Lookups.from_context(context.get).prefetch(), "regions": regions}
+
+
+def build(context: dict) -> str:
+    outdir = os.environ.get("CDK_OUTDIR") or os.path.join(ROOT, "cdk.out")
+    workers = context.get("parallelSynth:workers")
+    started = time.perf_counter()
+    # Every region is looked up once, here, the workers find it in the lookup cache
+    prefetch_lookups(load_environments(context.get("environments"), ROOT), context.get)
+    timings = synth_parallel(stack_specs(context), outdir,
+                             max_workers=int(workers) if workers else None)
+    print_timings(timings, time.perf_counter() - started)
+    return outdir
+
+
+if __name__ == "__main__":
+    context = app_context()
+    sources = [os.path.join(ROOT, "app.py"), COMMON_DIR] + [os.path.join(ROOT, project, project)
+                                                           for _, project, _ in STACKS]
+    if isinstance(context.get("environments"), str):
+        sources.append(os.path.join(ROOT, context["environments"]))
+    SynthCache(ROOT, sources=sources, context=context,
+               lookups=lambda: lookups(context)).run(lambda: build(context))
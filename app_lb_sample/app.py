@@ -1,17 +1,10 @@
 #!/usr/bin/env python3
 
-from aws_cdk import core as cdk
-
-# For consistency with TypeScript code, `cdk` is the preferred import name for
-# the CDK's core module.  The following line also imports it as `core` for use
-# with examples from the CDK Developer's Guide, which are in the process of
-# being updated to use `cdk`.  You may delete this import if you don't need it.
-from aws_cdk import core
-
-from app_lb_sample.app_lb_sample_stack import AppLbSampleStack
-
-
-app = core.App()
-AppLbSampleStack(app, "AppLbSampleStack")
-
-app.synth()
+from cdk_common.entrypoint import synth_app
+from cdk_common.parallel_synth import StackSpec
+
+# Reuses the previous cloud assembly when none of the inputs changed,
+# CDK_PROFILE=<dir> profiles the synth instead
+synth_app(__file__, "app_lb_sample",
+          [StackSpec("AppLbSampleStack", "app_lb_sample.app_lb_sample_stack:AppLbSampleStack"),
+           StackSpec("AppLbSampleAmi", "app_lb_sample.ami_stack:AppLbSampleAmiStack")])
@@ -0,0 +1,19 @@
+from aws_cdk import core
+from cdk_common.ami_pipeline import AmiPipelineStack
+from cdk_common.user_data import UserDataPart, package_file
+
+
+IMAGE_NAME = "app-lb-sample-web"
+CONFIGURE_SCRIPT = package_file(__file__, "configure.sh")
+
+
+class AppLbSampleAmiStack(AmiPipelineStack):
+    """Bakes configure.sh into the AMI of the instances (-c ami_pipeline:schedule=... to rebuild
+    it on base image updates)."""
+
+    def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id,
+                         image_name=IMAGE_NAME,
+                         script=UserDataPart.from_file(CONFIGURE_SCRIPT).content,
+                         schedule=scope.node.try_get_context("ami_pipeline:schedule"),
+                         **kwargs)
@@ -1,23 +1,68 @@
+from typing import Dict, Optional
+
 from aws_cdk import core
-from aws_cdk import aws_ec2 as ec2
-from aws_cdk import aws_elasticloadbalancingv2 as elbv2
-from aws_cdk.aws_elasticloadbalancingv2 import CfnListener as Listener
-import requests
+from cdk_common.ami_pipeline import image_and_user_data
+from cdk_common.cidr import SubnetAllocator
+from cdk_common.instance_profile import InstanceProfile
+from cdk_common.lookups import Lookups
+from cdk_common.network import NetworkTopology, add_nat_gateway, add_vpc_endpoints, az_suffix
+from cdk_common.sg_rules import add_ingress_rules, rules_from_ports
+from cdk_common.user_data import UserDataPart, annotate, render
+
+from app_lb_sample.ami_stack import CONFIGURE_SCRIPT, IMAGE_NAME
+from app_lb_sample.cdn import DEFAULT_IDLE_TIMEOUT, CdnOptions, add_cdn
+from app_lb_sample.lb_profile import LoadBalancerProfile
+from app_lb_sample.web_fleet import WebFleetOptions, add_web_fleet
 
 
 class AppLbSampleStack(core.Stack):
 
-    def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
+    def __init__(self, scope: core.Construct, construct_id: str,
+                 web_fleet: Optional[WebFleetOptions] = None,
+                 lb_profile: Optional[LoadBalancerProfile] = None,
+                 instance_profile: Optional[InstanceProfile] = None,
+                 cdn: Optional[CdnOptions] = None, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
+        # Service modules are loaded when the stack is built, not when the app imports it
+        from aws_cdk import aws_ec2 as ec2
+        from aws_cdk import aws_elasticloadbalancingv2 as elbv2
+        from aws_cdk.aws_elasticloadbalancingv2 import CfnListener as Listener
+
+        # An Auto Scaling group replaces WebServer01/02 when set (or -c web_fleet=...)
+        if web_fleet is None:
+            web_fleet = WebFleetOptions.from_context(self.node.try_get_context("web_fleet"))
+        # ALB/target group tuning, AWS defaults when not set (or -c lb_profile=low-latency)
+        if lb_profile is None:
+            lb_profile = LoadBalancerProfile.from_context(self.node.try_get_context("lb_profile"))
+        # Type, placement, storage and monitoring of the web servers (-c instance_profile=compute)
+        if instance_profile is None:
+            instance_profile = InstanceProfile.from_context(self.node.try_get_context("instance_profile"))
+        # CloudFront distribution in front of the ALB when set (-c cdn=true)
+        if cdn is None:
+            cdn = CdnOptions.from_context(self.node.try_get_context("cdn"))
+        # Single NAT gateway by default, -c network_topology=per-az for one per AZ + VPC endpoints
+        topology = NetworkTopology.from_context(self.node.try_get_context("network_topology"))
 
+        lookups = Lookups.for_scope(self)
+        azs = lookups.availability_zones()
+        ami_id = lookups.ami_id()
+
+        # Set per environment by the root app (-c vpc_cidr=10.1.0.0/20)
+        vpc_cidr = self.node.try_get_context("vpc_cidr") or "192.168.0.0/20"
         vpc = ec2.Vpc(self, id="MyVPC",
                       nat_gateways=0,
-                      cidr="192.168.0.0/20",
+                      cidr=vpc_cidr,
                       max_azs=3,
                       subnet_configuration=[])
+
+        # Subnet CIDRs are carved out of the VPC CIDR, checked for overlaps
+        subnets = SubnetAllocator(vpc_cidr)
+        pub_alloc = subnets.allocate_one("public", prefix=24, az=azs[2 % len(azs)])
+        priv_allocs = subnets.allocate("private", [azs[0], azs[1 % len(azs)]], prefix=24)
+
         pub_subnet = ec2.PublicSubnet(self, id="PublicSubnet",
-                                      availability_zone="eu-central-1c",
-                                      cidr_block="192.168.0.0/24",
+                                      availability_zone=pub_alloc.az,
+                                      cidr_block=pub_alloc.cidr_block,
                                       vpc_id=vpc.vpc_id,
                                       map_public_ip_on_launch=True)
 
@@ -34,39 +79,89 @@ class AppLbSampleStack(core.Stack):
                              destination_cidr_block="0.0.0.0/0",
                              enables_internet_connectivity=True)
 
-        # Elastic IP
-        eip_01 = ec2.CfnEIP(self, id="EIP01")
+        nat_gateways = {}  # type: Dict[str, ec2.CfnNatGateway]
 
-        # NAT gateway
-        ngw = ec2.CfnNatGateway(self, id="NAT_GW",
-                                allocation_id=eip_01.attr_allocation_id,
-                                subnet_id=pub_subnet.subnet_id,
-                                tags=[core.CfnTag(key="Name", value="NAT_GW")])
+        def nat_gateway_for(az: str) -> ec2.CfnNatGateway:
+            # Single NAT gateway in PublicSubnet by default.  Per AZ topology: a NAT gateway
+            # (and a small public subnet for it) in every AZ with private subnets, so their
+            # traffic never crosses AZs; the one of PublicSubnet's AZ is the default one.
+            # Either way a NAT gateway is only created for a route, an unused one is billed
+            if not topology.nat_per_az:
+                az = pub_alloc.az
+            if az == pub_alloc.az and az not in nat_gateways:
+                nat_gateways[az] = add_nat_gateway(self, pub_subnet.subnet_id)
+            if az not in nat_gateways:
+                suffix = az_suffix(az)
+                nat_alloc = subnets.allocate_one(f"public-{suffix}", prefix=28, az=az)
+                nat_subnet = ec2.PublicSubnet(self, id=f"PublicSubnet_{suffix}",
+                                              availability_zone=az,
+                                              cidr_block=nat_alloc.cidr_block,
+                                              vpc_id=vpc.vpc_id,
+                                              map_public_ip_on_launch=True)
+                nat_subnet.add_route(id=f"default_route-pub_{suffix}",
+                                     router_id=igw.ref,
+                                     router_type=ec2.RouterType('GATEWAY'),
+                                     destination_cidr_block="0.0.0.0/0",
+                                     enables_internet_connectivity=True)
+                nat_gateways[az] = add_nat_gateway(self, nat_subnet.subnet_id,
+                                                   eip_id=f"EIP_{suffix}",
+                                                   nat_id=f"NAT_GW_{suffix}")
+            return nat_gateways[az]
 
         subnet01 = ec2.Subnet(self, id="Subnet01",
-                              availability_zone="eu-central-1a",
-                              cidr_block="192.168.1.0/24",
+                              availability_zone=priv_allocs[0].az,
+                              cidr_block=priv_allocs[0].cidr_block,
                               vpc_id=vpc.vpc_id,
                               map_public_ip_on_launch=False)
 
         subnet02 = ec2.Subnet(self, id="Subnet02",
-                              availability_zone="eu-central-1b",
-                              cidr_block="192.168.2.0/24",
+                              availability_zone=priv_allocs[1].az,
+                              cidr_block=priv_allocs[1].cidr_block,
                               vpc_id=vpc.vpc_id,
                               map_public_ip_on_launch=False)
 
         subnet01.add_route(id="default_route-sub01",
-                           router_id=ngw.ref,
+                           router_id=nat_gateway_for(priv_allocs[0].az).ref,
                            router_type=ec2.RouterType('NAT_GATEWAY'),
                            destination_cidr_block="0.0.0.0/0",
                            enables_internet_connectivity=True)
 
         subnet02.add_route(id="default_route-sub02",
-                           router_id=ngw.ref,
+                           router_id=nat_gateway_for(priv_allocs[1].az).ref,
                            router_type=ec2.RouterType('NAT_GATEWAY'),
                            destination_cidr_block="0.0.0.0/0",
                            enables_internet_connectivity=True)
 
+        # Extra private subnets for the web fleet, in the AZs after subnet01/subnet02
+        fleet_subnets = [subnet01, subnet02]
+        if web_fleet and web_fleet.additional_azs:
+            for index, alloc in enumerate(subnets.allocate("private", azs[2:2 + web_fleet.additional_azs],
+                                                           prefix=24), start=3):
+                fleet_subnet = ec2.Subnet(self, id=f"Subnet{index:02}",
+                                          availability_zone=alloc.az,
+                                          cidr_block=alloc.cidr_block,
+                                          vpc_id=vpc.vpc_id,
+                                          map_public_ip_on_launch=False)
+                fleet_subnet.add_route(id=f"default_route-sub{index:02}",
+                                       router_id=nat_gateway_for(alloc.az).ref,
+                                       router_type=ec2.RouterType('NAT_GATEWAY'),
+                                       destination_cidr_block="0.0.0.0/0",
+                                       enables_internet_connectivity=True)
+                fleet_subnets.append(fleet_subnet)
+
+        core.Annotations.of(vpc).add_info(subnets.summary())
+
+        # S3/DynamoDB (and optional interface) endpoints, so bulk traffic skips NAT
+        private_subnets_by_az = {}
+        for private_subnet in fleet_subnets:
+            private_subnets_by_az.setdefault(private_subnet.availability_zone, private_subnet.subnet_id)
+        add_vpc_endpoints(self, topology,
+                          vpc_id=vpc.vpc_id,
+                          vpc_cidr=vpc_cidr,
+                          route_table_ids=[private_subnet.route_table.route_table_id
+                                           for private_subnet in fleet_subnets],
+                          subnets_by_az=private_subnets_by_az)
+
         sg_lb = ec2.CfnSecurityGroup(self, id="SG_ALB",
                                      group_description="SG for the APP LB",
                                      group_name="SG_ALB",
@@ -79,67 +174,78 @@ class AppLbSampleStack(core.Stack):
                                        vpc_id=vpc.vpc_id,
                                        tags=[core.CfnTag(key="Name", value="SG_Instances")])
 
-        # my_home_ip = requests.get("https://api.ipify.org").text
-        my_home_ip = "94.112.113.195"
+        my_home_ip = lookups.home_ip()
         ports_pub = {'tcp': [22, 80],
                      'icmp': [-1]
                      }
 
-        for protocol, ports_list in ports_pub.items():
-            for port in ports_list:
-                ec2.CfnSecurityGroupIngress(self, id=f"sg_alb_in_{protocol}_{port}",
-                                            group_id=sg_lb.attr_group_id,
-                                            ip_protocol=protocol,
-                                            cidr_ip=f"{my_home_ip}/32",
-                                            to_port=port,
-                                            from_port=port,
-                                            description=f"{protocol.upper()} {port} from home IP")
-
-                ec2.CfnSecurityGroupIngress(self, id=f"sg_ec2i_in_{protocol}_{port}",
-                                            group_id=sg_ec2i.attr_group_id,
-                                            ip_protocol=protocol,
-                                            to_port=port,
-                                            from_port=port,
-                                            source_security_group_id=sg_lb.ref,
-                                            description=f"{protocol.upper()} {port} from the ALB SG")
-
-        with open("/home/dragos/Documents/AWS_CDK/app_lb_sample/app_lb_sample/configure.sh", 'r') as config_file:
-            ud = core.Fn.base64(config_file.read())
+        add_ingress_rules(self, "sg_alb_in", sg_lb,
+                          rules_from_ports(ports_pub,
+                                           cidr_ip=f"{my_home_ip}/32",
+                                           description="from home IP"))
+
+        add_ingress_rules(self, "sg_ec2i_in", sg_ec2i,
+                          rules_from_ports(ports_pub,
+                                           source_security_group_id=sg_lb.ref,
+                                           description="from the ALB SG"))
+
+        script = UserDataPart.from_file(CONFIGURE_SCRIPT).content
+        # Web servers boot from the AMI baked by AppLbSampleAmi when there is one (only
+        # the boot part of configure.sh left as user data), else run all of configure.sh
+        web_ami_id, web_user_data = image_and_user_data(lookups, IMAGE_NAME, script,
+                                                        environment=self.node.try_get_context("environment"))
+
+        def user_data(server_name: str):
+            """User data of one web server (gzipped when smaller), its size annotated on the stack."""
+            if not web_user_data:
+                return None
+            rendered = render([UserDataPart.from_text(web_user_data, filename="configure.sh")],
+                              variables={"server_name": server_name})
+            annotate(self, rendered)
+            return rendered.cfn_value()
 
         bastion_host = ec2.CfnInstance(self, id="bastion",
-                                       image_id="ami-0de9f803fcac87f46",
+                                       image_id=ami_id,
                                        instance_type="t2.micro",
                                        subnet_id=pub_subnet.subnet_id,
                                        key_name="proton_mail_kp",
                                        security_group_ids=[sg_lb.ref],
                                        tags=[core.CfnTag(key="Name", value="bastion")])
 
-        instance01 = ec2.CfnInstance(self, id="WebServer01",
-                                     image_id="ami-0de9f803fcac87f46",
-                                     instance_type="t2.micro",
-                                     subnet_id=subnet01.subnet_id,
-                                     key_name="proton_mail_kp",
-                                     security_group_ids=[sg_ec2i.ref],
-                                     user_data=ud,
-                                     tags=[core.CfnTag(key="Name", value="WebServer01")])
-
-        instance02 = ec2.CfnInstance(self, id="WebServer02",
-                                     image_id="ami-0de9f803fcac87f46",
-                                     instance_type="t2.micro",
-                                     subnet_id=subnet02.subnet_id,
-                                     key_name="proton_mail_kp",
-                                     security_group_ids=[sg_ec2i.ref],
-                                     user_data=ud,
-                                     tags=[core.CfnTag(key="Name", value="WebServer02")])
+        targets = None
+        if not web_fleet:
+            instance01 = ec2.CfnInstance(self, id="WebServer01",
+                                         image_id=web_ami_id,
+                                         instance_type=instance_profile.instance_type,
+                                         subnet_id=subnet01.subnet_id,
+                                         key_name="proton_mail_kp",
+                                         security_group_ids=[sg_ec2i.ref],
+                                         user_data=user_data("WebServer01"),
+                                         tags=[core.CfnTag(key="Name", value="WebServer01")])
+
+            instance02 = ec2.CfnInstance(self, id="WebServer02",
+                                         image_id=web_ami_id,
+                                         instance_type=instance_profile.instance_type,
+                                         subnet_id=subnet02.subnet_id,
+                                         key_name="proton_mail_kp",
+                                         security_group_ids=[sg_ec2i.ref],
+                                         user_data=user_data("WebServer02"),
+                                         tags=[core.CfnTag(key="Name", value="WebServer02")])
+
+            # WebServer01/02 are in two AZs, no cluster placement group
+            web_profile = instance_profile.for_azs([subnet01.availability_zone, subnet02.availability_zone], self)
+            web_profile.apply(instance01)
+            web_profile.apply(instance02)
+
+            target01 = elbv2.CfnTargetGroup.TargetDescriptionProperty(id=instance01.ref)
+            target02 = elbv2.CfnTargetGroup.TargetDescriptionProperty(id=instance02.ref)
+            targets = [target01, target02]
 
         # health_check = elbv2.HealthCheck(enabled=True,
         #                                  healthy_http_codes="200",
         #                                  path="/index.html",
         #                                  protocol=elbv2.Protocol("HTTP"))
 
-        target01 = elbv2.CfnTargetGroup.TargetDescriptionProperty(id=instance01.ref)
-        target02 = elbv2.CfnTargetGroup.TargetDescriptionProperty(id=instance02.ref)
-
         tg = elbv2.CfnTargetGroup(self, id="TG-WEB-HTTP",
                                   name="TG-WEB-HTTP",
                                   health_check_enabled=True,
@@ -149,8 +255,10 @@ class AppLbSampleStack(core.Stack):
                                   port=80,
                                   protocol="HTTP", # CASE SENSITIVE
                                   target_type="instance", # CASE SENSITIVE
-                                  targets=[target01, target02],
-                                  vpc_id=vpc.vpc_id)
+                                  targets=targets,
+                                  target_group_attributes=lb_profile.target_group_attributes() if lb_profile else None,
+                                  vpc_id=vpc.vpc_id,
+                                  **(lb_profile.health_check() if lb_profile else {}))
 
         alb = elbv2.CfnLoadBalancer(self, id="MyALB-HTTP",
                                     ip_address_type="ipv4",
@@ -158,6 +266,7 @@ class AppLbSampleStack(core.Stack):
                                     scheme="internet-facing",
                                     security_groups=[sg_lb.ref],
                                     type="application",
+                                    load_balancer_attributes=lb_profile.load_balancer_attributes() if lb_profile else None,
                                     subnets=[subnet01.subnet_id, subnet02.subnet_id])
 
         def_act = Listener.ActionProperty(
@@ -177,3 +286,21 @@ class AppLbSampleStack(core.Stack):
                                      protocol="HTTP",
                                      default_actions=[def_act])
 
+        if web_fleet:
+            add_web_fleet(self, web_fleet,
+                          subnets=fleet_subnets,
+                          security_group=sg_ec2i,
+                          image_id=web_ami_id,
+                          key_name="proton_mail_kp",
+                          user_data=user_data("web-fleet"),
+                          alb=alb,
+                          target_group=tg,
+                          listener=listener,
+                          profile=instance_profile)
+
+        if cdn:
+            add_cdn(self, cdn,
+                    alb=alb,
+                    security_group=sg_lb,
+                    prefix_list_id=lookups.cloudfront_prefix_list(),
+                    idle_timeout=lb_profile.idle_timeout if lb_profile else DEFAULT_IDLE_TIMEOUT)
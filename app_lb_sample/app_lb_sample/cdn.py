@@ -0,0 +1,198 @@
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    from aws_cdk import core
+    from aws_cdk import aws_ec2 as ec2
+
+
+PRICE_CLASSES = ("PriceClass_100", "PriceClass_200", "PriceClass_All")
+ALB_ORIGIN_ID = "alb"
+STATIC_ORIGIN_ID = "static"
+# ALB idle timeout when there is no load balancer profile
+DEFAULT_IDLE_TIMEOUT = 60
+
+
+class CdnOptions(NamedTuple):
+    """CloudFront distribution in front of MyALB-HTTP.
+
+    Set from the ``cdn`` context value, e.g. ``cdk synth -c cdn=true`` or
+    ``cdk synth -c cdn='{"default_ttl": 60, "static_bucket": true}'``.
+    """
+    price_class: str = "PriceClass_100"
+    http_version: str = "http2"
+    # Seconds the pages served by the ALB stay in the edge caches (when the
+    # servers send no Cache-Control)
+    default_ttl: int = 300
+    min_ttl: int = 0
+    max_ttl: int = 86400
+    # Query strings are part of the cache key (and forwarded) when set
+    forward_query_strings: bool = False
+    # gzip/brotli at the edge
+    compress: bool = True
+    # Below the ALB idle timeout, or the ALB may close a connection CloudFront reuses (502)
+    origin_keepalive_timeout: int = 5
+    origin_read_timeout: int = 30
+    # Static assets served from an S3 bucket (through an origin access identity) instead of the fleet
+    static_bucket: bool = False
+    static_path_pattern: str = "/static/*"
+    static_default_ttl: int = 86400
+    static_max_ttl: int = 31536000
+    # Managed prefix list of the CloudFront origin-facing servers, looked up when not set
+    origin_prefix_list_id: Optional[str] = None
+
+    @classmethod
+    def from_context(cls, value: Any) -> Optional["CdnOptions"]:
+        if not value or value == "false":
+            return None
+        if value is True or value == "true":
+            return cls()
+        if isinstance(value, str):
+            import json
+            value = json.loads(value)
+        return cls(**value).validate()
+
+    def validate(self) -> "CdnOptions":
+        if self.price_class not in PRICE_CLASSES:
+            raise ValueError(f"cdn: price_class must be one of {PRICE_CLASSES}")
+        if not self.min_ttl <= self.default_ttl <= self.max_ttl:
+            raise ValueError("cdn: expected min_ttl <= default_ttl <= max_ttl")
+        if not self.min_ttl <= self.static_default_ttl <= self.static_max_ttl:
+            raise ValueError("cdn: expected min_ttl <= static_default_ttl <= static_max_ttl")
+        if not 1 <= self.origin_keepalive_timeout <= 60:
+            raise ValueError("cdn: origin_keepalive_timeout must be between 1 and 60 seconds")
+        if not 1 <= self.origin_read_timeout <= 60:
+            raise ValueError("cdn: origin_read_timeout must be between 1 and 60 seconds")
+        if not self.static_path_pattern.startswith("/"):
+            raise ValueError("cdn: static_path_pattern must start with '/'")
+        return self
+
+
+def _cache_policy(scope: "core.Construct", id: str, name: str, default_ttl: int, max_ttl: int,
+                  options: CdnOptions):
+    from aws_cdk import aws_cloudfront as cloudfront
+
+    CachePolicy = cloudfront.CfnCachePolicy
+    return CachePolicy(scope, id=id, cache_policy_config=CachePolicy.CachePolicyConfigProperty(
+        name=name,
+        default_ttl=default_ttl,
+        min_ttl=options.min_ttl,
+        max_ttl=max_ttl,
+        parameters_in_cache_key_and_forwarded_to_origin=CachePolicy.ParametersInCacheKeyAndForwardedToOriginProperty(
+            # One cached copy per encoding instead of compressing on every hit
+            enable_accept_encoding_gzip=options.compress,
+            enable_accept_encoding_brotli=options.compress,
+            cookies_config=CachePolicy.CookiesConfigProperty(cookie_behavior="none"),
+            headers_config=CachePolicy.HeadersConfigProperty(header_behavior="none"),
+            query_strings_config=CachePolicy.QueryStringsConfigProperty(
+                query_string_behavior="all" if options.forward_query_strings else "none"))))
+
+
+def add_cdn(scope: "core.Construct",
+            options: CdnOptions,
+            alb,
+            security_group: "ec2.CfnSecurityGroup",
+            prefix_list_id: Optional[str] = None,
+            idle_timeout: int = DEFAULT_IDLE_TIMEOUT) -> Dict[str, "core.CfnResource"]:
+    """Distribution with ``alb`` as its default origin and, with
+    ``static_bucket``, an S3 origin for ``static_path_pattern``.
+
+    ``prefix_list_id`` (the CloudFront origin-facing prefix list) is allowed
+    on port 80 of ``security_group``; without it the ALB only accepts what
+    its other rules allow and the origin fetches fail.
+    """
+    from aws_cdk import core
+    from aws_cdk import aws_cloudfront as cloudfront
+    from aws_cdk import aws_ec2 as ec2
+
+    if options.origin_keepalive_timeout >= idle_timeout:
+        raise ValueError(f"cdn: origin_keepalive_timeout must be lower than the ALB idle timeout ({idle_timeout}s)")
+
+    Distribution = cloudfront.CfnDistribution
+    stack_name = core.Stack.of(scope).stack_name
+    resources = {}  # type: Dict[str, core.CfnResource]
+
+    prefix_list_id = options.origin_prefix_list_id or prefix_list_id
+    if prefix_list_id:
+        resources["origin_ingress"] = ec2.CfnSecurityGroupIngress(
+            scope, id="sg_alb_in_cloudfront",
+            group_id=security_group.attr_group_id,
+            ip_protocol="tcp",
+            from_port=80,
+            to_port=80,
+            source_prefix_list_id=prefix_list_id,
+            description="TCP 80 from CloudFront")
+    else:
+        core.Annotations.of(security_group).add_warning(
+            "cdn: no CloudFront prefix list, the ALB won't accept the origin fetches; "
+            "pass -c cloudfront_prefix_list=pl-...")
+
+    resources["cache_policy"] = _cache_policy(scope, "CdnCachePolicy", f"{stack_name}-alb",
+                                              options.default_ttl, options.max_ttl, options)
+    origins = [Distribution.OriginProperty(
+        id=ALB_ORIGIN_ID,
+        domain_name=alb.attr_dns_name,
+        custom_origin_config=Distribution.CustomOriginConfigProperty(
+            origin_protocol_policy="http-only",  # Listener01 is HTTP
+            http_port=80,
+            origin_keepalive_timeout=options.origin_keepalive_timeout,
+            origin_read_timeout=options.origin_read_timeout))]
+    cache_behaviors = []
+
+    if options.static_bucket:
+        from aws_cdk import aws_s3 as s3
+
+        bucket = s3.CfnBucket(scope, id="StaticAssets",
+                              bucket_encryption=s3.CfnBucket.BucketEncryptionProperty(
+                                  server_side_encryption_configuration=[s3.CfnBucket.ServerSideEncryptionRuleProperty(
+                                      server_side_encryption_by_default=s3.CfnBucket.ServerSideEncryptionByDefaultProperty(
+                                          sse_algorithm="AES256"))]),
+                              public_access_block_configuration=s3.CfnBucket.PublicAccessBlockConfigurationProperty(
+                                  block_public_acls=True,
+                                  block_public_policy=True,
+                                  ignore_public_acls=True,
+                                  restrict_public_buckets=True))
+        identity = cloudfront.CfnCloudFrontOriginAccessIdentity(
+            scope, id="StaticAssetsOAI",
+            cloud_front_origin_access_identity_config=cloudfront.CfnCloudFrontOriginAccessIdentity
+            .CloudFrontOriginAccessIdentityConfigProperty(comment=f"{stack_name} static assets"))
+        bucket_policy = s3.CfnBucketPolicy(scope, id="StaticAssetsPolicy",
+                                           bucket=bucket.ref,
+                                           policy_document={
+                                               "Version": "2012-10-17",
+                                               "Statement": [{
+                                                   "Effect": "Allow",
+                                                   "Principal": {"CanonicalUser": identity.attr_s3_canonical_user_id},
+                                                   "Action": "s3:GetObject",
+                                                   "Resource": core.Fn.join("", [bucket.attr_arn, "/*"])}]})
+        resources.update(static_bucket=bucket, origin_access_identity=identity, bucket_policy=bucket_policy)
+        resources["static_cache_policy"] = _cache_policy(scope, "CdnStaticCachePolicy", f"{stack_name}-static",
+                                                         options.static_default_ttl, options.static_max_ttl, options)
+        origins.append(Distribution.OriginProperty(
+            id=STATIC_ORIGIN_ID,
+            domain_name=bucket.attr_regional_domain_name,
+            s3_origin_config=Distribution.S3OriginConfigProperty(
+                origin_access_identity=f"origin-access-identity/cloudfront/{identity.ref}")))
+        cache_behaviors.append(Distribution.CacheBehaviorProperty(
+            path_pattern=options.static_path_pattern,
+            target_origin_id=STATIC_ORIGIN_ID,
+            viewer_protocol_policy="redirect-to-https",
+            allowed_methods=["GET", "HEAD"],
+            cache_policy_id=resources["static_cache_policy"].ref,
+            compress=options.compress))
+        core.CfnOutput(scope, id="StaticAssetsBucket", value=bucket.ref)
+
+    resources["distribution"] = Distribution(scope, id="Cdn", distribution_config=Distribution.DistributionConfigProperty(
+        enabled=True,
+        comment=f"{stack_name} web",
+        price_class=options.price_class,
+        http_version=options.http_version,
+        origins=origins,
+        default_cache_behavior=Distribution.DefaultCacheBehaviorProperty(
+            target_origin_id=ALB_ORIGIN_ID,
+            viewer_protocol_policy="redirect-to-https",
+            allowed_methods=["GET", "HEAD"],
+            cache_policy_id=resources["cache_policy"].ref,
+            compress=options.compress),
+        cache_behaviors=cache_behaviors or None))
+    core.CfnOutput(scope, id="CdnDomainName", value=resources["distribution"].attr_domain_name)
+    return resources
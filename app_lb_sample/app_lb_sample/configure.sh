@@ -4,4 +4,5 @@ yum update -y
 yum install httpd -y
 service httpd start
 chkconfig httpd on
-echo "<html><h1>Welcome To My Webpage - $(hostname)</h1></html>" > /var/www/html/index.html
\ No newline at end of file
+# --- boot ---
+echo "<html><h1>Welcome To My Webpage - {{ server_name }} ($(hostname))</h1></html>" > /var/www/html/index.html
\ No newline at end of file
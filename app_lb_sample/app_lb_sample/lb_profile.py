@@ -0,0 +1,107 @@
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    from aws_cdk import aws_elasticloadbalancingv2 as elbv2
+
+
+ROUND_ROBIN = "round_robin"
+LEAST_OUTSTANDING_REQUESTS = "least_outstanding_requests"
+
+
+class LoadBalancerProfile(NamedTuple):
+    """Performance settings of MyALB-HTTP and TG-WEB-HTTP.
+
+    Picked with the ``lb_profile`` context value, either a preset name
+    (``-c lb_profile=low-latency``) or a JSON object with an optional
+    ``preset`` to start from and the fields to override
+    (``-c lb_profile='{"preset": "high-throughput", "slow_start": 90}'``).
+    The defaults are the ones AWS applies when nothing is set.
+    """
+    http2: bool = True
+    idle_timeout: int = 60
+    # None keeps the load balancer's setting (always on for ALBs)
+    cross_zone: Optional[bool] = None
+    routing_algorithm: str = ROUND_ROBIN
+    # Seconds, 0 disables it.  Can't be combined with least outstanding requests
+    slow_start: int = 0
+    deregistration_delay: int = 300
+    health_check_interval: int = 30
+    health_check_timeout: int = 5
+    healthy_threshold: int = 5
+    unhealthy_threshold: int = 2
+
+    @classmethod
+    def from_context(cls, value: Any) -> Optional["LoadBalancerProfile"]:
+        if not value:
+            return None
+        if isinstance(value, str) and value.lstrip().startswith("{"):
+            import json
+            value = json.loads(value)
+        if isinstance(value, str):
+            value = {"preset": value}
+        value = dict(value)
+        preset = value.pop("preset", "default")
+        if preset not in PRESETS:
+            raise ValueError(f"lb_profile: unknown preset '{preset}', expected one of {sorted(PRESETS)}")
+        return PRESETS[preset]._replace(**value).validate()
+
+    def validate(self) -> "LoadBalancerProfile":
+        if self.routing_algorithm not in (ROUND_ROBIN, LEAST_OUTSTANDING_REQUESTS):
+            raise ValueError(f"lb_profile: unknown routing_algorithm '{self.routing_algorithm}'")
+        if self.slow_start and self.routing_algorithm == LEAST_OUTSTANDING_REQUESTS:
+            raise ValueError("lb_profile: slow_start can't be used with least_outstanding_requests")
+        if self.slow_start and not 30 <= self.slow_start <= 900:
+            raise ValueError("lb_profile: slow_start must be 0 or between 30 and 900 seconds")
+        if not 1 <= self.idle_timeout <= 4000:
+            raise ValueError("lb_profile: idle_timeout must be between 1 and 4000 seconds")
+        if not 0 <= self.deregistration_delay <= 3600:
+            raise ValueError("lb_profile: deregistration_delay must be between 0 and 3600 seconds")
+        if self.health_check_timeout >= self.health_check_interval:
+            raise ValueError("lb_profile: health_check_timeout must be lower than health_check_interval")
+        return self
+
+    def load_balancer_attributes(self) -> List["elbv2.CfnLoadBalancer.LoadBalancerAttributeProperty"]:
+        from aws_cdk import aws_elasticloadbalancingv2 as elbv2
+
+        attributes = {"routing.http2.enabled": str(self.http2).lower(),
+                      "idle_timeout.timeout_seconds": str(self.idle_timeout)}
+        return [elbv2.CfnLoadBalancer.LoadBalancerAttributeProperty(key=key, value=value)
+                for key, value in attributes.items()]
+
+    def target_group_attributes(self) -> List["elbv2.CfnTargetGroup.TargetGroupAttributeProperty"]:
+        from aws_cdk import aws_elasticloadbalancingv2 as elbv2
+
+        attributes = {"deregistration_delay.timeout_seconds": str(self.deregistration_delay),
+                      "load_balancing.algorithm.type": self.routing_algorithm,
+                      "slow_start.duration_seconds": str(self.slow_start)}
+        if self.cross_zone is not None:
+            attributes["load_balancing.cross_zone.enabled"] = str(self.cross_zone).lower()
+        return [elbv2.CfnTargetGroup.TargetGroupAttributeProperty(key=key, value=value)
+                for key, value in attributes.items()]
+
+    def health_check(self) -> Dict[str, int]:
+        """Keyword arguments for ``CfnTargetGroup``."""
+        return {"health_check_interval_seconds": self.health_check_interval,
+                "health_check_timeout_seconds": self.health_check_timeout,
+                "healthy_threshold_count": self.healthy_threshold,
+                "unhealthy_threshold_count": self.unhealthy_threshold}
+
+
+PRESETS = {
+    "default": LoadBalancerProfile(),
+    # Fast detection and recovery of targets, short drains, requests go to the least busy target
+    "low-latency": LoadBalancerProfile(idle_timeout=30,
+                                       cross_zone=True,
+                                       routing_algorithm=LEAST_OUTSTANDING_REQUESTS,
+                                       deregistration_delay=30,
+                                       health_check_interval=10,
+                                       healthy_threshold=2),
+    # Long-lived connections, new targets warmed up gradually
+    "high-throughput": LoadBalancerProfile(idle_timeout=120,
+                                           cross_zone=True,
+                                           slow_start=60,
+                                           deregistration_delay=60,
+                                           health_check_interval=15,
+                                           healthy_threshold=3,
+                                           unhealthy_threshold=3),
+}
@@ -0,0 +1,130 @@
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple, Optional, Sequence
+
+if TYPE_CHECKING:
+    from aws_cdk import core
+    from aws_cdk import aws_ec2 as ec2
+
+    from cdk_common.instance_profile import InstanceProfile
+
+
+class WebFleetOptions(NamedTuple):
+    """Auto Scaling group serving TG-WEB-HTTP instead of WebServer01/02.
+
+    Set from the ``web_fleet`` context value, e.g.
+    ``cdk synth -c web_fleet='{"min_size": 2, "max_size": 8}'``.
+    """
+    min_size: int = 2
+    max_size: int = 6
+    desired_capacity: Optional[int] = None
+    # Private subnets in AZs beyond the ones of subnet01/subnet02
+    additional_azs: int = 0
+    # Target tracking: ALB requests per target and average CPU (%)
+    requests_per_target: Optional[int] = 1000
+    cpu_utilization: Optional[float] = 60.0
+    # Pre-initialized instances kept aside for faster scale-out (0 disables the warm pool)
+    warm_pool_min_size: int = 1
+    warm_pool_max_prepared: Optional[int] = None
+    warm_pool_state: str = "Stopped"
+    # None: the instance type of the instance profile
+    instance_type: Optional[str] = None
+    health_check_grace_period: int = 120
+
+    @classmethod
+    def from_context(cls, value: Any) -> Optional["WebFleetOptions"]:
+        if not value:
+            return None
+        if value is True or value == "true":
+            return cls()
+        if isinstance(value, str):
+            import json
+            value = json.loads(value)
+        options = cls(**value)
+        if not 0 <= options.min_size <= options.max_size:
+            raise ValueError(f"web_fleet: min_size must be between 0 and max_size, got {options}")
+        return options
+
+
+def add_web_fleet(scope: "core.Construct",
+                  options: WebFleetOptions,
+                  subnets: Sequence["ec2.ISubnet"],
+                  security_group: "ec2.CfnSecurityGroup",
+                  image_id: str,
+                  key_name: str,
+                  user_data: str,
+                  alb,
+                  target_group,
+                  listener,
+                  profile: Optional["InstanceProfile"] = None) -> Dict[str, "core.CfnResource"]:
+    from aws_cdk import core
+    from aws_cdk import aws_autoscaling as autoscaling
+    from aws_cdk import aws_ec2 as ec2
+
+    from cdk_common.instance_profile import InstanceProfile
+
+    profile = (profile or InstanceProfile()).for_azs([subnet.availability_zone for subnet in subnets], scope)
+    data = profile.launch_template_data(scope)
+    if options.instance_type:
+        data["instance_type"] = options.instance_type
+    launch_template = ec2.CfnLaunchTemplate(scope, id="WebFleetLT",
+                                            launch_template_name=f"{core.Stack.of(scope).stack_name}-web",
+                                            launch_template_data=ec2.CfnLaunchTemplate.LaunchTemplateDataProperty(
+                                                image_id=image_id,
+                                                key_name=key_name,
+                                                security_group_ids=[security_group.ref],
+                                                user_data=user_data,
+                                                **data))
+    profile.add_overrides(launch_template)
+
+    asg = autoscaling.CfnAutoScalingGroup(scope, id="WebFleet",
+                                          min_size=str(options.min_size),
+                                          max_size=str(options.max_size),
+                                          desired_capacity=(None if options.desired_capacity is None
+                                                            else str(options.desired_capacity)),
+                                          launch_template=autoscaling.CfnAutoScalingGroup.LaunchTemplateSpecificationProperty(
+                                              launch_template_id=launch_template.ref,
+                                              version=launch_template.attr_latest_version_number),
+                                          vpc_zone_identifier=[subnet.subnet_id for subnet in subnets],
+                                          target_group_arns=[target_group.ref],
+                                          health_check_type="ELB",
+                                          health_check_grace_period=options.health_check_grace_period,
+                                          tags=[autoscaling.CfnAutoScalingGroup.TagPropertyProperty(
+                                              key="Name", value="WebFleet", propagate_at_launch=True)])
+    resources = {"launch_template": launch_template, "asg": asg}
+
+    if options.requests_per_target:
+        # The resource label only exists once the target group is attached to the ALB
+        request_policy = autoscaling.CfnScalingPolicy(
+            scope, id="WebFleetRequestCountPolicy",
+            auto_scaling_group_name=asg.ref,
+            policy_type="TargetTrackingScaling",
+            target_tracking_configuration=autoscaling.CfnScalingPolicy.TargetTrackingConfigurationProperty(
+                predefined_metric_specification=autoscaling.CfnScalingPolicy.PredefinedMetricSpecificationProperty(
+                    predefined_metric_type="ALBRequestCountPerTarget",
+                    resource_label=core.Fn.join("/", [alb.attr_load_balancer_full_name,
+                                                      target_group.attr_target_group_full_name])),
+                target_value=options.requests_per_target))
+        request_policy.add_depends_on(listener)
+        resources["request_policy"] = request_policy
+
+    if options.cpu_utilization:
+        resources["cpu_policy"] = autoscaling.CfnScalingPolicy(
+            scope, id="WebFleetCpuPolicy",
+            auto_scaling_group_name=asg.ref,
+            policy_type="TargetTrackingScaling",
+            target_tracking_configuration=autoscaling.CfnScalingPolicy.TargetTrackingConfigurationProperty(
+                predefined_metric_specification=autoscaling.CfnScalingPolicy.PredefinedMetricSpecificationProperty(
+                    predefined_metric_type="ASGAverageCPUUtilization"),
+                target_value=options.cpu_utilization))
+
+    if options.warm_pool_min_size:
+        # Plain CfnResource: AWS::AutoScaling::WarmPool is newer than the pinned aws-cdk version
+        properties = {"AutoScalingGroupName": asg.ref,
+                      "MinSize": options.warm_pool_min_size,
+                      "PoolState": options.warm_pool_state}
+        if options.warm_pool_max_prepared is not None:
+            properties["MaxGroupPreparedCapacity"] = options.warm_pool_max_prepared
+        resources["warm_pool"] = core.CfnResource(scope, id="WebFleetWarmPool",
+                                                  type="AWS::AutoScaling::WarmPool",
+                                                  properties=properties)
+
+    return resources
@@ -20,6 +20,13 @@ setuptools.setup(
 
     install_requires=[
         "aws-cdk.core==1.93.0",
+        "aws-cdk.aws-cloudwatch==1.93.0",
+        "aws-cdk.aws-autoscaling==1.93.0",
+        "aws-cdk.aws-cloudfront==1.93.0",
+        "aws-cdk.aws-iam==1.93.0",
+        "aws-cdk.aws-imagebuilder==1.93.0",
+        "aws-cdk.aws-s3==1.93.0",
+        "aws-cdk.aws-ssm==1.93.0",
     ],
 
     python_requires=">=3.6",
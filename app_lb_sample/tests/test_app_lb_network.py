@@ -0,0 +1,25 @@
+import pytest
+
+pytest.importorskip("aws_cdk")
+
+from cdk_common.testing import check_nat_per_az, nat_gateway_azs, subnet_routes, synth_template
+
+from app_lb_sample.app_lb_sample_stack import AppLbSampleStack
+
+
+def test_single_nat_gateway_by_default():
+    template = synth_template(AppLbSampleStack)
+    nats = nat_gateway_azs(template)
+    assert len(nats) == 1
+    assert {route["nat"] for route in subnet_routes(template).values() if route["nat"]} == set(nats)
+
+
+def test_per_az_topology():
+    check_nat_per_az(synth_template(AppLbSampleStack, context={"network_topology": "per-az"}))
+
+
+def test_per_az_topology_with_fleet_subnets():
+    template = synth_template(AppLbSampleStack, context={"network_topology": "per-az",
+                                                         "web_fleet": {"additional_azs": 1}})
+    check_nat_per_az(template)
+    assert len(nat_gateway_azs(template)) == 3
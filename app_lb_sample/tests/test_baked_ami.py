@@ -0,0 +1,98 @@
+import base64
+import gzip
+
+import pytest
+
+pytest.importorskip("aws_cdk")
+
+from cdk_common import testing
+from cdk_common.ami_pipeline import BOOT_MARKER
+from cdk_common.lookups import BAKED_AMI_SSM_PREFIX, Lookups
+from cdk_common.testing import STUB_CONTEXT, resources_of_type, synth_template
+
+from app_lb_sample.ami_stack import CONFIGURE_SCRIPT, IMAGE_NAME, AppLbSampleAmiStack
+from app_lb_sample.app_lb_sample_stack import AppLbSampleStack
+
+
+BAKED_AMI_ID = "ami-0123456789abcdef0"
+PROD_AMI_ID = "ami-0aaaaaaaaaaaaaaaa"
+
+
+class FakeSsm:
+    """``get_parameters_by_path`` of the AMI pipeline's parameters."""
+
+    def get_paginator(self, operation):
+        assert operation == "get_parameters_by_path"
+        return self
+
+    def paginate(self, Path):
+        assert Path == BAKED_AMI_SSM_PREFIX
+        return [{"Parameters": [{"Name": f"{BAKED_AMI_SSM_PREFIX}{IMAGE_NAME}", "Value": BAKED_AMI_ID}]},
+                {"Parameters": [{"Name": f"{BAKED_AMI_SSM_PREFIX}{IMAGE_NAME}-prod", "Value": PROD_AMI_ID}]},
+                {"Parameters": [{"Name": f"{BAKED_AMI_SSM_PREFIX}other-image", "Value": "ami-0fedcba9876543210"}]}]
+
+
+def _fake_client(lookups, service, started=None):
+    return FakeSsm() if service == "ssm" else None
+
+
+def _web_servers(template):
+    instances = resources_of_type(template, "AWS::EC2::Instance")
+    return [instances[name]["Properties"] for name in ("WebServer01", "WebServer02")]
+
+
+def _user_data(properties):
+    payload = base64.b64decode(properties["UserData"])
+    if payload[:2] == b"\x1f\x8b":
+        payload = gzip.decompress(payload)
+    return payload.decode()
+
+
+def _script():
+    with open(CONFIGURE_SCRIPT, 'r') as script_file:
+        return script_file.read()
+
+
+def test_stock_ami_runs_the_whole_script():
+    template = synth_template(AppLbSampleStack)
+    for server, properties in zip(("WebServer01", "WebServer02"), _web_servers(template)):
+        assert properties["ImageId"] == STUB_CONTEXT["ami_id"]
+        user_data = _user_data(properties)
+        assert user_data == _script().replace("{{ server_name }}", server)
+        assert "yum install httpd" in user_data
+
+
+def test_baked_ami_runs_the_boot_part(monkeypatch):
+    # The baked AMIs come from SSM (/cdk/ami/<image name>), not from the context
+    monkeypatch.delitem(testing.STUB_CONTEXT, "baked_amis")
+    monkeypatch.setattr(Lookups, "_boto3_client", _fake_client)
+    template = synth_template(AppLbSampleStack, context={"lookups:offline": False})
+    boot = _script().split(BOOT_MARKER, 1)[1].lstrip("\n")
+    for server, properties in zip(("WebServer01", "WebServer02"), _web_servers(template)):
+        assert properties["ImageId"] == BAKED_AMI_ID
+        user_data = _user_data(properties)
+        assert user_data == "#!/bin/bash\n" + boot.replace("{{ server_name }}", server)
+        assert "yum" not in user_data
+    # The bastion keeps the stock AMI
+    assert resources_of_type(template, "AWS::EC2::Instance")["bastion"]["Properties"]["ImageId"] \
+        == STUB_CONTEXT["ami_id"]
+
+
+def test_environment_reads_its_own_image(monkeypatch):
+    monkeypatch.delitem(testing.STUB_CONTEXT, "baked_amis")
+    monkeypatch.setattr(Lookups, "_boto3_client", _fake_client)
+    template = synth_template(AppLbSampleStack, context={"lookups:offline": False, "environment": "prod"})
+    assert {properties["ImageId"] for properties in _web_servers(template)} == {PROD_AMI_ID}
+
+
+def test_environment_names_the_pipeline():
+    template = synth_template(AppLbSampleAmiStack, context={"environment": "prod",
+                                                            "ami_pipeline:schedule": "cron(0 4 ? * sun *)"})
+    name = f"{IMAGE_NAME}-prod"
+    names = {resource["Type"]: resource["Properties"]["Name"] for resource in template["Resources"].values()
+             if "Name" in resource["Properties"]}
+    assert names == {"AWS::ImageBuilder::Component": f"{name}-configure",
+                     "AWS::ImageBuilder::ImageRecipe": name,
+                     "AWS::ImageBuilder::InfrastructureConfiguration": name,
+                     "AWS::ImageBuilder::ImagePipeline": name,
+                     "AWS::SSM::Parameter": f"{BAKED_AMI_SSM_PREFIX}{name}"}
@@ -0,0 +1,86 @@
+import pytest
+
+from app_lb_sample.cdn import ALB_ORIGIN_ID, STATIC_ORIGIN_ID, CdnOptions, add_cdn
+
+
+PREFIX_LIST_ID = "pl-a3a144ca"
+
+
+def _synth(cdn, **context):
+    pytest.importorskip("aws_cdk")
+    from cdk_common.testing import synth_template
+
+    from app_lb_sample.app_lb_sample_stack import AppLbSampleStack
+
+    return synth_template(AppLbSampleStack, context=dict({"cloudfront_prefix_list": PREFIX_LIST_ID}, **context),
+                          cdn=cdn)
+
+
+def _config(template):
+    from cdk_common.testing import resources_of_type
+
+    (distribution,) = resources_of_type(template, "AWS::CloudFront::Distribution").values()
+    return distribution["Properties"]["DistributionConfig"]
+
+
+def _cache_policy(template, logical_id):
+    return template["Resources"][logical_id]["Properties"]["CachePolicyConfig"]
+
+
+def test_default_behavior_targets_the_alb():
+    template = _synth(CdnOptions(default_ttl=120, max_ttl=3600))
+    config = _config(template)
+    (origin,) = config["Origins"]
+    assert origin["Id"] == ALB_ORIGIN_ID
+    assert origin["CustomOriginConfig"]["OriginProtocolPolicy"] == "http-only"
+    behavior = config["DefaultCacheBehavior"]
+    assert behavior["TargetOriginId"] == ALB_ORIGIN_ID
+    assert behavior["Compress"] is True
+    assert behavior["CachePolicyId"] == {"Ref": "CdnCachePolicy"}
+    policy = _cache_policy(template, "CdnCachePolicy")
+    assert (policy["MinTTL"], policy["DefaultTTL"], policy["MaxTTL"]) == (0, 120, 3600)
+    parameters = policy["ParametersInCacheKeyAndForwardedToOrigin"]
+    assert parameters["EnableAcceptEncodingGzip"] and parameters["EnableAcceptEncodingBrotli"]
+    assert "CacheBehaviors" not in config
+
+
+def test_static_origin_through_the_origin_access_identity():
+    template = _synth(CdnOptions(static_bucket=True))
+    config = _config(template)
+    origins = {origin["Id"]: origin for origin in config["Origins"]}
+    assert set(origins) == {ALB_ORIGIN_ID, STATIC_ORIGIN_ID}
+    assert origins[STATIC_ORIGIN_ID]["S3OriginConfig"]["OriginAccessIdentity"] == {
+        "Fn::Join": ["", ["origin-access-identity/cloudfront/", {"Ref": "StaticAssetsOAI"}]]}
+    (behavior,) = config["CacheBehaviors"]
+    assert behavior["PathPattern"] == "/static/*"
+    assert behavior["TargetOriginId"] == STATIC_ORIGIN_ID
+    assert behavior["CachePolicyId"] == {"Ref": "CdnStaticCachePolicy"}
+    assert _cache_policy(template, "CdnStaticCachePolicy")["DefaultTTL"] == 86400
+
+
+def test_alb_accepts_the_cloudfront_prefix_list():
+    template = _synth(CdnOptions())
+    ingress = template["Resources"]["sgalbincloudfront"]["Properties"]
+    assert ingress["SourcePrefixListId"] == PREFIX_LIST_ID
+    assert (ingress["FromPort"], ingress["ToPort"]) == (80, 80)
+    assert ingress["GroupId"] == {"Fn::GetAtt": ["SGALB", "GroupId"]}
+
+
+@pytest.mark.parametrize("options", [
+    {"price_class": "PriceClass_Cheap"},
+    {"min_ttl": 600, "default_ttl": 300},
+    {"default_ttl": 600, "max_ttl": 300},
+    {"static_default_ttl": 10, "static_max_ttl": 5},
+    {"origin_keepalive_timeout": 0},
+    {"origin_read_timeout": 61},
+    {"static_path_pattern": "static/*"},
+])
+def test_invalid_options(options):
+    with pytest.raises(ValueError, match="cdn:"):
+        CdnOptions.from_context(options)
+
+
+def test_keepalive_below_the_idle_timeout():
+    pytest.importorskip("aws_cdk")
+    with pytest.raises(ValueError, match="idle timeout"):
+        add_cdn(None, CdnOptions(origin_keepalive_timeout=20), alb=None, security_group=None, idle_timeout=20)
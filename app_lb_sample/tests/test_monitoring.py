@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("aws_cdk")
+
+from aws_cdk import core
+
+from cdk_common.monitoring import Instrumentation
+from cdk_common.testing import resources_of_type, synth_template
+
+from app_lb_sample.app_lb_sample_stack import AppLbSampleStack
+
+
+class InstrumentedStack(AppLbSampleStack):
+    """The stack as ``build_assembly()`` builds it, with the monitoring aspect."""
+
+    def __init__(self, scope, construct_id, **kwargs):
+        super().__init__(scope, construct_id, **kwargs)
+        core.Aspects.of(self).add(Instrumentation())
+
+
+def _alarms(template):
+    return {alarm["Properties"]["MetricName"]: alarm["Properties"]
+            for alarm in resources_of_type(template, "AWS::CloudWatch::Alarm").values()}
+
+
+def _dimensions(alarm):
+    return {dimension["Name"]: dimension["Value"] for dimension in alarm["Dimensions"]}
+
+
+def test_target_group_alarm_through_the_listener():
+    alarms = _alarms(synth_template(InstrumentedStack))
+    assert set(_dimensions(alarms["UnHealthyHostCount"])) == {"LoadBalancer", "TargetGroup"}
+    assert {"TargetResponseTime", "HTTPCode_Target_5XX_Count", "CPUCreditBalance"} <= set(alarms)
+
+
+def test_web_fleet_cpu_credits():
+    template = synth_template(InstrumentedStack, context={"web_fleet": True})
+    (asg_id,) = resources_of_type(template, "AWS::AutoScaling::AutoScalingGroup")
+    credits = [alarm["Properties"] for alarm in resources_of_type(template, "AWS::CloudWatch::Alarm").values()
+               if alarm["Properties"]["MetricName"] == "CPUCreditBalance"]
+    # The bastion and the fleet (t2.micro from the launch template)
+    assert {"AutoScalingGroupName": {"Ref": asg_id}} in [_dimensions(alarm) for alarm in credits]
+    assert len(credits) == 2
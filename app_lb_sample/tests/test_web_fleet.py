@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("aws_cdk")
+
+from cdk_common.testing import ref, resources_of_type, synth_template
+
+from app_lb_sample.app_lb_sample_stack import AppLbSampleStack
+
+
+ASG = "AWS::AutoScaling::AutoScalingGroup"
+
+
+def _policy_types(template):
+    return {policy["Properties"]["TargetTrackingConfiguration"]["PredefinedMetricSpecification"]
+            ["PredefinedMetricType"]: policy
+            for policy in resources_of_type(template, "AWS::AutoScaling::ScalingPolicy").values()}
+
+
+def test_fixed_instances_without_fleet():
+    template = synth_template(AppLbSampleStack)
+    assert not resources_of_type(template, ASG)
+    targets = resources_of_type(template, "AWS::ElasticLoadBalancingV2::TargetGroup")
+    assert len(next(iter(targets.values()))["Properties"]["Targets"]) == 2
+
+
+def test_fleet_registers_in_the_target_group():
+    template = synth_template(AppLbSampleStack, context={"web_fleet": {"min_size": 2, "max_size": 8}})
+    asg = next(iter(resources_of_type(template, ASG).values()))["Properties"]
+    assert asg["TargetGroupARNs"] == [ref(template, "AWS::ElasticLoadBalancingV2::TargetGroup")]
+    assert (asg["MinSize"], asg["MaxSize"]) == ("2", "8")
+    assert asg["HealthCheckType"] == "ELB"
+    # The fleet replaces WebServer01/02
+    assert not resources_of_type(template, "AWS::EC2::Instance").keys() - {"bastion"}
+
+
+def test_fleet_target_tracking_policies():
+    template = synth_template(AppLbSampleStack, context={"web_fleet": {"requests_per_target": 500,
+                                                                       "cpu_utilization": 50}})
+    policies = _policy_types(template)
+    assert set(policies) == {"ALBRequestCountPerTarget", "ASGAverageCPUUtilization"}
+    for policy in policies.values():
+        assert policy["Properties"]["AutoScalingGroupName"] == ref(template, ASG)
+    assert policies["ALBRequestCountPerTarget"]["Properties"]["TargetTrackingConfiguration"]["TargetValue"] == 500
+    # The resource label needs the target group attached to the ALB first
+    assert policies["ALBRequestCountPerTarget"]["DependsOn"] == [
+        ref(template, "AWS::ElasticLoadBalancingV2::Listener")["Ref"]]
+
+
+def test_warm_pool_when_configured():
+    template = synth_template(AppLbSampleStack, context={"web_fleet": {"warm_pool_min_size": 2}})
+    warm_pool = next(iter(resources_of_type(template, "AWS::AutoScaling::WarmPool").values()))["Properties"]
+    assert warm_pool["AutoScalingGroupName"] == ref(template, ASG)
+    assert warm_pool["MinSize"] == 2
+
+    template = synth_template(AppLbSampleStack, context={"web_fleet": {"warm_pool_min_size": 0}})
+    assert not resources_of_type(template, "AWS::AutoScaling::WarmPool")
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Per-construct vs bulk (one template fragment) emission of L1 resources.
+
+Synthesizes N instances and N standalone security group ingress rules both
+ways, in fresh processes with the lookups stubbed (see ``bench_synth.py``),
+and prints synth time and jsii calls side by side:
+
+    $ python benchmarks/bench_bulk.py [--sizes 10 100 1000] [--runs 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_synth import run_case  # noqa: E402
+
+
+# per-construct case -> bulk case
+PAIRS = {"instances": "instances_bulk", "sg_ingress": "sg_ingress_bulk"}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'case':<12} {'N':>6} {'constructs (s)':>15} {'bulk (s)':>9} {'speedup':>8} "
+          f"{'jsii calls':>11} {'bulk calls':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for case, bulk_case in PAIRS.items():
+            for size in args.sizes:
+                single = [run_case(case, size, tmp) for _ in range(args.runs)]
+                bulk = [run_case(bulk_case, size, tmp) for _ in range(args.runs)]
+                single_s = statistics.median(run["wall_s"] for run in single)
+                bulk_s = statistics.median(run["wall_s"] for run in bulk)
+                print(f"{case:<12} {size:>6} {single_s:>15.2f} {bulk_s:>9.2f} {single_s / bulk_s:>7.1f}x "
+                      f"{single[0]['jsii_calls']:>11} {bulk[0]['jsii_calls']:>11}")
+
+
+if __name__ == "__main__":
+    main()
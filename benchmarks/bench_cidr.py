@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Subnet allocation and VPC overlap checks at scale.
+
+    $ python benchmarks/bench_cidr.py [--subnets 1000 10000 50000] [--vpcs 10000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cdk_common"))
+
+from cdk_common.cidr import CidrError, CidrIndex, SubnetAllocator  # noqa: E402
+
+
+def bench_subnets(count: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    azs = ["eu-central-1a", "eu-central-1b", "eu-central-1c"]
+    allocator = SubnetAllocator("10.0.0.0/8")
+    started = time.perf_counter()
+    for index in range(count):
+        allocator.allocate_one(f"role{index % 7}", prefix=rng.choice((24, 26, 28)), az=azs[index % 3])
+    elapsed = time.perf_counter() - started
+    print(f"{count:>8} subnets   {elapsed * 1000:>9.1f} ms {elapsed * 1e6 / count:>8.2f} us/subnet")
+
+
+def bench_vpcs(count: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    index = CidrIndex()
+    overlaps = 0
+    started = time.perf_counter()
+    for vpc in range(count):
+        cidr = f"{rng.randrange(10, 200)}.{rng.randrange(256)}.{rng.randrange(0, 256, 16)}.0/20"
+        try:
+            index.add(cidr, f"vpc-{vpc}")
+        except CidrError:
+            overlaps += 1
+    elapsed = time.perf_counter() - started
+    print(f"{count:>8} VPCs      {elapsed * 1000:>9.1f} ms {elapsed * 1e6 / count:>8.2f} us/VPC "
+          f"({overlaps} overlaps rejected)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subnets", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--vpcs", type=int, nargs="+", default=[10000])
+    args = parser.parse_args()
+
+    for count in args.subnets:
+        bench_subnets(count)
+    for count in args.vpcs:
+        bench_vpcs(count)
+
+
+if __name__ == "__main__":
+    main()
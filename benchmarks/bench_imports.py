@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Import time of the stack modules, lazy vs eager service modules.
+
+Every stack module only imports ``aws_cdk.core`` at load time, the service
+modules (``aws_ec2``, ``aws_elasticloadbalancingv2``, ``aws_autoscaling``)
+and ``requests`` are imported when a stack is actually built.  This measures,
+with ``python -X importtime`` in a fresh process each run, what importing a
+stack module costs now ("lazy") and what it cost when the service modules
+were imported with it ("eager"):
+
+    $ python benchmarks/bench_imports.py [--runs 5] [--top 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# project -> (stack module, service modules it used to import at load time)
+MODULES = {
+    "create_basic_vpc": ("create_basic_vpc.create_basic_vpc_stack", ["aws_cdk.aws_ec2"]),
+    "instance_creation": ("instance_creation.instance_creation_stack", ["aws_cdk.aws_ec2"]),
+    "app_lb_sample": ("app_lb_sample.app_lb_sample_stack", ["aws_cdk.aws_ec2",
+                                                            "aws_cdk.aws_elasticloadbalancingv2",
+                                                            "aws_cdk.aws_autoscaling",
+                                                            "requests"]),
+}
+
+
+def import_time(project: str, modules: List[str]) -> Tuple[float, Dict[str, float]]:
+    """Total import time (s) and cumulative time of the top-level imports."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.join(ROOT, project),
+                                                      os.path.join(ROOT, "cdk_common"),
+                                                      env.get("PYTHONPATH")]))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "; ".join(f"import {module}"
+                                                                                for module in modules)],
+                            env=env, check=True, stderr=subprocess.PIPE, universal_newlines=True)
+    total_us, top_level = 0, {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        if not name.startswith("  "):
+            top_level[name.strip()] = int(cumulative_us) / 1e6
+    return total_us / 1e6, top_level
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="heaviest top-level imports to show")
+    args = parser.parse_args()
+
+    print(f"{'project':<20} {'eager (s)':>10} {'lazy (s)':>10} {'saved':>7}")
+    heaviest = {}  # type: Dict[str, float]
+    for project, (stack_module, service_modules) in MODULES.items():
+        eager, lazy = [], []
+        for _ in range(args.runs):
+            eager.append(import_time(project, service_modules + [stack_module])[0])
+            total_s, top_level = import_time(project, [stack_module])
+            lazy.append(total_s)
+            for name, seconds in top_level.items():
+                heaviest[name] = max(heaviest.get(name, 0.0), seconds)
+        eager_s, lazy_s = statistics.median(eager), statistics.median(lazy)
+        print(f"{project:<20} {eager_s:>10.3f} {lazy_s:>10.3f} {1 - lazy_s / eager_s:>7.0%}")
+
+    print("\nheaviest top-level imports left (lazy):")
+    for name, seconds in sorted(heaviest.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<40} {seconds:>8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Cold vs warm synth latency of the three apps.
+
+A cold run starts from an empty lookup cache (home IP, AMI and AZs are fetched
+from the network), a warm run reuses the cache written by the previous run.
+Each run is a fresh ``python app.py`` process, as ``cdk synth`` would do.
+
+    $ python benchmarks/bench_lookups.py [--runs 3] [--offline]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECTS = ("create_basic_vpc", "instance_creation", "app_lb_sample")
+
+
+def synth(project: str, cache_file: str, out_dir: str, offline: bool) -> float:
+    project_dir = os.path.join(ROOT, project)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [project_dir,
+                                                      os.path.join(ROOT, "cdk_common"),
+                                                      env.get("PYTHONPATH")]))
+    env["CDK_OUTDIR"] = out_dir
+    # The synth cache would turn every warm run into a copy of the cold one
+    context = {"lookups:cacheFile": cache_file, "lookups:offline": offline,
+               "synthCache:disable": True}
+    if offline:
+        # There is no default for the home IP
+        context["home_ip"] = "203.0.113.10"
+    env["CDK_CONTEXT_JSON"] = json.dumps(context)
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "app.py"], cwd=project_dir, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--offline", action="store_true",
+                        help="never touch the network (cold runs use the built-in defaults)")
+    args = parser.parse_args()
+
+    print(f"{'project':<20} {'cold (s)':>10} {'warm (s)':>10} {'speedup':>8}")
+    for project in PROJECTS:
+        cold, warm = [], []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as tmp:
+                cache_file = os.path.join(tmp, "cdk.context.json")
+                cold.append(synth(project, cache_file, os.path.join(tmp, "cold.out"), args.offline))
+                warm.append(synth(project, cache_file, os.path.join(tmp, "warm.out"), args.offline))
+        cold_s, warm_s = statistics.median(cold), statistics.median(warm)
+        print(f"{project:<20} {cold_s:>10.2f} {warm_s:>10.2f} {cold_s / warm_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Security group reachability index on synthetic rule sets.
+
+Builds templates with N ingress rules (half from other security groups, half
+from CIDRs, over N / 20 groups and N / 10 instances), then times the index
+build, single queries against the linear scan of ``explain()``, and the full
+matrix:
+
+    $ python benchmarks/bench_reachability.py [--rules 1000 10000 50000] [--queries 10000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cdk_common"))
+
+from cdk_common.reachability import ReachabilityIndex  # noqa: E402
+
+
+def synthetic_template(rules: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    groups = max(2, rules // 20)
+    resources = {f"SG{index:05d}": {"Type": "AWS::EC2::SecurityGroup",
+                                    "Properties": {"SecurityGroupIngress": []}}
+                 for index in range(groups)}
+    for index in range(rules):
+        port = rng.randrange(1, 65000)
+        ingress = {"IpProtocol": rng.choice(("tcp", "tcp", "udp")),
+                   "FromPort": port, "ToPort": port + rng.choice((0, 0, 0, 10, 1000))}
+        if index % 2:
+            ingress["SourceSecurityGroupId"] = {"Fn::GetAtt": [f"SG{rng.randrange(groups):05d}", "GroupId"]}
+        else:
+            ingress["CidrIp"] = f"10.{rng.randrange(256)}.{rng.randrange(256)}.0/{rng.choice((16, 24, 28))}"
+        resources[f"SG{rng.randrange(groups):05d}"]["Properties"]["SecurityGroupIngress"].append(ingress)
+    for index in range(max(2, rules // 10)):
+        resources[f"Instance{index:05d}"] = {
+            "Type": "AWS::EC2::Instance",
+            "Properties": {"SecurityGroupIds": [{"Ref": f"SG{rng.randrange(groups):05d}"}
+                                                for _ in range(rng.choice((1, 1, 2)))]}}
+    return {"Resources": resources}
+
+
+def bench(rules: int, queries: int, matrix_limit: int, seed: int = 0) -> None:
+    template = synthetic_template(rules, seed)
+    started = time.perf_counter()
+    index = ReachabilityIndex()
+    index.add_template("Bench", template)
+    index.can_reach("Bench/Instance00000", "Bench/Instance00001", 22)
+    build_s = time.perf_counter() - started
+
+    rng = random.Random(seed + 1)
+    instances = [key for key in index.groups_of if "/Instance" in key]
+    samples = []
+    reachable = 0
+    for _ in range(queries):
+        source = rng.choice(instances) if rng.random() < 0.5 else f"10.{rng.randrange(256)}.{rng.randrange(256)}.7"
+        destination = rng.choice(instances)
+        port = rng.randrange(1, 65000)
+        started = time.perf_counter()
+        reachable += index.can_reach(source, destination, port, "tcp")
+        samples.append(time.perf_counter() - started)
+
+    scans = []
+    for _ in range(min(queries, 50)):
+        started = time.perf_counter()
+        index.explain(rng.choice(instances), rng.choice(instances), rng.randrange(1, 65000))
+        scans.append(time.perf_counter() - started)
+
+    matrix = "skipped"
+    if rules <= matrix_limit:
+        started = time.perf_counter()
+        pairs = sum(len(destinations) for destinations in index.matrix().values())
+        matrix = f"{(time.perf_counter() - started) * 1000:.0f} ms ({pairs} pairs)"
+
+    samples.sort()
+    print(f"{rules:>7} rules  build {build_s * 1000:>7.1f} ms  "
+          f"query p50 {statistics.median(samples) * 1e6:>6.1f} us  p99 {samples[int(len(samples) * 0.99)] * 1e6:>6.1f} us  "
+          f"scan p50 {statistics.median(scans) * 1e6:>8.1f} us  "
+          f"({reachable}/{queries} reachable)  matrix {matrix}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--matrix-limit", type=int, default=10000,
+                        help="largest rule set whose full matrix is computed")
+    args = parser.parse_args()
+
+    for rules in args.rules:
+        bench(rules, args.queries, args.matrix_limit)
+
+
+if __name__ == "__main__":
+    main()
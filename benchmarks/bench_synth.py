@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Synth benchmark of the three stacks and of scaled-up variants, with a baseline gate.
+
+Every case is synthesized in a fresh process (as ``cdk synth`` would do) with
+the network lookups stubbed through the context, and records:
+
+* ``wall_s``: import, construct and synth time of the stack;
+* ``peak_rss_mb``: peak RSS of the Python process plus the jsii runtime;
+* ``jsii_calls``: round-trips into the jsii kernel;
+* ``template_bytes``: size of the synthesized templates.
+
+The medians over ``--runs`` are compared with the stored baseline and the
+script exits non-zero when a metric got worse than its threshold, when a case
+is missing from the baseline, or when there is no baseline at all:
+
+    $ python benchmarks/bench_synth.py --save-baseline      # on the reference commit
+    $ python benchmarks/bench_synth.py                      # later, fails on regressions
+    $ python benchmarks/bench_synth.py --cases subnets instances --scales 10 100 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+BASELINE = os.path.join(BENCH_DIR, "baselines", "bench_synth.json")
+
+# case -> (project directory or None for the scaled stacks, "module:Class", extra context)
+CASES = {
+    "create_basic_vpc": ("create_basic_vpc", "create_basic_vpc.create_basic_vpc_stack:CreateBasicVpcStack", {}),
+    "instance_creation": ("instance_creation", "instance_creation.instance_creation_stack:InstanceCreationStack",
+                          {}),
+    "app_lb_sample": ("app_lb_sample", "app_lb_sample.app_lb_sample_stack:AppLbSampleStack", {}),
+    "instances": (None, "synth_stacks:ManyInstancesStack", {}),
+    "instances_bulk": (None, "synth_stacks:ManyInstancesStack", {"bench:bulk": True}),
+    "sg_rules": (None, "synth_stacks:ManySgRulesStack", {}),
+    "sg_ingress": (None, "synth_stacks:ManySgRulesStack", {"bench:inline": False}),
+    "sg_ingress_bulk": (None, "synth_stacks:ManySgRulesStack", {"bench:inline": False, "bench:bulk": True}),
+    "subnets": (None, "synth_stacks:ManySubnetsStack", {}),
+}
+
+# Relative increase tolerated before a metric counts as a regression.  Call
+# counts and template sizes are deterministic, any growth is a change
+THRESHOLDS = {"wall_s": 0.2, "peak_rss_mb": 0.1, "jsii_calls": 0.0, "template_bytes": 0.0}
+
+# Lookups answered from the context, the benchmark never touches the network
+STUB_CONTEXT = {"lookups:offline": True,
+                "home_ip": "203.0.113.10",
+                "ami_id": "ami-0de9f803fcac87f46",
+                "availability_zones": "eu-central-1a,eu-central-1b,eu-central-1c",
+                "synthCache:disable": True,
+                # The alarms would only follow the per-construct resources, not the bulk ones
+                "monitoring": False}
+
+
+def _peak_rss_mb() -> float:
+    """Peak RSS of this process and of its children still running (the jsii
+    runtime), from /proc where available."""
+    import resource
+
+    # KiB on Linux
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open(f"/proc/self/task/{os.getpid()}/children", 'r') as children_file:
+            children = children_file.read().split()
+    except OSError:
+        children = []
+    for pid in children:
+        try:
+            with open(f"/proc/{pid}/status", 'r') as status_file:
+                for line in status_file:
+                    if line.startswith("VmHWM:"):
+                        peak_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return peak_kb / 1024
+
+
+def worker(case: str, outdir: str) -> None:
+    """Synthesize one case in this process and print its metrics as JSON."""
+    from cdk_common.entrypoint import build_assembly
+    from cdk_common.parallel_synth import StackSpec
+    from cdk_common.profiler import Profiler
+
+    project, target, _ = CASES[case]
+    spec = StackSpec(f"Bench-{case.replace('_', '-')}", target,
+                     paths=(os.path.join(ROOT, project),) if project else (BENCH_DIR,))
+    profiler = Profiler(output=outdir, name=case)
+    profiler.install()
+    started = time.perf_counter()
+    assembly = build_assembly([spec], outdir, profiler=profiler)
+    wall_s = time.perf_counter() - started
+    profiler.uninstall()
+
+    template_bytes = sum(os.path.getsize(os.path.join(assembly, name))
+                         for name in os.listdir(assembly) if name.endswith(".template.json"))
+    print(json.dumps({"wall_s": wall_s,
+                      "peak_rss_mb": _peak_rss_mb(),
+                      "jsii_calls": len(profiler.calls),
+                      "template_bytes": template_bytes}))
+
+
+def run_case(case: str, scale: int, tmp: str) -> dict:
+    project, _, context = CASES[case]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.join(ROOT, "cdk_common"), env.get("PYTHONPATH")]))
+    env["CDK_CONTEXT_JSON"] = json.dumps(dict(STUB_CONTEXT, **context,
+                                              **{"lookups:cacheFile": os.path.join(tmp, "cdk.context.json"),
+                                                 "bench:scale": scale}))
+    env.pop("CDK_PROFILE", None)
+    outdir = tempfile.mkdtemp(dir=tmp)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", case, outdir],
+                            cwd=os.path.join(ROOT, project) if project else BENCH_DIR,
+                            env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(baseline: dict, results: dict, time_threshold: float) -> list:
+    """Regression messages for every metric worse than its threshold, and
+    for every case the baseline doesn't cover."""
+    thresholds = dict(THRESHOLDS, wall_s=time_threshold)
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        if name not in baseline:
+            regressions.append(f"{name}: not in the baseline, record it with --save-baseline")
+            continue
+        for metric, threshold in thresholds.items():
+            old, new = baseline[name][metric], metrics[metric]
+            if old and (new - old) / old > threshold:
+                regressions.append(f"{name}: {metric} {old:.6g} -> {new:.6g} "
+                                   f"({(new - old) / old:+.0%}, threshold {threshold:.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=sorted(CASES))
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100],
+                        help="sizes of the scaled-up cases (instances, sg_rules, subnets, ...)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLDS["wall_s"],
+                        help="relative wall time increase counted as a regression (default 0.2)")
+    parser.add_argument("--worker", nargs=2, metavar=("CASE", "OUTDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    results = {}
+    print(f"{'case':<24} {'wall (s)':>9} {'peak RSS (MB)':>14} {'jsii calls':>11} {'template (B)':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for case in args.cases:
+            scales = args.scales if CASES[case][0] is None else [None]
+            for scale in scales:
+                name = f"{case}-{scale}" if scale else case
+                runs = [run_case(case, scale or 0, tmp) for _ in range(args.runs)]
+                results[name] = {metric: statistics.median(run[metric] for run in runs) for metric in THRESHOLDS}
+                metrics = results[name]
+                print(f"{name:<24} {metrics['wall_s']:>9.2f} {metrics['peak_rss_mb']:>14.1f} "
+                      f"{metrics['jsii_calls']:>11.0f} {metrics['template_bytes']:>13.0f}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline.update(results)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        # Not a pass: a gate without a baseline would never fail
+        print(f"no baseline at {args.baseline}, run with --save-baseline on the reference commit")
+        sys.exit(2)
+
+    with open(args.baseline, 'r') as baseline_file:
+        regressions = compare(json.load(baseline_file), results, args.threshold)
+    print("\n".join(["", "REGRESSIONS:"] + regressions) if regressions else "\nno regression against the baseline")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
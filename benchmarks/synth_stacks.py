@@ -0,0 +1,106 @@
+"""Scaled-up stacks for ``bench_synth.py``.
+
+Same building blocks as the real stacks (L1 constructs, ``SubnetAllocator``,
+``add_ingress_rules``) repeated ``bench:scale`` times, to see how synth time,
+memory and jsii traffic grow with the size of a stack.  ``bench:bulk`` emits
+the repeated resources through ``BulkEmitter`` instead of one construct each.
+"""
+from aws_cdk import core
+from aws_cdk import aws_ec2 as ec2
+from cdk_common.bulk import BulkEmitter
+from cdk_common.cidr import SubnetAllocator
+from cdk_common.lookups import Lookups
+from cdk_common.sg_rules import IngressRule, add_ingress_rules
+
+
+VPC_CIDR = "10.0.0.0/12"
+
+
+class _ScaledStack(core.Stack):
+
+    def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        self.scale = int(self.node.try_get_context("bench:scale") or 10)
+        self.bulk = bool(self.node.try_get_context("bench:bulk"))
+        self.lookups = Lookups.for_scope(self)
+        self.azs = self.lookups.availability_zones()
+        self.vpc = ec2.CfnVPC(self, id="VPC", cidr_block=VPC_CIDR,
+                              tags=[core.CfnTag(key="Name", value="BenchVPC")])
+        self.subnets = SubnetAllocator(VPC_CIDR)
+
+
+class ManySubnetsStack(_ScaledStack):
+    """``bench:scale`` subnets spread over the AZs, each with its route table."""
+
+    def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        for index in range(self.scale):
+            alloc = self.subnets.allocate_one("subnet", prefix=24, az=self.azs[index % len(self.azs)])
+            subnet = ec2.CfnSubnet(self, id=f"Subnet{index:04d}",
+                                   vpc_id=self.vpc.ref,
+                                   cidr_block=alloc.cidr_block,
+                                   availability_zone=alloc.az,
+                                   tags=[core.CfnTag(key="Name", value=f"Subnet{index:04d}")])
+            route_table = ec2.CfnRouteTable(self, id=f"RT{index:04d}", vpc_id=self.vpc.ref)
+            ec2.CfnSubnetRouteTableAssociation(self, id=f"RT{index:04d}_Assoc",
+                                               route_table_id=route_table.ref,
+                                               subnet_id=subnet.ref)
+
+
+class ManySgRulesStack(_ScaledStack):
+    """Two security groups with ``bench:scale`` ingress rules each, half of
+    them mergeable into ranges and half from distinct sources.  Inlined into
+    the groups unless ``bench:inline`` is false."""
+
+    def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        sg_public = ec2.CfnSecurityGroup(self, id="SG_PUBLIC",
+                                         group_description="SG for the Public Subnet",
+                                         vpc_id=self.vpc.ref)
+        sg_private = ec2.CfnSecurityGroup(self, id="SG_PRIVATE",
+                                          group_description="SG for the Private Subnet",
+                                          vpc_id=self.vpc.ref)
+        public_rules = [IngressRule("tcp", 1024 + index, 1024 + index,
+                                    cidr_ip="0.0.0.0/0" if index % 2 else f"10.{index // 256 % 256}.{index % 256}.0/24",
+                                    description="bench")
+                        for index in range(self.scale)]
+        private_rules = [IngressRule("tcp", 1024 + index, 1024 + index,
+                                     source_security_group_id=sg_public.ref if index % 2 else sg_private.ref,
+                                     description="bench")
+                         for index in range(self.scale)]
+        inline = self.node.try_get_context("bench:inline") in (None, True, "true")
+        add_ingress_rules(self, "sg_pub_in", sg_public, public_rules, inline=inline, bulk=self.bulk)
+        add_ingress_rules(self, "sg_priv_in", sg_private, private_rules, inline=inline, bulk=self.bulk)
+
+
+class ManyInstancesStack(_ScaledStack):
+    """``bench:scale`` instances in one subnet, with user data."""
+
+    def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        alloc = self.subnets.allocate_one("public", prefix=20, az=self.azs[0])
+        subnet = ec2.CfnSubnet(self, id="Subnet", vpc_id=self.vpc.ref,
+                               cidr_block=alloc.cidr_block, availability_zone=alloc.az)
+        sg = ec2.CfnSecurityGroup(self, id="SG", group_description="SG for the instances",
+                                  vpc_id=self.vpc.ref)
+        image_id = self.lookups.ami_id()
+        user_data = core.Fn.base64("#!/bin/bash\nyum install -y httpd\n")
+        if self.bulk:
+            with BulkEmitter(self, "Instances") as bulk:
+                for index in range(self.scale):
+                    bulk.add(f"Instance{index:04d}", "AWS::EC2::Instance",
+                             {"ImageId": image_id,
+                              "InstanceType": "t2.micro",
+                              "SubnetId": subnet.ref,
+                              "SecurityGroupIds": [sg.ref],
+                              "UserData": user_data,
+                              "Tags": [{"Key": "Name", "Value": f"Instance{index:04d}"}]})
+            return
+        for index in range(self.scale):
+            ec2.CfnInstance(self, id=f"Instance{index:04d}",
+                            image_id=image_id,
+                            instance_type="t2.micro",
+                            subnet_id=subnet.ref,
+                            security_group_ids=[sg.ref],
+                            user_data=user_data,
+                            tags=[core.CfnTag(key="Name", value=f"Instance{index:04d}")])
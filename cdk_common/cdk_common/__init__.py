@@ -0,0 +1 @@
+from cdk_common.lookups import LookupCache, LookupFailedError, Lookups
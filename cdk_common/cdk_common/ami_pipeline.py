@@ -0,0 +1,148 @@
+"""EC2 Image Builder pipeline baking a ``configure.sh`` into an AMI.
+
+Instances booting from the stock Amazon Linux AMI spend minutes in their
+user data (``yum update``, package installs) before they pass the target
+group health check.  ``AmiPipelineStack`` runs that work once, at image build
+time, and publishes the resulting AMI ID as the SSM parameter
+``/cdk/ami/<image name>``, which the stacks read through
+``Lookups.baked_ami_id()``.  In an environment of the root app (the
+``environment`` context value) the image name, and so the Image Builder
+resources and the parameter, get the environment's name as a suffix: two
+environments sharing an account and region each bake their own image.
+
+Scripts are split on ``BOOT_MARKER``: what comes before it is baked into the
+image, what comes after it depends on the instance (its hostname, ...) and
+still runs as user data.  When no baked image is available the stacks fall
+back to the stock AMI and the whole script as user data:
+
+    image_id, user_data = image_and_user_data(lookups, "app-lb-sample-web", script,
+                                              environment=self.node.try_get_context("environment"))
+"""
+import hashlib
+import json
+from typing import Optional, Tuple
+
+from aws_cdk import core
+
+
+BOOT_MARKER = "# --- boot ---"
+IMAGE_BUILDER_POLICIES = ("EC2InstanceProfileForImageBuilder", "AmazonSSMManagedInstanceCore")
+
+
+def split_script(script: str) -> Tuple[str, str]:
+    """(bake, boot) parts of a user data script, both keep the shebang."""
+    if BOOT_MARKER not in script:
+        return script, ""
+    bake, boot = script.split(BOOT_MARKER, 1)
+    shebang = bake.splitlines()[0] + "\n" if bake.startswith("#!") else ""
+    return bake.rstrip() + "\n", (shebang + boot.lstrip("\n")) if boot.strip() else ""
+
+
+def content_version(script: str) -> str:
+    """Semantic version derived from the script, Image Builder components
+    and recipes can't be updated in place."""
+    digest = hashlib.sha256(script.encode()).hexdigest()
+    return f"1.{int(digest[:6], 16)}.{int(digest[6:12], 16)}"
+
+
+def environment_image_name(image_name: str, environment: Optional[str] = None) -> str:
+    """Name of the image baked for ``environment``, ``image_name`` outside of one."""
+    return f"{image_name}-{environment}" if environment else image_name
+
+
+def image_and_user_data(lookups, image_name: str, script: str,
+                        environment: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """AMI and (unencoded) user data of an instance configured by ``script``:
+    the baked image (of ``environment``) and the boot part of the script when
+    the pipeline published one, the stock AMI and the whole script otherwise."""
+    baked_ami_id = lookups.baked_ami_id(environment_image_name(image_name, environment))
+    if baked_ami_id:
+        return baked_ami_id, split_script(script)[1] or None
+    return lookups.ami_id(), script
+
+
+class AmiPipelineStack(core.Stack):
+    """Image Builder component, recipe and image for ``script``.
+
+    The image is built when the stack is deployed (``CfnImage``), again
+    whenever the bake part of the script changes (it gives the component and
+    recipe their version), and the SSM parameter follows it.  ``schedule``
+    (e.g. ``"cron(0 4 ? * sun *)"``) adds a pipeline rebuilding the image when
+    the base AMI gets updates; those images are listed in Image Builder.  The
+    names of all of them carry the ``environment`` context value.
+    """
+
+    def __init__(self, scope: core.Construct, construct_id: str,
+                 image_name: str, script: str,
+                 instance_types: Tuple[str, ...] = ("t2.micro",),
+                 schedule: Optional[str] = None, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        from aws_cdk import aws_iam as iam
+        from aws_cdk import aws_imagebuilder as imagebuilder
+        from aws_cdk import aws_ssm as ssm
+
+        from cdk_common.lookups import BAKED_AMI_SSM_PREFIX, Lookups
+
+        image_name = environment_image_name(image_name, self.node.try_get_context("environment"))
+        bake, _ = split_script(script)
+        version = content_version(bake)
+        # Component documents are YAML, of which JSON is a subset
+        document = {"name": image_name,
+                    "schemaVersion": 1.0,
+                    "phases": [{"name": "build",
+                                "steps": [{"name": "Configure",
+                                           "action": "ExecuteBash",
+                                           "inputs": {"commands": [bake]}}]}]}
+
+        role = iam.CfnRole(self, id="ImageBuilderRole",
+                           assume_role_policy_document={
+                               "Version": "2012-10-17",
+                               "Statement": [{"Effect": "Allow",
+                                              "Principal": {"Service": "ec2.amazonaws.com"},
+                                              "Action": "sts:AssumeRole"}]},
+                           managed_policy_arns=[f"arn:{core.Aws.PARTITION}:iam::aws:policy/{policy}"
+                                                for policy in IMAGE_BUILDER_POLICIES])
+        instance_profile = iam.CfnInstanceProfile(self, id="ImageBuilderInstanceProfile",
+                                                  roles=[role.ref])
+
+        component = imagebuilder.CfnComponent(self, id="Component",
+                                              name=f"{image_name}-configure",
+                                              platform="Linux",
+                                              version=version,
+                                              data=json.dumps(document))
+
+        recipe = imagebuilder.CfnImageRecipe(self, id="Recipe",
+                                             name=image_name,
+                                             version=version,
+                                             parent_image=Lookups.for_scope(self).ami_id(),
+                                             components=[imagebuilder.CfnImageRecipe.ComponentConfigurationProperty(
+                                                 component_arn=component.attr_arn)])
+
+        infrastructure = imagebuilder.CfnInfrastructureConfiguration(
+            self, id="Infrastructure",
+            name=image_name,
+            instance_profile_name=instance_profile.ref,
+            instance_types=list(instance_types),
+            terminate_instance_on_failure=True)
+
+        image = imagebuilder.CfnImage(self, id="Image",
+                                      image_recipe_arn=recipe.attr_arn,
+                                      infrastructure_configuration_arn=infrastructure.attr_arn)
+
+        if schedule:
+            imagebuilder.CfnImagePipeline(
+                self, id="Pipeline",
+                name=image_name,
+                image_recipe_arn=recipe.attr_arn,
+                infrastructure_configuration_arn=infrastructure.attr_arn,
+                schedule=imagebuilder.CfnImagePipeline.ScheduleProperty(
+                    schedule_expression=schedule,
+                    pipeline_execution_start_condition="EXPRESSION_MATCH_AND_DEPENDENCY_UPDATES_AVAILABLE"))
+
+        ssm.CfnParameter(self, id="AmiParameter",
+                         name=f"{BAKED_AMI_SSM_PREFIX}{image_name}",
+                         type="String",
+                         value=image.attr_image_id,
+                         description=f"Latest {image_name} AMI")
+
+        core.CfnOutput(self, id="AmiId", value=image.attr_image_id)
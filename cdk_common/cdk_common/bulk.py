@@ -0,0 +1,118 @@
+"""Emit many L1 resources into a stack with a single jsii call.
+
+Every ``ec2.CfnInstance(...)``/``ec2.CfnSecurityGroupIngress(...)`` is a
+round-trip into the jsii runtime (plus one per property set afterwards), so
+stacks with hundreds of such resources spend most of their synth time in
+the bindings.  ``BulkEmitter`` collects the resources as plain CloudFormation
+dicts and hands them to the stack as one template fragment (``core.CfnInclude``)
+when emitted:
+
+    with BulkEmitter(self, "Instances") as bulk:
+        for index in range(100):
+            bulk.add(f"Instance{index:03d}", "AWS::EC2::Instance",
+                     {"ImageId": ami_id, "SubnetId": subnet.subnet_id,
+                      "SecurityGroupIds": [sg.ref]})
+
+Logical IDs are used verbatim (no hash suffix) and must be unique in the
+stack, the CDK refuses to synthesize otherwise.  Property values can hold
+tokens of regular constructs (``subnet.subnet_id``), which are resolved at
+synth, and intrinsics pointing at other bulk resources (``resource.ref``,
+``resource.get_att("GroupId")``).  Regular constructs refer to bulk
+resources with ``bulk.ref(logical_id)``.  Aspects and ``core.Tags`` don't see
+the bulk resources, tags have to be part of their properties.
+"""
+import re
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple, Union
+
+
+LOGICAL_ID = re.compile(r"^[A-Za-z0-9]{1,255}$")
+
+
+class BulkResource(NamedTuple):
+    logical_id: str
+    type: str
+    properties: Dict[str, Any]
+    depends_on: Tuple[str, ...] = ()
+
+    @property
+    def ref(self) -> Dict[str, str]:
+        """``Ref`` intrinsic, for the properties of other bulk resources."""
+        return {"Ref": self.logical_id}
+
+    def get_att(self, attribute: str) -> Dict[str, Any]:
+        return {"Fn::GetAtt": [self.logical_id, attribute]}
+
+    def to_cloudformation(self) -> Dict[str, Any]:
+        resource = {"Type": self.type, "Properties": self.properties}
+        if self.depends_on:
+            resource["DependsOn"] = list(self.depends_on)
+        return resource
+
+
+def logical_id(*parts: Any) -> str:
+    """Logical ID made of the alphanumeric characters of ``parts``
+    ('sg_pub_in', 'tcp', '22-23' -> 'sgpubintcp2223')."""
+    return re.sub(r"[^A-Za-z0-9]", "", "".join(str(part) for part in parts))
+
+
+class BulkEmitter:
+
+    def __init__(self, scope, construct_id: str = "Bulk") -> None:
+        self.scope = scope
+        self.construct_id = construct_id
+        self.resources = {}  # type: Dict[str, BulkResource]
+        self.emitted = None
+
+    def __len__(self) -> int:
+        return len(self.resources)
+
+    def __enter__(self) -> "BulkEmitter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.emit()
+
+    def add(self, logical_id: str, type: str, properties: Dict[str, Any],
+            depends_on: Iterable[Union[str, BulkResource, Any]] = ()) -> BulkResource:
+        """Queue a resource.  ``depends_on`` takes logical IDs, bulk resources
+        or regular ``CfnResource`` constructs."""
+        if self.emitted is not None:
+            raise RuntimeError(f"{self.construct_id}: resources can't be added after emit()")
+        if not LOGICAL_ID.match(logical_id):
+            raise ValueError(f"{self.construct_id}: '{logical_id}' is not a valid logical ID (A-Za-z0-9 only)")
+        if logical_id in self.resources:
+            raise ValueError(f"{self.construct_id}: duplicate logical ID '{logical_id}'")
+        resource = BulkResource(logical_id, type, dict(properties),
+                                tuple(self._logical_id_of(dependency) for dependency in depends_on))
+        self.resources[logical_id] = resource
+        return resource
+
+    def _logical_id_of(self, dependency: Union[str, BulkResource, Any]) -> str:
+        if isinstance(dependency, str):
+            return dependency
+        if isinstance(dependency, BulkResource):
+            return dependency.logical_id
+        from aws_cdk import core
+        return core.Stack.of(self.scope).get_logical_id(dependency)
+
+    def fragment(self) -> Dict[str, Any]:
+        return {"Resources": {logical_id: resource.to_cloudformation()
+                              for logical_id, resource in self.resources.items()}}
+
+    def emit(self) -> Optional[Any]:
+        """Add the queued resources to the stack (once), in one jsii call."""
+        from aws_cdk import core
+
+        if self.emitted is None and self.resources:
+            self.emitted = core.CfnInclude(self.scope, self.construct_id, template=self.fragment())
+        return self.emitted
+
+    def ref(self, logical_id: str) -> str:
+        """``Ref`` of a bulk resource, for the properties of regular constructs."""
+        from aws_cdk import core
+        return core.Fn.ref(logical_id)
+
+    def get_att(self, logical_id: str, attribute: str) -> str:
+        from aws_cdk import core
+        return core.Token.as_string(core.Fn.get_att(logical_id, attribute))
@@ -0,0 +1,152 @@
+"""Deterministic subnet CIDR allocation with a sorted interval index.
+
+Subnet CIDRs and AZs used to be typed in by hand in every stack, with nothing
+checking them for overlaps.  ``SubnetAllocator`` carves subnets out of the VPC
+CIDR by role and AZ instead:
+
+    allocator = SubnetAllocator("192.168.0.0/20")
+    public = allocator.allocate("public", azs[:1], prefix=24)
+    private = allocator.allocate("private", azs[:2], prefix=24)
+    ec2.Subnet(self, id="Subnet01", cidr_block=private[0].cidr_block,
+               availability_zone=private[0].az, ...)
+
+Addresses are plain integers and the free space is a sorted list of disjoint
+intervals searched with ``bisect``, so allocations and overlap checks are
+O(log n) (plus list memmoves) and stay fast with thousands of subnets.  The
+same inputs in the same order always give the same CIDRs.
+
+``CidrIndex`` is the same idea for checking that many VPCs don't overlap.
+"""
+import bisect
+import ipaddress
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+
+Network = Union[str, ipaddress.IPv4Network]
+
+
+class CidrError(ValueError):
+    pass
+
+
+class Allocation(NamedTuple):
+    role: str
+    az: Optional[str]
+    network: ipaddress.IPv4Network
+
+    @property
+    def cidr_block(self) -> str:
+        return str(self.network)
+
+
+def _interval(network: Network) -> Tuple[int, int]:
+    network = ipaddress.IPv4Network(network)
+    return int(network.network_address), int(network.broadcast_address)
+
+
+class CidrIndex:
+    """Disjoint CIDRs kept sorted by start address, with their owner."""
+
+    def __init__(self) -> None:
+        self._starts = []  # type: List[int]
+        self._ends = []  # type: List[int]
+        self._owners = []  # type: List[str]
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def find_overlap(self, network: Network) -> Optional[Tuple[str, str]]:
+        """(cidr, owner) of an indexed CIDR overlapping ``network``, if any."""
+        start, end = _interval(network)
+        i = bisect.bisect_right(self._starts, end) - 1
+        if i >= 0 and self._ends[i] >= start:
+            prefix = 32 - (self._ends[i] - self._starts[i] + 1).bit_length() + 1
+            return str(ipaddress.IPv4Network((self._starts[i], prefix))), self._owners[i]
+        return None
+
+    def add(self, network: Network, owner: str) -> None:
+        overlap = self.find_overlap(network)
+        if overlap is not None:
+            raise CidrError(f"{network} ({owner}) overlaps {overlap[0]} ({overlap[1]})")
+        start, end = _interval(network)
+        i = bisect.bisect_left(self._starts, start)
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+        self._owners.insert(i, owner)
+
+
+class SubnetAllocator:
+    """First-fit, aligned allocation of subnets inside a VPC CIDR."""
+
+    def __init__(self, vpc_cidr: Network) -> None:
+        self.vpc = ipaddress.IPv4Network(vpc_cidr)
+        start, end = _interval(self.vpc)
+        # Free space as disjoint [start, end] intervals, sorted
+        self._free_starts = [start]
+        self._free_ends = [end]
+        # Per block size, an address below which no aligned block of that size is free
+        self._hints = {}  # type: Dict[int, int]
+        self.allocations = []  # type: List[Allocation]
+
+    def _take(self, i: int, start: int, end: int) -> None:
+        free_start, free_end = self._free_starts[i], self._free_ends[i]
+        del self._free_starts[i], self._free_ends[i]
+        if end < free_end:
+            self._free_starts.insert(i, end + 1)
+            self._free_ends.insert(i, free_end)
+        if free_start < start:
+            self._free_starts.insert(i, free_start)
+            self._free_ends.insert(i, start - 1)
+
+    def reserve(self, role: str, cidr: Network, az: Optional[str] = None) -> Allocation:
+        """Claim a specific CIDR, failing if it is outside the VPC or already used."""
+        network = ipaddress.IPv4Network(cidr)
+        if not network.subnet_of(self.vpc):
+            raise CidrError(f"{network} ({role}) is outside of the VPC CIDR {self.vpc}")
+        start, end = _interval(network)
+        i = bisect.bisect_right(self._free_starts, start) - 1
+        if i < 0 or self._free_ends[i] < end:
+            taken = next(a for a in self.allocations if a.network.overlaps(network))
+            raise CidrError(f"{network} ({role}) overlaps {taken.cidr_block} ({taken.role})")
+        self._take(i, start, end)
+        allocation = Allocation(role, az, network)
+        self.allocations.append(allocation)
+        return allocation
+
+    def allocate_one(self, role: str, prefix: int, az: Optional[str] = None) -> Allocation:
+        if not self.vpc.prefixlen <= prefix <= 32:
+            raise CidrError(f"/{prefix} ({role}) does not fit in the VPC CIDR {self.vpc}")
+        size = 1 << (32 - prefix)
+        hint = self._hints.get(size, 0)
+        i = max(bisect.bisect_right(self._free_starts, hint) - 1, 0)
+        while i < len(self._free_starts):
+            free_start, free_end = self._free_starts[i], self._free_ends[i]
+            start = -(-max(free_start, hint) // size) * size
+            if start + size - 1 <= free_end:
+                self._take(i, start, start + size - 1)
+                self._hints[size] = start + size
+                allocation = Allocation(role, az, ipaddress.IPv4Network((start, prefix)))
+                self.allocations.append(allocation)
+                return allocation
+            i += 1
+        raise CidrError(f"No free /{prefix} left in {self.vpc} for {role}"
+                        f"{f' in {az}' if az else ''} ({self.free_addresses()} addresses free)")
+
+    def allocate(self, role: str, azs: Sequence[str], prefix: int) -> List[Allocation]:
+        """One subnet of size ``/prefix`` per AZ for ``role``."""
+        return [self.allocate_one(role, prefix, az) for az in azs]
+
+    def free_addresses(self) -> int:
+        return sum(end - start + 1 for start, end in zip(self._free_starts, self._free_ends))
+
+    def free_networks(self) -> List[ipaddress.IPv4Network]:
+        networks = []
+        for start, end in zip(self._free_starts, self._free_ends):
+            networks.extend(ipaddress.summarize_address_range(ipaddress.IPv4Address(start),
+                                                              ipaddress.IPv4Address(end)))
+        return networks
+
+    def summary(self) -> str:
+        used = self.vpc.num_addresses - self.free_addresses()
+        return (f"{len(self.allocations)} subnets in {self.vpc}, {used}/{self.vpc.num_addresses} "
+                f"addresses allocated, free: {', '.join(map(str, self.free_networks())) or 'none'}")
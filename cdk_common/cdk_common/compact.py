@@ -0,0 +1,291 @@
+"""Smaller templates: minified JSON, no CDK metadata, shared tags and strings.
+
+The templates written by ``cdk synth`` are pretty-printed, carry an
+``aws:cdk:path`` entry on every resource plus the ``CDKMetadata`` resource,
+and repeat the same tags and large strings (user data) on many resources.
+``compact_assembly()`` rewrites the templates of a cloud assembly after synth:
+
+* ``aws:cdk:path`` metadata and the ``CDKMetadata`` resource (and its
+  condition) are dropped, other metadata (``AWS::CloudFormation::Init``, ...)
+  is kept;
+* a ``{"Key": ..., "Value": ...}`` tag carried by every resource with a
+  ``Tags`` list becomes a stack tag in the manifest (``cdk deploy`` applies
+  it, CloudFormation propagates it to the resources); tags that differ per
+  resource (``Name``) stay where they are;
+* string property values of at least ``dedupe_min_bytes`` found more than
+  once are stored once, in the ``CompactStrings`` mapping, and read with
+  ``Fn::FindInMap``;
+* the JSON is written without indentation or spaces.
+
+Turned on with the ``compact`` context value, which prints a before/after
+size report per stack:
+
+    $ cdk synth -c compact=true
+    $ cdk synth -c compact='{"dedupe_min_bytes": 256, "collapse_tags": false}'
+    $ python -m cdk_common.compact cdk.out --report-only
+
+Nested stack templates (``cdk_common.sharding``) are file assets whose hash
+is already in their parent and are left as they are.  ``cdk diff`` shows
+logical IDs instead of construct paths once the metadata is gone.
+"""
+import json
+import os
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from cdk_common.template_graph import _template_files
+
+
+CDK_PATH_METADATA = "aws:cdk:path"
+CDK_METADATA_TYPE = "AWS::CDK::Metadata"
+CDK_METADATA_CONDITION = "CDKMetadataAvailable"
+STRINGS_MAPPING = "CompactStrings"
+STRINGS_KEY = "Values"
+# CloudFormation: at most 200 attributes per mapping
+MAX_MAPPING_ATTRIBUTES = 200
+MINIFIED_SEPARATORS = (",", ":")
+# Same suffix as in cdk_common.sharding
+NESTED_SUFFIX = ".nested.template.json"
+
+
+class CompactOptions(NamedTuple):
+    strip_metadata: bool = True
+    collapse_tags: bool = True
+    # Strings shorter than this are cheaper inline than behind Fn::FindInMap
+    dedupe_min_bytes: int = 512
+    minify: bool = True
+
+    @classmethod
+    def from_context(cls, value: Any) -> Optional["CompactOptions"]:
+        if not value or value == "false":
+            return None
+        if value is True or value == "true":
+            return cls()
+        if isinstance(value, str):
+            value = json.loads(value)
+        return cls(**value)
+
+
+class SizeReport(NamedTuple):
+    stack: str
+    before: int
+    after: int
+    metadata_removed: int
+    tags_collapsed: Dict[str, str]
+    strings_deduplicated: int
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after
+
+    def __str__(self) -> str:
+        ratio = self.saved / self.before if self.before else 0.0
+        details = [f"{self.metadata_removed} metadata entries removed"]
+        if self.tags_collapsed:
+            details.append(f"{len(self.tags_collapsed)} tags moved to the stack")
+        if self.strings_deduplicated:
+            details.append(f"{self.strings_deduplicated} strings deduplicated")
+        return (f"{self.stack}: {self.before} B -> {self.after} B ({ratio:.0%} smaller; "
+                f"{', '.join(details)})")
+
+
+def strip_metadata(template: Dict[str, Any]) -> int:
+    """Drop the CDK metadata of ``template`` in place; returns the number of entries removed."""
+    resources = template.get("Resources", {})
+    removed = 0
+    for logical_id in [logical_id for logical_id, resource in resources.items()
+                       if resource.get("Type") == CDK_METADATA_TYPE]:
+        del resources[logical_id]
+        removed += 1
+    for resource in resources.values():
+        metadata = resource.get("Metadata")
+        if isinstance(metadata, dict) and CDK_PATH_METADATA in metadata:
+            del metadata[CDK_PATH_METADATA]
+            removed += 1
+            if not metadata:
+                del resource["Metadata"]
+
+    conditions = template.get("Conditions", {})
+    rest = dict(template, Conditions={name: condition for name, condition in conditions.items()
+                                      if name != CDK_METADATA_CONDITION})
+    if CDK_METADATA_CONDITION in conditions and f'"{CDK_METADATA_CONDITION}"' not in json.dumps(rest):
+        del conditions[CDK_METADATA_CONDITION]
+        if not conditions:
+            del template["Conditions"]
+    return removed
+
+
+def _tag_lists(template: Dict[str, Any]) -> List[List[Any]]:
+    return [resource["Properties"]["Tags"] for resource in template.get("Resources", {}).values()
+            if isinstance(resource.get("Properties", {}).get("Tags"), list)]
+
+
+def _is_plain_tag(tag: Any) -> bool:
+    # Not {"Key", "Value", "PropagateAtLaunch"} (Auto Scaling) nor tokens
+    return isinstance(tag, dict) and set(tag) == {"Key", "Value"} \
+        and isinstance(tag["Key"], str) and isinstance(tag["Value"], str)
+
+
+def collapse_tags(template: Dict[str, Any]) -> Dict[str, str]:
+    """Remove, in place, the tags every tagged resource of ``template`` has;
+    returns them as stack tags."""
+    tag_lists = _tag_lists(template)
+    if len(tag_lists) < 2:
+        return {}
+    common = None  # type: Optional[set]
+    for tags in tag_lists:
+        plain = {(tag["Key"], tag["Value"]) for tag in tags if _is_plain_tag(tag)}
+        common = plain if common is None else common & plain
+    if not common:
+        return {}
+    for tags in tag_lists:
+        tags[:] = [tag for tag in tags if not (_is_plain_tag(tag) and (tag["Key"], tag["Value"]) in common)]
+    for resource in template["Resources"].values():
+        if resource.get("Properties", {}).get("Tags") == []:
+            del resource["Properties"]["Tags"]
+    return dict(sorted(common))
+
+
+def _string_values(node: Any, found: Dict[str, int]) -> None:
+    """Count the plain string values under ``node`` (not the arguments of intrinsic functions)."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key.startswith("Fn::") or key == "Ref":
+                continue
+            if isinstance(value, str):
+                found[value] = found.get(value, 0) + 1
+            else:
+                _string_values(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            if isinstance(value, str):
+                found[value] = found.get(value, 0) + 1
+            else:
+                _string_values(value, found)
+
+
+def _replace_strings(node: Any, names: Dict[str, str]) -> Any:
+    def lookup(value):
+        if isinstance(value, str) and value in names:
+            return {"Fn::FindInMap": [STRINGS_MAPPING, STRINGS_KEY, names[value]]}
+        return _replace_strings(value, names)
+
+    if isinstance(node, dict):
+        return {key: value if key.startswith("Fn::") or key == "Ref" else lookup(value)
+                for key, value in node.items()}
+    if isinstance(node, list):
+        return [lookup(value) for value in node]
+    return node
+
+
+def deduplicate_strings(template: Dict[str, Any], min_bytes: int) -> int:
+    """Store, in place, the resource property strings of at least ``min_bytes``
+    that occur more than once in the ``CompactStrings`` mapping; returns how many."""
+    resources = template.get("Resources", {})
+    found = {}  # type: Dict[str, int]
+    for resource in resources.values():
+        _string_values(resource.get("Properties", {}), found)
+    # Largest savings first, as long as the mapping has room
+    repeated = sorted((value for value, count in found.items()
+                       if count > 1 and len(value.encode()) >= min_bytes),
+                      key=lambda value: (-len(value.encode()) * found[value], value))
+    mapping = template.get("Mappings", {}).get(STRINGS_MAPPING, {}).get(STRINGS_KEY, {})
+    repeated = repeated[:MAX_MAPPING_ATTRIBUTES - len(mapping)]
+    if not repeated:
+        return 0
+    names = {}
+    for value in repeated:
+        name = f"S{len(mapping)}"
+        mapping[name] = value
+        names[value] = name
+    for resource in resources.values():
+        if "Properties" in resource:
+            resource["Properties"] = _replace_strings(resource["Properties"], names)
+    template.setdefault("Mappings", {}).setdefault(STRINGS_MAPPING, {})[STRINGS_KEY] = mapping
+    return len(repeated)
+
+
+def _dumps(template: Dict[str, Any], minify: bool) -> str:
+    if minify:
+        return json.dumps(template, separators=MINIFIED_SEPARATORS)
+    return json.dumps(template, indent=1)
+
+
+def compact_template(template: Dict[str, Any], options: CompactOptions,
+                     stack: str = "") -> Tuple[Dict[str, Any], SizeReport]:
+    """Compacted copy of ``template`` and its size report (stack tags in ``tags_collapsed``)."""
+    before = len(_dumps(template, minify=False).encode())
+    template = json.loads(json.dumps(template))
+    metadata_removed = strip_metadata(template) if options.strip_metadata else 0
+    tags = collapse_tags(template) if options.collapse_tags else {}
+    strings = deduplicate_strings(template, options.dedupe_min_bytes) if options.dedupe_min_bytes else 0
+    after = len(_dumps(template, options.minify).encode())
+    return template, SizeReport(stack, before, after, metadata_removed, tags, strings)
+
+
+def _add_stack_tags(directory: str, template_file: str, tags: Dict[str, str]) -> None:
+    manifest_path = os.path.join(directory, "manifest.json")
+    with open(manifest_path, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    for artifact in manifest.get("artifacts", {}).values():
+        properties = artifact.get("properties", {})
+        if properties.get("templateFile") == template_file:
+            # Tags set on the stack itself win
+            properties["tags"] = dict(tags, **properties.get("tags", {}))
+            break
+    else:
+        raise ValueError(f"No stack artifact synthesizes {template_file}")
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def compact_assembly(directory: str, options: Optional[CompactOptions] = None,
+                     write: bool = True, file=sys.stderr) -> List[SizeReport]:
+    """Compact the (non nested) templates of a cloud assembly, printing a
+    size report per stack on ``file``."""
+    options = options or CompactOptions()
+    reports = []
+    for path in _template_files(directory):
+        if path.endswith(NESTED_SUFFIX):
+            continue
+        template_file_name = os.path.basename(path)
+        with open(path, 'r') as template_file:
+            template = json.load(template_file)
+        compacted, report = compact_template(template, options, stack=template_file_name[:-len(".template.json")])
+        if write:
+            if report.tags_collapsed:
+                _add_stack_tags(directory, template_file_name, report.tags_collapsed)
+            with open(path, 'w') as template_file:
+                template_file.write(_dumps(compacted, options.minify))
+        if file is not None:
+            print(report, file=file)
+        reports.append(report)
+    if file is not None and len(reports) > 1:
+        before, after = sum(r.before for r in reports), sum(r.after for r in reports)
+        print(f"{len(reports)} templates: {before} B -> {after} B "
+              f"({(before - after) / before if before else 0:.0%} smaller)", file=file)
+    return reports
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Minify and deduplicate the templates of a cloud assembly")
+    parser.add_argument("directory", help="cloud assembly directory (cdk.out)")
+    parser.add_argument("--dedupe-min-bytes", type=int, default=CompactOptions().dedupe_min_bytes,
+                        help="deduplicate strings at least this long (0 disables it)")
+    parser.add_argument("--keep-metadata", action="store_true")
+    parser.add_argument("--keep-tags", action="store_true", help="don't move common tags to the stack")
+    parser.add_argument("--report-only", action="store_true", help="print the report, leave the files")
+    args = parser.parse_args(argv)
+
+    compact_assembly(args.directory,
+                     CompactOptions(strip_metadata=not args.keep_metadata,
+                                    collapse_tags=not args.keep_tags,
+                                    dedupe_min_bytes=args.dedupe_min_bytes),
+                     write=not args.report_only,
+                     file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""Deploy plan of a cloud assembly against the templates last deployed.
+
+``cdk deploy`` of a stack whose template did not change still costs a
+CloudFormation changeset round trip.  Here the freshly synthesized templates
+are compared, offline, with snapshots of the templates as they were deployed
+(``cdk.deployed/<stack>.template.json`` by default), resource by resource:
+
+* ``add``/``remove``: the logical ID only exists on one side;
+* ``no-op``: identical once the CDK noise is gone (``aws:cdk:path`` metadata,
+  ``CDKMetadata``, ``Fn::FindInMap`` of literal keys, ``DependsOn``);
+* ``replace``: a property that can't be updated in place changed
+  (``REPLACEMENT_PROPERTIES``, per resource type), or the type itself; so did
+  the properties referencing a replaced resource, whose ID or attributes
+  change with it;
+* ``update``: anything else, ``update?`` for resource types the table
+  doesn't know (they might be replaced).
+
+Stack tags (the manifest's, where ``cdk_common.compact`` moves the tags every
+resource carries) are compared with the tags all the resources of the template
+share, as the ``StackTags`` section: a compacted template and its verbose
+original plan the same.  A stack without changes is skipped, one without a
+snapshot is created:
+
+    $ cdk synth
+    $ python -m cdk_common.deploy_plan cdk.out
+    $ cdk deploy $(python -m cdk_common.deploy_plan cdk.out --names)
+    $ python -m cdk_common.deploy_plan cdk.out --record    # once the deploy succeeded
+
+The snapshots are plain templates, next to a ``<stack>.tags.json`` when the
+stack has tags: commit them to share what was deployed, or record them from
+another checkout to plan against it.
+"""
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from cdk_common.compact import CDK_METADATA_CONDITION, CDK_METADATA_TYPE, CDK_PATH_METADATA, collapse_tags
+from cdk_common.template_graph import _references
+
+
+DEFAULT_SNAPSHOT_DIR = "cdk.deployed"
+STACK_ARTIFACT = "aws:cloudformation:stack"
+# Resource attributes CloudFormation compares; DependsOn alone is not an update
+RESOURCE_ATTRIBUTES = ("Metadata", "Condition", "DeletionPolicy", "UpdateReplacePolicy",
+                       "CreationPolicy", "UpdatePolicy")
+COMPARED_ATTRIBUTES = ("Type", "Properties") + RESOURCE_ATTRIBUTES
+# Pseudo section of the normalized templates holding the stack tags
+STACK_TAGS = "StackTags"
+
+ADD = "add"
+REMOVE = "remove"
+NO_OP = "no-op"
+UPDATE = "update"
+MAYBE_REPLACE = "update?"
+REPLACE = "replace"
+
+CREATE = "create"
+DEPLOY = "deploy"
+SKIP = "skip"
+
+# Every property change replaces the resource
+ALL = None
+
+# Properties whose update requires a replacement ("Update requires: Replacement"
+# in the CloudFormation reference), for the resource types the stacks create
+REPLACEMENT_PROPERTIES = {
+    "AWS::EC2::VPC": {"CidrBlock", "InstanceTenancy", "Ipv4IpamPoolId", "Ipv4NetmaskLength"},
+    "AWS::EC2::Subnet": {"AvailabilityZone", "AvailabilityZoneId", "CidrBlock", "VpcId", "OutpostArn"},
+    "AWS::EC2::RouteTable": {"VpcId"},
+    "AWS::EC2::SubnetRouteTableAssociation": {"SubnetId"},
+    "AWS::EC2::Route": {"RouteTableId", "DestinationCidrBlock", "DestinationIpv6CidrBlock",
+                        "DestinationPrefixListId"},
+    "AWS::EC2::InternetGateway": set(),
+    "AWS::EC2::VPCGatewayAttachment": set(),
+    "AWS::EC2::EIP": {"Domain", "PublicIpv4Pool"},
+    "AWS::EC2::NatGateway": {"AllocationId", "SubnetId", "ConnectivityType", "PrivateIpAddress"},
+    "AWS::EC2::VPCEndpoint": {"ServiceName", "VpcId", "VpcEndpointType"},
+    "AWS::EC2::SecurityGroup": {"GroupDescription", "GroupName", "VpcId"},
+    "AWS::EC2::SecurityGroupIngress": {"GroupId", "GroupName", "IpProtocol", "FromPort", "ToPort", "CidrIp",
+                                       "CidrIpv6", "SourcePrefixListId", "SourceSecurityGroupId",
+                                       "SourceSecurityGroupName", "SourceSecurityGroupOwnerId"},
+    "AWS::EC2::SecurityGroupEgress": {"GroupId", "IpProtocol", "FromPort", "ToPort", "CidrIp", "CidrIpv6",
+                                      "DestinationPrefixListId", "DestinationSecurityGroupId"},
+    "AWS::EC2::Instance": {"AvailabilityZone", "BlockDeviceMappings", "CpuOptions", "ElasticGpuSpecifications",
+                           "HibernationOptions", "ImageId", "Ipv6AddressCount", "Ipv6Addresses", "KeyName",
+                           "LaunchTemplate", "LicenseSpecifications", "NetworkInterfaces", "PlacementGroupName",
+                           "PrivateIpAddress", "SecurityGroups", "SubnetId"},
+    "AWS::EC2::LaunchTemplate": {"LaunchTemplateName"},
+    "AWS::EC2::PlacementGroup": {"Strategy", "SpreadLevel", "PartitionCount"},
+    "AWS::ElasticLoadBalancingV2::LoadBalancer": {"Name", "Scheme", "Type"},
+    "AWS::ElasticLoadBalancingV2::TargetGroup": {"Name", "Port", "Protocol", "ProtocolVersion", "TargetType",
+                                                 "VpcId", "IpAddressType"},
+    "AWS::ElasticLoadBalancingV2::Listener": {"LoadBalancerArn"},
+    "AWS::AutoScaling::AutoScalingGroup": {"AutoScalingGroupName", "InstanceId"},
+    "AWS::AutoScaling::ScalingPolicy": {"AutoScalingGroupName"},
+    "AWS::AutoScaling::WarmPool": {"AutoScalingGroupName"},
+    "AWS::CloudFront::Distribution": set(),
+    "AWS::CloudFront::CachePolicy": set(),
+    "AWS::CloudFront::CloudFrontOriginAccessIdentity": set(),
+    "AWS::S3::Bucket": {"BucketName", "ObjectLockEnabled"},
+    "AWS::S3::BucketPolicy": {"Bucket"},
+    "AWS::CloudWatch::Alarm": {"AlarmName"},
+    "AWS::CloudWatch::Dashboard": {"DashboardName"},
+    "AWS::SSM::Parameter": {"Name"},
+    "AWS::IAM::Role": {"RoleName", "Path"},
+    "AWS::IAM::InstanceProfile": {"InstanceProfileName", "Path"},
+    "AWS::ImageBuilder::Component": ALL,
+    "AWS::ImageBuilder::ImageRecipe": ALL,
+    "AWS::ImageBuilder::Image": ALL,
+    "AWS::ImageBuilder::InfrastructureConfiguration": {"Name"},
+    "AWS::ImageBuilder::ImagePipeline": {"Name"},
+    "AWS::CloudFormation::Stack": set(),
+}
+
+
+class ResourceChange(NamedTuple):
+    logical_id: str
+    resource_type: str
+    action: str
+    # Changed properties (or resource attributes, e.g. "Metadata")
+    properties: List[str] = []
+    # Replaced resources this one references, making ``properties`` change
+    caused_by: List[str] = []
+
+    def __str__(self) -> str:
+        details = ", ".join(self.properties)
+        if self.caused_by:
+            details += f" (via {', '.join(self.caused_by)})"
+        return f"{self.action:<8} {self.logical_id} {self.resource_type}{'  ' + details if details else ''}"
+
+
+class StackPlan(NamedTuple):
+    stack: str
+    action: str
+    changes: List[ResourceChange]
+    # Template sections other than Resources that differ (Outputs, Parameters, ...)
+    sections: List[str]
+
+    def counts(self) -> Dict[str, int]:
+        counts = {}  # type: Dict[str, int]
+        for change in self.changes:
+            counts[change.action] = counts.get(change.action, 0) + 1
+        return counts
+
+    def __str__(self) -> str:
+        if self.action == SKIP:
+            return f"{self.stack}: skip (unchanged)"
+        if self.action == CREATE:
+            return f"{self.stack}: create ({len(self.changes)} resources)"
+        summary = ", ".join(f"{count} {action}" for action, count in sorted(self.counts().items()))
+        if self.sections:
+            summary = ", ".join(filter(None, [summary, f"{'/'.join(self.sections)} changed"]))
+        lines = [f"{self.stack}: deploy ({summary})"]
+        lines += [f"  {change}" for change in self.changes]
+        return "\n".join(lines)
+
+
+def _resolve_mappings(value: Any, mappings: Dict[str, Any]) -> Any:
+    if isinstance(value, dict):
+        arguments = value.get("Fn::FindInMap")
+        if len(value) == 1 and isinstance(arguments, list) and len(arguments) == 3 \
+                and all(isinstance(argument, str) for argument in arguments):
+            try:
+                return mappings[arguments[0]][arguments[1]][arguments[2]]
+            except KeyError:
+                return value
+        return {key: _resolve_mappings(item, mappings) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve_mappings(item, mappings) for item in value]
+    return value
+
+
+def normalize(template: Dict[str, Any], stack_tags: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """``template`` without what changes on every synth or has no effect on
+    the deployed resources.  The tags all its resources share are moved, with
+    ``stack_tags`` (which win), to ``STACK_TAGS``: compact templates compare
+    equal to verbose ones when given the tags of their manifest."""
+    mappings = template.get("Mappings", {})
+    normalized = _resolve_mappings(template, mappings)
+    resources = {}
+    for logical_id, resource in normalized.get("Resources", {}).items():
+        if resource.get("Type") == CDK_METADATA_TYPE:
+            continue
+        resource = {key: value for key, value in resource.items() if key in COMPARED_ATTRIBUTES}
+        metadata = {key: value for key, value in resource.get("Metadata", {}).items() if key != CDK_PATH_METADATA}
+        resource.pop("Metadata", None)
+        if metadata:
+            resource["Metadata"] = metadata
+        resources[logical_id] = resource
+    normalized["Resources"] = resources
+    conditions = {name: condition for name, condition in normalized.get("Conditions", {}).items()
+                  if name != CDK_METADATA_CONDITION}
+    normalized.pop("Conditions", None)
+    if conditions:
+        normalized["Conditions"] = conditions
+    # Only reachable through Fn::FindInMap, compared resolved
+    normalized.pop("Mappings", None)
+    tags = dict(collapse_tags(normalized), **(stack_tags or {}))
+    if tags:
+        normalized[STACK_TAGS] = tags
+    return normalized
+
+
+def _changed_properties(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    old_properties, new_properties = old.get("Properties", {}), new.get("Properties", {})
+    changed = sorted(name for name in set(old_properties) | set(new_properties)
+                     if old_properties.get(name) != new_properties.get(name))
+    changed += [attribute for attribute in RESOURCE_ATTRIBUTES if old.get(attribute) != new.get(attribute)]
+    return changed
+
+
+def _action(resource_type: str, properties: Iterable[str]) -> str:
+    properties = list(properties)
+    if not properties:
+        return NO_OP
+    if resource_type not in REPLACEMENT_PROPERTIES:
+        return MAYBE_REPLACE
+    replacing = REPLACEMENT_PROPERTIES[resource_type]
+    if replacing is ALL and any(name not in RESOURCE_ATTRIBUTES for name in properties):
+        return REPLACE
+    if replacing and set(properties) & replacing:
+        return REPLACE
+    return UPDATE
+
+
+def diff_templates(old: Optional[Dict[str, Any]], new: Dict[str, Any], stack: str = "",
+                   old_tags: Optional[Dict[str, str]] = None,
+                   new_tags: Optional[Dict[str, str]] = None) -> StackPlan:
+    """Plan of deploying ``new`` over ``old`` (None: the stack doesn't exist),
+    with the stack tags of each."""
+    new = normalize(new, new_tags)
+    if old is None:
+        changes = [ResourceChange(logical_id, resource.get("Type", ""), ADD)
+                   for logical_id, resource in sorted(new["Resources"].items())]
+        return StackPlan(stack, CREATE, changes, [])
+    old = normalize(old, old_tags)
+    old_resources, new_resources = old["Resources"], new["Resources"]
+
+    changed = {}  # type: Dict[str, Set[str]]
+    for logical_id in set(old_resources) & set(new_resources):
+        if old_resources[logical_id].get("Type") != new_resources[logical_id].get("Type"):
+            changed[logical_id] = {"Type"}
+        else:
+            changed[logical_id] = set(_changed_properties(old_resources[logical_id], new_resources[logical_id]))
+
+    # A replaced resource gets a new physical ID (and attributes): the
+    # properties referencing it change too, which can replace their resource
+    caused_by = {}  # type: Dict[str, Set[str]]
+    replaced = set()  # type: Set[str]
+    while True:
+        newly_replaced = {logical_id for logical_id, properties in changed.items()
+                          if logical_id not in replaced
+                          and ("Type" in properties
+                               or _action(new_resources[logical_id].get("Type", ""), properties) == REPLACE)}
+        if not newly_replaced:
+            break
+        replaced |= newly_replaced
+        for logical_id, resource in new_resources.items():
+            if logical_id not in changed:
+                continue
+            for name, value in resource.get("Properties", {}).items():
+                targets = _references(value, set()) & newly_replaced
+                if targets:
+                    changed[logical_id].add(name)
+                    caused_by.setdefault(logical_id, set()).update(targets)
+
+    changes = []
+    for logical_id in sorted(set(old_resources) | set(new_resources)):
+        if logical_id not in new_resources:
+            changes.append(ResourceChange(logical_id, old_resources[logical_id].get("Type", ""), REMOVE))
+        elif logical_id not in old_resources:
+            changes.append(ResourceChange(logical_id, new_resources[logical_id].get("Type", ""), ADD))
+        elif changed[logical_id]:
+            resource_type = new_resources[logical_id].get("Type", "")
+            action = REPLACE if logical_id in replaced else _action(resource_type, changed[logical_id])
+            changes.append(ResourceChange(logical_id, resource_type, action, sorted(changed[logical_id]),
+                                          sorted(caused_by.get(logical_id, ()))))
+
+    sections = sorted(name for name in set(old) | set(new)
+                      if name != "Resources" and old.get(name) != new.get(name))
+    return StackPlan(stack, DEPLOY if changes or sections else SKIP, changes, sections)
+
+
+def _stack_properties(directory: str) -> Dict[str, Dict[str, Any]]:
+    with open(os.path.join(directory, "manifest.json"), 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    return {artifact_id: artifact["properties"]
+            for artifact_id, artifact in sorted(manifest.get("artifacts", {}).items())
+            if artifact.get("type") == STACK_ARTIFACT}
+
+
+def stack_templates(directory: str) -> Dict[str, str]:
+    """{stack artifact ID: template path} of a cloud assembly."""
+    return {artifact_id: os.path.join(directory, properties["templateFile"])
+            for artifact_id, properties in _stack_properties(directory).items()}
+
+
+def stack_tags(directory: str) -> Dict[str, Dict[str, str]]:
+    """{stack artifact ID: stack tags} of a cloud assembly."""
+    return {artifact_id: properties.get("tags", {})
+            for artifact_id, properties in _stack_properties(directory).items()}
+
+
+def _snapshot_path(snapshots: str, stack: str) -> str:
+    return os.path.join(snapshots, f"{stack}.template.json")
+
+
+def _tags_path(snapshots: str, stack: str) -> str:
+    return os.path.join(snapshots, f"{stack}.tags.json")
+
+
+def plan_assembly(directory: str, snapshots: str = DEFAULT_SNAPSHOT_DIR,
+                  stacks: Optional[Iterable[str]] = None) -> List[StackPlan]:
+    """Plan of every stack of the assembly (or of ``stacks``) against its snapshot."""
+    templates, tags = stack_templates(directory), stack_tags(directory)
+    plans = []
+    for stack in stacks or templates:
+        if stack not in templates:
+            raise KeyError(f"No stack '{stack}' in {directory}, expected one of {sorted(templates)}")
+        with open(templates[stack], 'r') as template_file:
+            new = json.load(template_file)
+        old, old_tags = None, {}
+        if os.path.exists(_snapshot_path(snapshots, stack)):
+            with open(_snapshot_path(snapshots, stack), 'r') as snapshot_file:
+                old = json.load(snapshot_file)
+        if os.path.exists(_tags_path(snapshots, stack)):
+            with open(_tags_path(snapshots, stack), 'r') as tags_file:
+                old_tags = json.load(tags_file)
+        plans.append(diff_templates(old, new, stack, old_tags, tags[stack]))
+    return plans
+
+
+def record(directory: str, snapshots: str = DEFAULT_SNAPSHOT_DIR,
+           stacks: Optional[Iterable[str]] = None) -> List[str]:
+    """Store the templates (and stack tags) of ``stacks`` (all of them by
+    default) as deployed."""
+    templates, tags = stack_templates(directory), stack_tags(directory)
+    os.makedirs(snapshots, exist_ok=True)
+    recorded = []
+    for stack in stacks or templates:
+        if stack not in templates:
+            raise KeyError(f"No stack '{stack}' in {directory}, expected one of {sorted(templates)}")
+        shutil.copyfile(templates[stack], _snapshot_path(snapshots, stack))
+        if tags[stack]:
+            with open(_tags_path(snapshots, stack), 'w') as tags_file:
+                json.dump(tags[stack], tags_file, indent=1, sort_keys=True)
+        elif os.path.exists(_tags_path(snapshots, stack)):
+            os.remove(_tags_path(snapshots, stack))
+        recorded.append(stack)
+    return recorded
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Deploy plan of a cloud assembly against the deployed snapshots")
+    parser.add_argument("directory", help="cloud assembly directory (cdk.out)")
+    parser.add_argument("stacks", nargs="*", help="stacks to plan or record (default: all)")
+    parser.add_argument("--snapshots", default=DEFAULT_SNAPSHOT_DIR,
+                        help=f"directory of the deployed templates (default {DEFAULT_SNAPSHOT_DIR})")
+    parser.add_argument("--names", action="store_true", help="only print the stacks that need a deploy")
+    parser.add_argument("--json", action="store_true", help="print the plan as JSON")
+    parser.add_argument("--record", action="store_true", help="store the templates as deployed")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.record:
+            for stack in record(args.directory, args.snapshots, args.stacks):
+                print(f"{stack}: recorded")
+            return
+        plans = plan_assembly(args.directory, args.snapshots, args.stacks)
+    except KeyError as error:
+        parser.error(str(error.args[0]))
+
+    if args.names:
+        print(" ".join(plan.stack for plan in plans if plan.action != SKIP))
+    elif args.json:
+        print(json.dumps([{"stack": plan.stack, "action": plan.action, "sections": plan.sections,
+                           "changes": [change._asdict() for change in plan.changes]} for plan in plans], indent=1))
+    else:
+        for plan in plans:
+            print(plan)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Shared body of the ``app.py`` of every project.
+
+    synth_app(__file__, "create_basic_vpc",
+              [StackSpec("create-basic-vpc", "create_basic_vpc.create_basic_vpc_stack:CreateBasicVpcStack")])
+
+builds a ``core.App`` with the given stacks and synthesizes it, with the
+synth cache, lookup prefetch, CloudWatch instrumentation
+(``cdk_common.monitoring``), optional profiling (``CDK_PROFILE``), optional
+``DependsOn`` pruning (``-c dependencies:prune=...``), nested stack
+sharding of large templates (``cdk_common.sharding``) and optional template
+compaction (``-c compact=true``, ``cdk_common.compact``).  Nothing from
+``aws_cdk`` is imported when the synth cache has the assembly already.
+
+``-c stacks=<id>[,<id>...]`` (glob patterns allowed) restricts the app to
+some stacks: the others are neither imported nor constructed, which keeps
+``cdk ls``/``cdk diff`` of one stack from paying for all of them.
+"""
+import fnmatch
+import importlib
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+from cdk_common.parallel_synth import StackSpec
+from cdk_common.profiler import Profiler
+from cdk_common.synth_cache import SynthCache, app_context
+
+
+def _stack_class(spec: StackSpec):
+    sys.path[:0] = [path for path in spec.paths if path not in sys.path]
+    module_name, class_name = spec.target.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def select_specs(specs: Sequence[StackSpec], context: Dict[str, Any]) -> List[StackSpec]:
+    """The specs named by the ``stacks`` context value, all of them when unset."""
+    selection = context.get("stacks")
+    if not selection:
+        return list(specs)
+    patterns = selection.split(",") if isinstance(selection, str) else list(selection)
+    selected = [spec for spec in specs
+                if any(fnmatch.fnmatchcase(spec.stack_id, pattern.strip()) for pattern in patterns)]
+    if not selected:
+        raise ValueError(f"stacks: '{selection}' matches none of {[spec.stack_id for spec in specs]}")
+    return selected
+
+
+def build_assembly(specs: Sequence[StackSpec],
+                   outdir: Optional[str] = None,
+                   profiler: Optional[Profiler] = None) -> str:
+    """Construct ``specs`` in one ``core.App`` and synthesize it; returns the
+    assembly directory.  Phases are recorded on ``profiler`` when given."""
+    from contextlib import ExitStack
+
+    def phase(name: str):
+        return profiler.phase(name) if profiler else ExitStack()
+
+    with phase("import"):
+        from aws_cdk import core
+
+        from cdk_common.compact import CompactOptions, compact_assembly
+        from cdk_common.lookups import Lookups
+        from cdk_common.monitoring import Instrumentation, MonitoringOptions
+        from cdk_common.sharding import shard_assembly
+        from cdk_common.template_graph import prune_assembly
+
+        stack_classes = [_stack_class(spec) for spec in specs]
+
+    contexts = [spec.context for spec in specs if spec.context]
+    if len(contexts) > 1 and any(context != contexts[0] for context in contexts):
+        raise ValueError("Stacks with different context defaults can't share an app, "
+                         "synthesize them with synth_parallel")
+    app = core.App(outdir=outdir, context=contexts[0] if contexts else None)
+    with phase("lookups"):
+        # Resolve home IP, AMI and AZs concurrently (and from cache) before building the stacks
+        Lookups.for_scope(app).prefetch()
+
+    # Dashboard and alarms of the load balancers, NAT gateways and instances (-c monitoring=false to skip)
+    monitoring = MonitoringOptions.from_context(app.node.try_get_context("monitoring"))
+    for spec, stack_class in zip(specs, stack_classes):
+        with phase(f"construct:{spec.stack_id}"):
+            env = None
+            if spec.account or spec.region:
+                env = core.Environment(account=spec.account, region=spec.region)
+            stack = stack_class(app, spec.stack_id, env=env)
+            if monitoring.enabled:
+                core.Aspects.of(stack).add(Instrumentation(monitoring))
+
+    with phase("synth"):
+        assembly = app.synth().directory
+
+    # -c dependencies:prune=redundant drops the DependsOn edges references already imply
+    prune = app.node.try_get_context("dependencies:prune")
+    if prune:
+        with phase("prune"):
+            prune_assembly(assembly, prune)
+
+    # Templates over the CloudFormation limits (or -c sharding:maxResources=N)
+    # are split into nested stacks
+    max_resources = app.node.try_get_context("sharding:maxResources")
+    with phase("shard"):
+        shard_assembly(assembly, int(max_resources) if max_resources else None)
+
+    # Minified templates without CDK metadata, common tags and large strings
+    # stored once, with a size report per stack
+    compact = CompactOptions.from_context(app.node.try_get_context("compact"))
+    if compact:
+        with phase("compact"):
+            compact_assembly(assembly, compact)
+    return assembly
+
+
+def synth_app(app_file: str, package: str, specs: Sequence[StackSpec],
+              context: Optional[Dict[str, Any]] = None) -> str:
+    context = app_context() if context is None else context
+    specs = select_specs(specs, context)
+    profiler = Profiler.from_context(context, name=package)
+    # A cache hit has nothing to profile
+    cache = SynthCache.for_app(app_file, package=package, context=context,
+                               rebuild=True if profiler else None)
+    if profiler:
+        profiler.install()
+    assembly = cache.run(lambda: build_assembly(specs, profiler=profiler))
+    if profiler:
+        profiler.uninstall()
+        profiler.export()
+    return assembly
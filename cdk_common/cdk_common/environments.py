@@ -0,0 +1,128 @@
+"""Environment matrix of the root app: every stack once per region/account.
+
+The ``environments`` context value of the root ``app.py`` is either a
+mapping of named environments (what it has always been):
+
+    "environments": {"dev": {"region": "eu-central-1"},
+                     "prod": {"account": "123456789012", "region": "eu-west-1",
+                              "context": {"instance_profile": "compute"},
+                              "cidr": "10.20.0.0/16"}}
+
+or a matrix, expanded into one environment per (account, region):
+
+    "environments": {"regions": ["eu-central-1", "eu-west-1", "us-east-1", ...],
+                     "accounts": ["123456789012"],
+                     "cidr_pool": "10.0.0.0/8",
+                     "context": {"instance_profile": "burstable"}}
+
+Either can also live in a JSON file, ``-c environments=environments.json``
+(relative to the repository root).
+
+AZs follow the region of every stack through the lookups.  VPC CIDRs are
+adapted when the environments have address blocks: the matrix form gives
+the n-th environment the n-th /16 of ``cidr_pool``, named environments use
+their ``cidr``.  Within its block every stack gets its own /20, by its
+position in the stack list, so adding environments or stacks at the end
+never moves the existing VPCs.
+
+``prefetch_lookups()`` resolves the lookups of all the regions concurrently
+in the parent process, into the shared lookup cache the workers then read.
+"""
+import ipaddress
+import json
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+DEFAULT_CIDR_POOL = "10.0.0.0/8"
+ENVIRONMENT_PREFIX = 16
+VPC_PREFIX = 20
+
+
+class Environment(NamedTuple):
+    name: str
+    account: Optional[str] = None
+    region: Optional[str] = None
+    # Context defaults of the stacks of this environment
+    context: Optional[Dict[str, Any]] = None
+    # Address block of the VPCs of this environment, None keeps the stacks' own CIDRs
+    cidr: Optional[str] = None
+
+    def vpc_cidr(self, stack_index: int) -> Optional[str]:
+        """The /20 of the ``stack_index``-th stack in the block of the environment."""
+        if self.cidr is None:
+            return None
+        block = ipaddress.IPv4Network(self.cidr)
+        if block.prefixlen > VPC_PREFIX:
+            raise ValueError(f"environments: {self.name} block {self.cidr} is smaller than a /{VPC_PREFIX}")
+        if stack_index >= 2 ** (VPC_PREFIX - block.prefixlen):
+            raise ValueError(f"environments: {self.name} block {self.cidr} has no room for stack #{stack_index}")
+        size = 2 ** (32 - VPC_PREFIX)
+        return str(ipaddress.IPv4Network((int(block.network_address) + stack_index * size, VPC_PREFIX)))
+
+    def stack_context(self, stack_index: int) -> Dict[str, Any]:
+        context = dict(self.context or {})
+        # Names the account/region-wide resources of the stacks (AMI pipelines, ...)
+        context.setdefault("environment", self.name)
+        vpc_cidr = self.vpc_cidr(stack_index)
+        if vpc_cidr:
+            context.setdefault("vpc_cidr", vpc_cidr)
+        return context
+
+
+def _expand_matrix(value: Dict[str, Any]) -> List[Environment]:
+    from cdk_common.cidr import CidrError
+
+    accounts = value.get("accounts") or [None]
+    pool = ipaddress.IPv4Network(value.get("cidr_pool") or DEFAULT_CIDR_POOL)
+    blocks = pool.subnets(new_prefix=ENVIRONMENT_PREFIX)
+    environments = []
+    for account in accounts:
+        for region in value["regions"]:
+            name = f"{account}-{region}" if len(accounts) > 1 else region
+            try:
+                cidr = str(next(blocks))
+            except StopIteration:
+                raise CidrError(f"environments: cidr_pool {pool} has no /{ENVIRONMENT_PREFIX} left for {name}")
+            environments.append(Environment(name, account, region, dict(value.get("context") or {}), cidr))
+    return environments
+
+
+def load_environments(value: Any, base_dir: str = ".") -> List[Environment]:
+    """Environments described by the ``environments`` context value (mapping,
+    matrix, or path of a JSON file holding either)."""
+    from cdk_common.cidr import CidrIndex
+
+    if not value:
+        return []
+    if isinstance(value, str):
+        with open(os.path.join(base_dir, value), 'r') as environments_file:
+            value = json.load(environments_file)
+    if "regions" in value:
+        environments = _expand_matrix(value)
+    else:
+        environments = [Environment(name, env.get("account"), env.get("region"),
+                                    dict(env.get("context") or {}), env.get("cidr"))
+                        for name, env in value.items()]
+
+    # Fails on two environments sharing addresses
+    index = CidrIndex()
+    for environment in environments:
+        if environment.cidr:
+            index.add(environment.cidr, environment.name)
+    return environments
+
+
+def prefetch_lookups(environments: List[Environment], context: Callable[[str], Any]) -> Dict[str, Dict[str, Any]]:
+    """Resolve the lookups of every region concurrently (and into the lookup
+    cache), before the workers synthesizing the stacks start."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from cdk_common.lookups import Lookups
+
+    regions = sorted({environment.region for environment in environments if environment.region})
+    if not regions:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(regions)) as pool:
+        futures = {region: pool.submit(Lookups.from_context(context, region).prefetch) for region in regions}
+        return {region: future.result() for region, future in futures.items()}
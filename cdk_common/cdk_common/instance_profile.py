@@ -0,0 +1,223 @@
+"""Instance type, placement, storage and monitoring of the EC2 instances.
+
+All instances used to be ``t2.micro`` on the AMI's gp2 root volume: once the
+CPU credits run out the instance drops to its baseline and latency follows.
+``InstanceProfile`` describes what the instances of a stack run on and is
+applied to ``CfnInstance``s and launch templates alike:
+
+    profile = InstanceProfile.from_context(self.node.try_get_context("instance_profile"))
+    instance = ec2.CfnInstance(self, ..., instance_type=profile.instance_type)
+    profile.apply(instance)
+
+The ``instance_profile`` context value is a preset name or a JSON object
+overriding fields of a preset, the same way as ``lb_profile``:
+
+    $ cdk synth -c instance_profile=compute
+    $ cdk synth -c instance_profile='{"preset": "compute", "instance_type": "c5.xlarge"}'
+
+Per environment of the root app it goes in the ``context`` of the
+environment (see ``app.py``).
+"""
+from typing import TYPE_CHECKING, Any, Dict, Iterable, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    from aws_cdk import core
+    from aws_cdk import aws_ec2 as ec2
+
+
+# Root device of the Amazon Linux 2 AMIs
+ROOT_DEVICE = "/dev/xvda"
+PLACEMENT_STRATEGIES = ("cluster", "spread")
+BURSTABLE_FAMILIES = ("t2", "t3", "t3a", "t4g")
+# Previous generation families without the Elastic Network Adapter (t2 has
+# no enhanced networking at all, c4/m4 use the Intel 82599 VF)
+NON_ENA_FAMILIES = ("t1", "t2", "m1", "m2", "m3", "m4", "c1", "c3", "c4", "r3", "i2", "d2")
+PROVISIONED_VOLUME_TYPES = ("gp3", "io1", "io2")
+LAUNCH_TEMPLATE_ID = "InstanceProfileLT"
+PLACEMENT_GROUP_ID = "InstanceProfilePG"
+
+
+class InstanceProfile(NamedTuple):
+    """What the instances of a stack run on.  The defaults are the instances
+    as they were before profiles: ``t2.micro`` and everything else left to AWS."""
+    instance_type: str = "t2.micro"
+    # "unlimited" keeps burstable instances above their baseline when out of credits (billed)
+    cpu_credits: Optional[str] = None
+    # "cluster": low latency between the instances, which must share an AZ
+    # (see for_azs()); "spread": distinct racks, any AZ
+    placement: Optional[str] = None
+    # Root volume, None keeps the AMI's (gp2)
+    volume_type: Optional[str] = None
+    volume_size: int = 8
+    iops: Optional[int] = None
+    # MiB/s, gp3 only
+    throughput: Optional[int] = None
+    ebs_optimized: Optional[bool] = None
+    # ENA is not a launch setting: the instance family and the AMI (Amazon Linux 2
+    # has the driver) give it.  This only refuses the families without it
+    require_ena: bool = False
+    # 1-minute CloudWatch metrics instead of 5
+    detailed_monitoring: bool = False
+
+    @classmethod
+    def from_context(cls, value: Any) -> "InstanceProfile":
+        if not value:
+            return PRESETS["default"]
+        if isinstance(value, str) and value.lstrip().startswith("{"):
+            import json
+            value = json.loads(value)
+        if isinstance(value, str):
+            value = {"preset": value}
+        value = dict(value)
+        preset = value.pop("preset", "default")
+        if preset not in PRESETS:
+            raise ValueError(f"instance_profile: unknown preset '{preset}', expected one of {sorted(PRESETS)}")
+        return PRESETS[preset]._replace(**value).validate()
+
+    @property
+    def family(self) -> str:
+        return self.instance_type.split(".")[0]
+
+    def validate(self) -> "InstanceProfile":
+        if "." not in self.instance_type:
+            raise ValueError(f"instance_profile: '{self.instance_type}' is not an instance type")
+        if self.cpu_credits not in (None, "standard", "unlimited"):
+            raise ValueError(f"instance_profile: unknown cpu_credits '{self.cpu_credits}'")
+        if self.cpu_credits and self.family not in BURSTABLE_FAMILIES:
+            raise ValueError(f"instance_profile: cpu_credits only applies to {', '.join(BURSTABLE_FAMILIES)}")
+        if self.placement not in (None,) + PLACEMENT_STRATEGIES:
+            raise ValueError(f"instance_profile: placement must be one of {PLACEMENT_STRATEGIES}")
+        if self.placement == "cluster" and self.family in BURSTABLE_FAMILIES:
+            raise ValueError("instance_profile: burstable instances can't be in a cluster placement group")
+        if self.require_ena and self.family in NON_ENA_FAMILIES:
+            raise ValueError(f"instance_profile: {self.family} instances don't support ENA")
+        if (self.iops or self.throughput) and self.volume_type not in PROVISIONED_VOLUME_TYPES:
+            raise ValueError(f"instance_profile: iops/throughput need a {'/'.join(PROVISIONED_VOLUME_TYPES)} volume")
+        if self.throughput and self.volume_type != "gp3":
+            raise ValueError("instance_profile: throughput only applies to gp3 volumes")
+        if self.volume_type == "gp3":
+            if self.iops and not 3000 <= self.iops <= min(16000, 500 * self.volume_size):
+                raise ValueError("instance_profile: gp3 iops must be between 3000 and 500 per GiB (16000 at most)")
+            if self.throughput and not 125 <= self.throughput <= min(1000, (self.iops or 3000) // 4):
+                raise ValueError("instance_profile: gp3 throughput must be between 125 and iops / 4 MiB/s "
+                                 "(1000 at most)")
+        return self
+
+    def for_azs(self, azs: Iterable[str], scope: Optional["core.Construct"] = None) -> "InstanceProfile":
+        """The profile for instances spread over ``azs``: a cluster placement
+        group is confined to one AZ, so it becomes a spread one (with a warning
+        on ``scope``) when there are several."""
+        azs = set(azs)
+        if self.placement != "cluster" or len(azs) <= 1:
+            return self
+        if scope is not None:
+            from aws_cdk import core
+
+            core.Annotations.of(scope).add_warning(
+                f"instance_profile: cluster placement needs a single AZ, the instances span "
+                f"{', '.join(sorted(azs))}; using a spread placement group instead")
+        return self._replace(placement="spread")
+
+    def placement_group(self, scope: "core.Construct") -> Optional["ec2.CfnPlacementGroup"]:
+        """The placement group of the instances of ``scope``, created once."""
+        if not self.placement:
+            return None
+        from aws_cdk import aws_ec2 as ec2
+
+        return (scope.node.try_find_child(PLACEMENT_GROUP_ID)
+                or ec2.CfnPlacementGroup(scope, id=PLACEMENT_GROUP_ID, strategy=self.placement))
+
+    def launch_template_data(self, scope: "core.Construct") -> Dict[str, Any]:
+        """Keyword arguments for ``CfnLaunchTemplate.LaunchTemplateDataProperty``,
+        complete it with ``add_overrides()``."""
+        from aws_cdk import aws_ec2 as ec2
+
+        LaunchTemplate = ec2.CfnLaunchTemplate
+        data = {"instance_type": self.instance_type}  # type: Dict[str, Any]
+        if self.cpu_credits:
+            data["credit_specification"] = LaunchTemplate.CreditSpecificationProperty(cpu_credits=self.cpu_credits)
+        if self.detailed_monitoring:
+            data["monitoring"] = LaunchTemplate.MonitoringProperty(enabled=True)
+        if self.ebs_optimized is not None:
+            data["ebs_optimized"] = self.ebs_optimized
+        placement_group = self.placement_group(scope)
+        if placement_group is not None:
+            data["placement"] = LaunchTemplate.PlacementProperty(group_name=placement_group.ref)
+        if self.volume_type:
+            data["block_device_mappings"] = [LaunchTemplate.BlockDeviceMappingProperty(
+                device_name=ROOT_DEVICE,
+                ebs=LaunchTemplate.EbsProperty(volume_type=self.volume_type,
+                                               volume_size=self.volume_size,
+                                               iops=self.iops,
+                                               delete_on_termination=True))]
+        return data
+
+    def add_overrides(self, launch_template: "ec2.CfnLaunchTemplate") -> None:
+        # Plain override: gp3 throughput is newer than the pinned aws-cdk version
+        if self.throughput:
+            launch_template.add_property_override("LaunchTemplateData.BlockDeviceMappings.0.Ebs.Throughput",
+                                                  self.throughput)
+
+    def launch_template(self, scope: "core.Construct") -> "ec2.CfnLaunchTemplate":
+        """Launch template holding the root volume of the instances of ``scope``
+        (``AWS::EC2::Instance`` has no gp3 throughput), created once."""
+        existing = scope.node.try_find_child(LAUNCH_TEMPLATE_ID)
+        if existing is not None:
+            return existing
+        from aws_cdk import aws_ec2 as ec2
+
+        data = self.launch_template_data(scope)
+        launch_template = ec2.CfnLaunchTemplate(scope, id=LAUNCH_TEMPLATE_ID,
+                                                launch_template_data=ec2.CfnLaunchTemplate.LaunchTemplateDataProperty(
+                                                    block_device_mappings=data["block_device_mappings"]))
+        self.add_overrides(launch_template)
+        return launch_template
+
+    def apply(self, instance: "ec2.CfnInstance") -> None:
+        """Set the placement, storage, credit and monitoring properties of
+        ``instance`` (its type is set when it is created)."""
+        from aws_cdk import aws_ec2 as ec2
+
+        scope = instance.node.scope
+        if self.cpu_credits:
+            instance.credit_specification = ec2.CfnInstance.CreditSpecificationProperty(cpu_credits=self.cpu_credits)
+        if self.detailed_monitoring:
+            instance.monitoring = True
+        if self.ebs_optimized is not None:
+            instance.ebs_optimized = self.ebs_optimized
+        placement_group = self.placement_group(scope)
+        if placement_group is not None:
+            instance.placement_group_name = placement_group.ref
+        if self.volume_type:
+            launch_template = self.launch_template(scope)
+            instance.launch_template = ec2.CfnInstance.LaunchTemplateSpecificationProperty(
+                launch_template_id=launch_template.ref,
+                version=launch_template.attr_latest_version_number)
+
+
+PRESETS = {
+    "default": InstanceProfile(),
+    # Current generation burstable, never throttled, gp3 root volume
+    "burstable": InstanceProfile(instance_type="t3.micro",
+                                 cpu_credits="unlimited",
+                                 volume_type="gp3",
+                                 require_ena=True),
+    # Sustained load: fixed performance instances on distinct racks, provisioned gp3
+    "compute": InstanceProfile(instance_type="c5.large",
+                               placement="spread",
+                               volume_type="gp3",
+                               volume_size=20,
+                               iops=4000,
+                               throughput=250,
+                               ebs_optimized=True,
+                               require_ena=True,
+                               detailed_monitoring=True),
+    # Lowest latency between instances of a single AZ (instance_creation)
+    "network": InstanceProfile(instance_type="c5n.large",
+                               placement="cluster",
+                               volume_type="gp3",
+                               volume_size=20,
+                               ebs_optimized=True,
+                               require_ena=True,
+                               detailed_monitoring=True),
+}
@@ -0,0 +1,351 @@
+"""Cached, timeout-bounded lookups used while synthesizing the stacks.
+
+The stacks need a few values that come from outside the CDK app: the
+operator's public IP (for the SG ingress rules), an AMI ID, the AMIs baked by
+the image pipelines and the list of availability zones of the target region.
+Resolving those on every synth made ``cdk synth`` slow and made it hang
+whenever the IP service stalled, so every lookup goes through here:
+
+* results are cached on disk with a TTL, in the same flat key/value layout as
+  ``cdk.context.json`` (by default the cache *is* ``cdk.context.json``);
+* every network call is bounded by a connect/read timeout and an overall
+  deadline per lookup;
+* ``prefetch()`` resolves all lookups concurrently (the context is read
+  beforehand, jsii can't be called from the worker threads);
+* offline mode (``-c lookups:offline=true`` or ``CDK_LOOKUPS_OFFLINE=1``)
+  never touches the network and serves expired cache entries or defaults.
+
+Context values always win over lookups, e.g. ``cdk synth -c home_ip=1.2.3.4``.
+"""
+import copy
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+DEFAULT_CACHE_FILE = "cdk.context.json"
+DEFAULT_REGION = "eu-central-1"
+DEFAULT_TTL = 24 * 3600
+HOME_IP_TTL = 3600
+# A new bake is picked up by the stacks within this time
+BAKED_AMI_TTL = 3600
+
+CACHE_KEY_PREFIX = "lookups:"
+
+# Used when no lookup is possible (offline, no credentials, ...)
+DEFAULT_AMIS = {
+    "eu-central-1": "ami-0de9f803fcac87f46",
+}
+# Zone names vary per region (no us-east-1c for some accounts, ap-northeast-1
+# has a/c/d): other regions need -c availability_zones=... when offline
+DEFAULT_AZS = {
+    "eu-central-1": ["eu-central-1a", "eu-central-1b", "eu-central-1c"],
+}
+AMI_SSM_PARAMETER = "/aws/service/ami-amazon-linux-latest/amzn2-ami-hvm-x86_64-gp2"
+# Other regions: CloudFormation resolves the same parameter at deploy time
+AMI_DYNAMIC_REFERENCE = "{{resolve:ssm:%s}}" % AMI_SSM_PARAMETER
+# The image pipelines publish their latest AMI under <prefix><image name>
+BAKED_AMI_SSM_PREFIX = "/cdk/ami/"
+# AWS-managed prefix list of the servers CloudFront fetches from origins with
+CLOUDFRONT_PREFIX_LIST = "com.amazonaws.global.cloudfront.origin-facing"
+
+HOME_IP_PROVIDERS = (
+    ("https://api.ipify.org?format=json", "ip"),
+    ("https://api.my-ip.io/ip.json", "ip"),
+    ("https://checkip.amazonaws.com", None),
+)
+
+
+class LookupFailedError(Exception):
+    pass
+
+
+class LookupCache:
+    """TTL cache persisted in a cdk.context.json-compatible file.
+
+    Every entry is stored under ``lookups:<key>`` as
+    ``{"value": ..., "expiresAt": <unix time>}`` next to whatever the CDK CLI
+    keeps in the same file, which is left untouched.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILE, clock: Callable[[], float] = time.time) -> None:
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    @staticmethod
+    def is_entry(key: str, value: Any) -> bool:
+        """Whether a cdk.context.json key/value pair is a cached lookup."""
+        return key.startswith(CACHE_KEY_PREFIX) and isinstance(value, dict) and "expiresAt" in value
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, 'r') as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def get(self, key: str, allow_expired: bool = False) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(CACHE_KEY_PREFIX + key)
+        if not isinstance(entry, dict) or "value" not in entry:
+            return None
+        if not allow_expired and entry.get("expiresAt", 0) < self._clock():
+            return None
+        return entry["value"]
+
+    def put(self, key: str, value: Any, ttl: float = DEFAULT_TTL) -> None:
+        with self._lock:
+            self._entries[CACHE_KEY_PREFIX + key] = {"value": value,
+                                                     "expiresAt": int(self._clock() + ttl)}
+            self._save()
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(CACHE_KEY_PREFIX)]:
+                del self._entries[key]
+            self._save()
+
+    def _save(self) -> None:
+        # Merge with what is on disk so keys written by the CDK CLI (or another
+        # synth) in the meantime survive, then replace the file atomically.
+        on_disk = self._load()
+        on_disk.update(self._entries)
+        self._entries = on_disk
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as cache_file:
+                json.dump(self._entries, cache_file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # A read-only checkout must not break synth, the cache is best effort
+            pass
+
+
+def _is_truthy(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+class Lookups:
+    """Resolves and caches the external values used by the stacks."""
+
+    _shared = {}  # type: Dict[Tuple[str, str, bool], Lookups]
+    # One cache per file, shared by the regions, so concurrent saves don't drop entries
+    _caches = {}  # type: Dict[str, LookupCache]
+    _shared_lock = threading.Lock()
+
+    def __init__(self,
+                 cache: Optional[LookupCache] = None,
+                 region: str = DEFAULT_REGION,
+                 offline: bool = False,
+                 timeout: Tuple[float, float] = (2.0, 3.0),
+                 deadline: float = 8.0,
+                 context: Optional[Callable[[str], Any]] = None) -> None:
+        self.cache = cache if cache is not None else LookupCache()
+        self.region = region
+        self.offline = offline
+        self.timeout = timeout
+        self.deadline = deadline
+        self._context = context or (lambda key: None)
+        self._lock = threading.Lock()
+        self._resolved = {}  # type: Dict[str, Any]
+
+    @classmethod
+    def shared(cls,
+               cache_file: str = DEFAULT_CACHE_FILE,
+               region: Optional[str] = None,
+               offline: Optional[bool] = None,
+               context: Optional[Callable[[str], Any]] = None) -> "Lookups":
+        """Process-wide instance, so stacks in the same app resolve once."""
+        region = region or os.environ.get("CDK_DEFAULT_REGION") or DEFAULT_REGION
+        if offline is None:
+            offline = _is_truthy(os.environ.get("CDK_LOOKUPS_OFFLINE", ""))
+        key = (os.path.abspath(cache_file), region, offline)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                if key[0] not in cls._caches:
+                    cls._caches[key[0]] = LookupCache(cache_file)
+                cls._shared[key] = cls(cache=cls._caches[key[0]],
+                                       region=region,
+                                       offline=offline)
+            instance = cls._shared[key]
+        return instance.with_context(context) if context else instance
+
+    def with_context(self, context: Callable[[str], Any]) -> "Lookups":
+        """Same cache and resolved values, overrides read from ``context``."""
+        bound = copy.copy(self)
+        bound._context = context
+        return bound
+
+    @classmethod
+    def from_context(cls, context: Callable[[str], Any], region: Optional[str] = None) -> "Lookups":
+        """Shared lookups configured from context values (``lookups:*`` keys)."""
+        offline = context("lookups:offline")
+        return cls.shared(cache_file=context("lookups:cacheFile") or DEFAULT_CACHE_FILE,
+                          region=region,
+                          offline=None if offline is None else _is_truthy(offline),
+                          context=context)
+
+    @classmethod
+    def for_scope(cls, scope) -> "Lookups":
+        """Lookups configured from the context (and region) of an app or construct."""
+        from aws_cdk import core
+
+        region = None if core.App.is_app(scope) else core.Stack.of(scope).region
+        if region is not None and core.Token.is_unresolved(region):
+            region = None
+        return cls.from_context(scope.node.try_get_context, region)
+
+    def _resolve(self, key: str, context_key: str, fetch: Callable[[], Any],
+                 default: Optional[Any] = None, ttl: float = DEFAULT_TTL) -> Any:
+        override = self._context(context_key)
+        if override is not None:
+            return override
+
+        with self._lock:
+            if key in self._resolved:
+                return self._resolved[key]
+
+        value = self.cache.get(key)
+        if value is None and not self.offline:
+            try:
+                value = fetch()
+            except Exception:
+                value = None
+            if value is not None:
+                self.cache.put(key, value, ttl)
+        if value is None:
+            value = self.cache.get(key, allow_expired=True)
+        if value is None:
+            value = default
+        if value is None:
+            raise LookupFailedError(f"Could not resolve '{key}'"
+                              f"{' (offline mode)' if self.offline else ''}; "
+                              f"pass it explicitly with -c {context_key}=...")
+
+        with self._lock:
+            self._resolved[key] = value
+        return value
+
+    def home_ip(self) -> str:
+        return self._resolve("home-ip", "home_ip", self._fetch_home_ip, ttl=HOME_IP_TTL)
+
+    def ami_id(self) -> str:
+        return self._resolve(f"ami:{self.region}", "ami_id", self._fetch_ami_id,
+                             default=DEFAULT_AMIS.get(self.region, AMI_DYNAMIC_REFERENCE))
+
+    def baked_amis(self) -> Dict[str, str]:
+        """{image name: AMI ID} of the images baked by the AMI pipelines, from
+        one SSM call.  ``-c baked_amis='{"app-lb-sample-web": "ami-..."}'``
+        overrides it, ``-c baked_amis={}`` ignores the baked images."""
+        amis = self._resolve(f"baked-amis:{self.region}", "baked_amis", self._fetch_baked_amis,
+                             default={}, ttl=BAKED_AMI_TTL)
+        return json.loads(amis) if isinstance(amis, str) else dict(amis)
+
+    def baked_ami_id(self, image_name: str) -> Optional[str]:
+        return self.baked_amis().get(image_name)
+
+    def availability_zones(self) -> List[str]:
+        azs = self._resolve(f"azs:{self.region}", "availability_zones", self._fetch_azs,
+                            default=DEFAULT_AZS.get(self.region))
+        # -c availability_zones=eu-west-1a,eu-west-1b
+        return azs.split(",") if isinstance(azs, str) else list(azs)
+
+    def cloudfront_prefix_list(self) -> Optional[str]:
+        """ID of the CloudFront origin-facing prefix list of the region, None
+        when it can't be found (``-c cloudfront_prefix_list=pl-...``)."""
+        return self._resolve(f"cloudfront-prefix-list:{self.region}", "cloudfront_prefix_list",
+                             self._fetch_cloudfront_prefix_list, default="") or None
+
+    def prefetch(self) -> Dict[str, Any]:
+        """Resolve every lookup concurrently, returning what could be resolved."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        # The context of an app or construct goes through jsii, which isn't
+        # thread-safe: read the overrides here, the workers get a plain dict
+        names = ("home_ip", "ami_id", "baked_amis", "availability_zones", "cloudfront_prefix_list")
+        bound = self.with_context({name: self._context(name) for name in names}.get)
+        lookups = {name: getattr(bound, name) for name in names}
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(lookups)) as pool:
+            futures = {name: pool.submit(lookup) for name, lookup in lookups.items()}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except LookupFailedError:
+                    pass
+        return results
+
+    def _fetch_home_ip(self) -> Optional[str]:
+        import requests
+
+        started = time.monotonic()
+        for url, field in HOME_IP_PROVIDERS:
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            try:
+                # No request outlives the deadline of the whole lookup
+                response = requests.get(url, timeout=tuple(min(timeout, remaining) for timeout in self.timeout))
+                response.raise_for_status()
+                ip = response.json()[field] if field else response.text
+            except (requests.RequestException, ValueError, KeyError):
+                continue
+            return ip.strip()
+        return None
+
+    def _boto3_client(self, service: str, started: Optional[float] = None):
+        """Client whose calls (a single attempt each) end within the deadline
+        of the lookup that started at ``started``."""
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            return None
+        remaining = self.deadline - (0.0 if started is None else time.monotonic() - started)
+        config = Config(connect_timeout=max(0.1, min(self.timeout[0], remaining)),
+                        read_timeout=max(0.1, min(self.timeout[1], remaining)),
+                        retries={"max_attempts": 0})
+        return boto3.client(service, region_name=self.region, config=config)
+
+    def _fetch_ami_id(self) -> Optional[str]:
+        ssm = self._boto3_client("ssm")
+        if ssm is None:
+            return None
+        return ssm.get_parameter(Name=AMI_SSM_PARAMETER)["Parameter"]["Value"]
+
+    def _fetch_baked_amis(self) -> Optional[Dict[str, str]]:
+        started = time.monotonic()
+        ssm = self._boto3_client("ssm", started)
+        if ssm is None:
+            return None
+        amis = {}
+        for page in ssm.get_paginator("get_parameters_by_path").paginate(Path=BAKED_AMI_SSM_PREFIX):
+            for parameter in page["Parameters"]:
+                amis[parameter["Name"][len(BAKED_AMI_SSM_PREFIX):]] = parameter["Value"]
+            if time.monotonic() - started > self.deadline:
+                # A partial list would be cached as the complete one
+                return None
+        return amis
+
+    def _fetch_cloudfront_prefix_list(self) -> Optional[str]:
+        client = self._boto3_client("ec2")
+        if client is None:
+            return None
+        prefix_lists = client.describe_managed_prefix_lists(
+            Filters=[{"Name": "prefix-list-name", "Values": [CLOUDFRONT_PREFIX_LIST]}])["PrefixLists"]
+        return prefix_lists[0]["PrefixListId"] if prefix_lists else None
+
+    def _fetch_azs(self) -> Optional[List[str]]:
+        client = self._boto3_client("ec2")
+        if client is None:
+            return None
+        zones = client.describe_availability_zones(
+            Filters=[{"Name": "state", "Values": ["available"]}])["AvailabilityZones"]
+        return sorted(zone["ZoneName"] for zone in zones) or None
@@ -0,0 +1,291 @@
+"""CloudWatch dashboard and alarms for the load balancers, NAT gateways and instances.
+
+``Instrumentation`` is an aspect: added to a stack, it visits every construct
+of it and, for the resources it knows, creates alarms and graphs on a
+dashboard named after the stack:
+
+* ALB: ``TargetResponseTime`` p99 and ``HTTPCode_Target_5XX_Count``;
+* target group (through the listeners forwarding to it): p99 and
+  ``UnHealthyHostCount``;
+* NAT gateway: ``BytesOutToDestination`` against its bandwidth and
+  ``ErrorPortAllocation``;
+* instance: ``CPUUtilization``, and ``CPUCreditBalance`` for burstable types;
+* Auto Scaling group: the same, over its instances (``AutoScalingGroupName``),
+  the type coming from its launch template.
+
+``build_assembly()`` adds it to every stack; thresholds come from the
+``monitoring`` context value (``-c monitoring=false`` turns it off):
+
+    $ cdk synth -c monitoring='{"target_response_time_p99": 0.5, "alarm_topic_arn": "arn:aws:sns:..."}'
+
+Listeners and Auto Scaling groups are matched with the load balancers,
+target groups and launch templates they reference whatever order the aspect
+visits them in.  Resources emitted through ``BulkEmitter`` are not constructs
+and are not seen.
+"""
+import json
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set
+
+import jsii
+from aws_cdk import core
+
+from cdk_common.instance_profile import BURSTABLE_FAMILIES
+
+
+# CloudWatch limits
+MAX_WIDGETS = 500
+METRICS_PER_WIDGET = 50
+
+
+class MonitoringOptions(NamedTuple):
+    enabled: bool = True
+    # SNS topic notified when an alarm fires or recovers
+    alarm_topic_arn: Optional[str] = None
+    period: int = 60
+    evaluation_periods: int = 5
+    datapoints_to_alarm: int = 3
+    # Seconds
+    target_response_time_p99: float = 1.0
+    # Per period
+    target_5xx: int = 10
+    unhealthy_hosts: int = 0
+    # Fraction of the NAT gateway bandwidth (Gbps) sustained over a period
+    nat_bandwidth_gbps: float = 5.0
+    nat_utilization: float = 0.8
+    # Credits left on a burstable instance
+    cpu_credit_balance: float = 20.0
+
+    @classmethod
+    def from_context(cls, value: Any) -> "MonitoringOptions":
+        if value is None or value is True or value == "true":
+            return cls()
+        if value is False or value == "false":
+            return cls(enabled=False)
+        if isinstance(value, str):
+            value = json.loads(value)
+        return cls(**value)
+
+    @property
+    def nat_bytes_threshold(self) -> float:
+        return self.nat_bandwidth_gbps * 1e9 / 8 * self.period * self.nat_utilization
+
+
+class _Metric(NamedTuple):
+    group: str
+    namespace: str
+    name: str
+    dimensions: Dict[str, str]
+    stat: str
+    label: str
+
+
+@jsii.implements(core.IStringProducer)
+class _DashboardBody:
+
+    def __init__(self, instrumentation: "Instrumentation", stack: core.Stack) -> None:
+        self.instrumentation = instrumentation
+        self.stack = stack
+
+    def produce(self, context) -> str:
+        return self.stack.to_json_string({"widgets": self.instrumentation.widgets()})
+
+
+@jsii.implements(core.IAspect)
+class Instrumentation:
+    """Aspect creating the alarms of the resources it visits and a dashboard
+    graphing them.  One instance per stack."""
+
+    def __init__(self, options: Optional[MonitoringOptions] = None) -> None:
+        self.options = options or MonitoringOptions()
+        self._stack = None  # type: Optional[core.Stack]
+        self._scope = None  # type: Optional[core.Construct]
+        self._metrics = []  # type: List[_Metric]
+        # Ref -> load balancer/target group/launch template, matched against
+        # the listeners and Auto Scaling groups
+        self._by_ref = {}  # type: Dict[str, core.CfnResource]
+        # Listeners and Auto Scaling groups whose references haven't all been
+        # visited yet; each returns True once done
+        self._pending = []  # type: List[Callable[[], bool]]
+        # Target groups already graphed (through one of their listeners)
+        self._target_groups = set()  # type: Set[str]
+
+    def visit(self, node: core.IConstruct) -> None:
+        # By resource type: the stacks without a load balancer don't have
+        # (nor need) the elasticloadbalancingv2 module
+        if not isinstance(node, core.CfnResource):
+            return
+        resource_type = node.cfn_resource_type
+        if resource_type == "AWS::ElasticLoadBalancingV2::LoadBalancer":
+            self._load_balancer(node)
+        elif resource_type in ("AWS::ElasticLoadBalancingV2::TargetGroup", "AWS::EC2::LaunchTemplate"):
+            self._by_ref[self._ref(node, node.ref)] = node
+        elif resource_type == "AWS::ElasticLoadBalancingV2::Listener":
+            self._pending.append(lambda: self._listener(node))
+        elif resource_type == "AWS::AutoScaling::AutoScalingGroup":
+            self._pending.append(lambda: self._auto_scaling_group(node))
+        elif resource_type == "AWS::EC2::NatGateway":
+            self._nat_gateway(node)
+        elif resource_type == "AWS::EC2::Instance":
+            self._instance(node)
+        self._pending = [pending for pending in self._pending if not pending()]
+
+    @staticmethod
+    def _burstable(instance_type: Any) -> bool:
+        return isinstance(instance_type, str) and not core.Token.is_unresolved(instance_type) \
+            and instance_type.split(".")[0] in BURSTABLE_FAMILIES
+
+    @staticmethod
+    def _ref(node: core.IConstruct, value: Any) -> str:
+        """``value`` resolved in the stack of ``node``, e.g. '{"Ref": "TGWEBHTTP"}'."""
+        return json.dumps(core.Stack.of(node).resolve(value), sort_keys=True)
+
+    def widgets(self) -> List[Dict[str, Any]]:
+        """Graphs of the collected metrics, one per group and statistic, two per row."""
+        groups = {}  # type: Dict[tuple, List[_Metric]]
+        for metric in self._metrics:
+            groups.setdefault((metric.group, metric.stat), []).append(metric)
+        widgets = []
+        for (group, stat), metrics in groups.items():
+            for start in range(0, len(metrics), METRICS_PER_WIDGET):
+                chunk = metrics[start:start + METRICS_PER_WIDGET]
+                index = len(widgets)
+                lines = [[metric.namespace, metric.name]
+                         + [item for pair in sorted(metric.dimensions.items()) for item in pair]
+                         + [{"stat": stat, "label": metric.label}] for metric in chunk]
+                widgets.append({"type": "metric",
+                                "x": index % 2 * 12, "y": index // 2 * 6, "width": 12, "height": 6,
+                                "properties": {"title": group, "view": "timeSeries", "stacked": False,
+                                               "region": core.Aws.REGION, "period": self.options.period,
+                                               "metrics": lines}})
+        return widgets[:MAX_WIDGETS]
+
+    # -- resources ------------------------------------------------------------
+
+    def _monitoring_scope(self, node: core.IConstruct) -> core.Construct:
+        """``Monitoring`` construct of the stack of ``node``, with the dashboard."""
+        if self._scope is None:
+            from aws_cdk import aws_cloudwatch as cloudwatch
+
+            self._stack = core.Stack.of(node)
+            self._scope = core.Construct(self._stack, "Monitoring")
+            cloudwatch.CfnDashboard(self._scope, id="Dashboard",
+                                    dashboard_name=f"{self._stack.stack_name}-performance",
+                                    dashboard_body=core.Lazy.string_value(_DashboardBody(self, self._stack)))
+        return self._scope
+
+    def _alarm(self, node: core.IConstruct, suffix: str, metric: _Metric, threshold: float,
+               comparison: str = "GreaterThanThreshold", description: str = "") -> None:
+        from aws_cdk import aws_cloudwatch as cloudwatch
+
+        scope = self._monitoring_scope(node)
+        # Percentiles are extended statistics
+        statistic = ({"extended_statistic": metric.stat} if metric.stat.startswith("p")
+                     else {"statistic": metric.stat})
+        actions = [self.options.alarm_topic_arn] if self.options.alarm_topic_arn else None
+        # The construct IDs of the resources are only unique among their siblings
+        cloudwatch.CfnAlarm(scope, id=f"{core.Names.unique_id(node)}{suffix}",
+                            namespace=metric.namespace,
+                            metric_name=metric.name,
+                            dimensions=[cloudwatch.CfnAlarm.DimensionProperty(name=name, value=value)
+                                        for name, value in sorted(metric.dimensions.items())],
+                            period=self.options.period,
+                            evaluation_periods=self.options.evaluation_periods,
+                            datapoints_to_alarm=self.options.datapoints_to_alarm,
+                            threshold=threshold,
+                            comparison_operator=comparison,
+                            treat_missing_data="notBreaching",
+                            alarm_description=f"{metric.label}: {description}",
+                            alarm_actions=actions,
+                            ok_actions=actions,
+                            **statistic)
+
+    def _add(self, node: core.IConstruct, metric: _Metric) -> _Metric:
+        self._monitoring_scope(node)
+        self._metrics.append(metric)
+        return metric
+
+    def _load_balancer(self, alb) -> None:
+        if getattr(alb, "type", None) not in (None, "application"):
+            return
+        options = self.options
+        self._by_ref[self._ref(alb, alb.ref)] = alb
+        dimensions = {"LoadBalancer": alb.get_att("LoadBalancerFullName").to_string()}
+        label = alb.node.id
+        latency = self._add(alb, _Metric("ALB TargetResponseTime p99", "AWS/ApplicationELB", "TargetResponseTime",
+                                         dimensions, "p99", label))
+        errors = self._add(alb, _Metric("ALB HTTPCode_Target_5XX_Count", "AWS/ApplicationELB",
+                                        "HTTPCode_Target_5XX_Count", dimensions, "Sum", label))
+        self._alarm(alb, "LatencyP99", latency, options.target_response_time_p99,
+                    description=f"p99 above {options.target_response_time_p99}s")
+        self._alarm(alb, "Target5XX", errors, options.target_5xx,
+                    description=f"more than {options.target_5xx} target 5XX per {options.period}s")
+
+    def _listener(self, listener) -> bool:
+        """Graphs and alarms of the target groups ``listener`` forwards to;
+        False while its load balancer or one of them hasn't been visited."""
+        alb = self._by_ref.get(self._ref(listener, getattr(listener, "load_balancer_arn", None)))
+        if alb is None:
+            return False
+        actions = getattr(listener, "default_actions", None)
+        actions = actions if isinstance(actions, list) else []
+        done = True
+        for action in actions:
+            target_group_arn = getattr(action, "target_group_arn", None)
+            if target_group_arn is None:
+                continue
+            target_group_ref = self._ref(listener, target_group_arn)
+            if target_group_ref in self._target_groups:
+                continue
+            target_group = self._by_ref.get(target_group_ref)
+            if target_group is None:
+                done = False
+                continue
+            self._target_groups.add(target_group_ref)
+            dimensions = {"LoadBalancer": alb.get_att("LoadBalancerFullName").to_string(),
+                          "TargetGroup": target_group.get_att("TargetGroupFullName").to_string()}
+            label = target_group.node.id
+            self._add(target_group, _Metric("Target group TargetResponseTime p99", "AWS/ApplicationELB",
+                                            "TargetResponseTime", dimensions, "p99", label))
+            unhealthy = self._add(target_group, _Metric("Target group UnHealthyHostCount", "AWS/ApplicationELB",
+                                                        "UnHealthyHostCount", dimensions, "Maximum", label))
+            self._alarm(target_group, "UnhealthyHosts", unhealthy, self.options.unhealthy_hosts,
+                        description=f"more than {self.options.unhealthy_hosts} unhealthy targets")
+        return done
+
+    def _nat_gateway(self, nat) -> None:
+        options = self.options
+        dimensions = {"NatGatewayId": nat.ref}
+        label = nat.node.id
+        bytes_out = self._add(nat, _Metric("NAT BytesOutToDestination", "AWS/NATGateway", "BytesOutToDestination",
+                                           dimensions, "Sum", label))
+        port_errors = self._add(nat, _Metric("NAT ErrorPortAllocation", "AWS/NATGateway", "ErrorPortAllocation",
+                                             dimensions, "Sum", label))
+        self._alarm(nat, "Bandwidth", bytes_out, options.nat_bytes_threshold,
+                    description=f"above {options.nat_utilization:.0%} of {options.nat_bandwidth_gbps} Gbps")
+        self._alarm(nat, "PortAllocation", port_errors, 0, description="source ports exhausted")
+
+    def _cpu(self, node, dimensions: Dict[str, str], instance_type: Any) -> None:
+        label = node.node.id
+        self._add(node, _Metric("EC2 CPUUtilization", "AWS/EC2", "CPUUtilization", dimensions, "Average", label))
+        if self._burstable(instance_type):
+            credits = self._add(node, _Metric("EC2 CPUCreditBalance", "AWS/EC2", "CPUCreditBalance",
+                                              dimensions, "Minimum", label))
+            self._alarm(node, "CpuCredits", credits, self.options.cpu_credit_balance,
+                        comparison="LessThanThreshold",
+                        description=f"fewer than {self.options.cpu_credit_balance:g} CPU credits left")
+
+    def _instance(self, instance) -> None:
+        self._cpu(instance, {"InstanceId": instance.ref}, getattr(instance, "instance_type", None))
+
+    def _auto_scaling_group(self, asg) -> bool:
+        """CPU of the instances of ``asg``; False while its launch template
+        (which has their type) hasn't been visited."""
+        instance_type = None
+        launch_template_id = getattr(getattr(asg, "launch_template", None), "launch_template_id", None)
+        if launch_template_id is not None:
+            launch_template = self._by_ref.get(self._ref(asg, launch_template_id))
+            if launch_template is None:
+                return False
+            instance_type = getattr(getattr(launch_template, "launch_template_data", None), "instance_type", None)
+        self._cpu(asg, {"AutoScalingGroupName": asg.ref}, instance_type)
+        return True
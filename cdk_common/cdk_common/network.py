@@ -0,0 +1,118 @@
+"""NAT gateway topology and VPC endpoints shared by the VPC stacks.
+
+By default every private subnet's default route goes through a single NAT
+gateway, in one AZ.  ``NetworkTopology`` (``network_topology`` context value)
+switches to one NAT gateway per AZ, each private subnet routing through the
+NAT gateway of its own AZ, and adds VPC endpoints so S3/DynamoDB traffic (and
+optionally AWS APIs) does not go through NAT at all:
+
+    cdk synth -c network_topology=per-az
+    cdk synth -c network_topology='{"preset": "per-az", "interface_endpoints": ["ssm", "logs"]}'
+"""
+import re
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+
+class NetworkTopology(NamedTuple):
+    nat_per_az: bool = False
+    # Gateway endpoints (free), added to the private route tables: "s3", "dynamodb"
+    gateway_endpoints: Tuple[str, ...] = ()
+    # Interface endpoints (billed per AZ), e.g. "ssm", "ec2messages", "logs"
+    interface_endpoints: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_context(cls, value: Any) -> "NetworkTopology":
+        if not value:
+            return PRESETS["single"]
+        if isinstance(value, str) and value.lstrip().startswith("{"):
+            import json
+            value = json.loads(value)
+        if isinstance(value, str):
+            value = {"preset": value}
+        value = dict(value)
+        preset = value.pop("preset", "single")
+        if preset not in PRESETS:
+            raise ValueError(f"network_topology: unknown preset '{preset}', expected one of {sorted(PRESETS)}")
+        for key in ("gateway_endpoints", "interface_endpoints"):
+            if key in value:
+                value[key] = tuple(value[key])
+        return PRESETS[preset]._replace(**value)
+
+
+PRESETS = {
+    "single": NetworkTopology(),
+    "per-az": NetworkTopology(nat_per_az=True, gateway_endpoints=("s3", "dynamodb")),
+}
+
+
+def az_suffix(az: str) -> str:
+    """'eu-central-1a' -> 'a', used in logical IDs."""
+    return az.rsplit("-", 1)[-1].lstrip("0123456789") or az
+
+
+def add_nat_gateway(scope, subnet_id: str, eip_id: str = "EIP01", nat_id: str = "NAT_GW",
+                    name: Optional[str] = None):
+    """Elastic IP + NAT gateway in the public subnet ``subnet_id``."""
+    from aws_cdk import core
+    from aws_cdk import aws_ec2 as ec2
+
+    eip = ec2.CfnEIP(scope, id=eip_id)
+    ngw = ec2.CfnNatGateway(scope, id=nat_id,
+                            allocation_id=eip.attr_allocation_id,
+                            subnet_id=subnet_id,
+                            tags=[core.CfnTag(key="Name", value=name or nat_id)])
+    return ngw
+
+
+def _endpoint_id(scope, service: str, taken: Dict[str, str]) -> str:
+    """Construct ID of the endpoint of ``service``, failing on a second one
+    (its logical ID only keeps the letters and digits of the service name)."""
+    construct_id = f"Endpoint_{service}"
+    key = re.sub(r"[^A-Za-z0-9]", "", service)
+    if key in taken or scope.node.try_find_child(construct_id) is not None:
+        raise ValueError(f"network_topology: '{service}' clashes with the endpoint of "
+                         f"'{taken.get(key, service)}' in {scope.node.path}, list every service once")
+    taken[key] = service
+    return construct_id
+
+
+def add_vpc_endpoints(scope,
+                      topology: NetworkTopology,
+                      vpc_id: str,
+                      vpc_cidr: str,
+                      route_table_ids: Iterable[str],
+                      subnets_by_az: Dict[str, str]) -> Dict[str, Any]:
+    """Gateway endpoints on ``route_table_ids`` and interface endpoints in one
+    subnet per AZ (``{az: subnet_id}``, interface endpoints allow no more)."""
+    from aws_cdk import core
+    from aws_cdk import aws_ec2 as ec2
+
+    from cdk_common.sg_rules import IngressRule, add_ingress_rules
+
+    endpoints = {}
+    taken = {}  # type: Dict[str, str]
+    route_table_ids = list(route_table_ids)
+    for service in topology.gateway_endpoints:
+        endpoints[service] = ec2.CfnVPCEndpoint(scope, id=_endpoint_id(scope, service, taken),
+                                                vpc_id=vpc_id,
+                                                service_name=f"com.amazonaws.{core.Aws.REGION}.{service}",
+                                                vpc_endpoint_type="Gateway",
+                                                route_table_ids=route_table_ids)
+
+    if topology.interface_endpoints:
+        sg_endpoints = ec2.CfnSecurityGroup(scope, id="SG_Endpoints",
+                                            group_description="SG for the interface VPC endpoints",
+                                            vpc_id=vpc_id,
+                                            tags=[core.CfnTag(key="Name", value="SG_Endpoints")])
+        add_ingress_rules(scope, "sg_endpoints_in", sg_endpoints,
+                          [IngressRule("tcp", 443, 443, cidr_ip=vpc_cidr, description="from the VPC")])
+        subnet_ids = [subnets_by_az[az] for az in sorted(subnets_by_az)]
+        for service in topology.interface_endpoints:
+            endpoints[service] = ec2.CfnVPCEndpoint(scope, id=_endpoint_id(scope, service, taken),
+                                                    vpc_id=vpc_id,
+                                                    service_name=f"com.amazonaws.{core.Aws.REGION}.{service}",
+                                                    vpc_endpoint_type="Interface",
+                                                    private_dns_enabled=True,
+                                                    subnet_ids=subnet_ids,
+                                                    security_group_ids=[sg_endpoints.ref])
+    return endpoints
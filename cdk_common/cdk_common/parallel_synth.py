@@ -0,0 +1,152 @@
+"""Synthesize independent stacks in a process pool and merge the assemblies.
+
+Every worker is a freshly spawned interpreter with its own jsii runtime, builds
+a ``core.App`` holding a single stack and synthesizes it into a private
+directory.  The per-stack assemblies are then merged into one cloud assembly
+(one ``manifest.json``/``tree.json``) that the CDK CLI reads as if a single
+app had produced it.
+
+Stacks are described by ``StackSpec`` (an import path rather than a class) so
+the parent process never imports ``aws_cdk`` itself.
+"""
+import json
+import os
+import shutil
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+
+WORKERS_DIR = ".workers"
+ARTIFACT_TREE = "Tree"
+TREE_FILE = "tree.json"
+MANIFEST_FILE = "manifest.json"
+
+
+class StackSpec(NamedTuple):
+    stack_id: str
+    # "package.module:ClassName"
+    target: str
+    # Entries prepended to sys.path in the worker (the stack's project directory)
+    paths: Sequence[str] = ()
+    account: Optional[str] = None
+    region: Optional[str] = None
+    # Context defaults of this stack (its environment's), -c and cdk.json still win
+    context: Optional[Dict[str, Any]] = None
+
+
+class StackTiming(NamedTuple):
+    stack_id: str
+    pid: int
+    import_s: float
+    construct_s: float
+    synth_s: float
+
+    @property
+    def total_s(self) -> float:
+        return self.import_s + self.construct_s + self.synth_s
+
+
+def _synth_stack(spec: StackSpec, outdir: str) -> StackTiming:
+    from cdk_common.entrypoint import build_assembly
+    from cdk_common.profiler import Profiler
+    from cdk_common.synth_cache import app_context
+
+    # CDK_PROFILE is inherited by the workers, each one profiles its own stack
+    profiler = Profiler.from_context(app_context(), name=spec.stack_id)
+    if profiler:
+        profiler.output = os.path.join(profiler.output, spec.stack_id)
+        profiler.install()
+    # Without profiling only the phases are timed
+    timer = profiler or Profiler(output="", name=spec.stack_id)
+    build_assembly([spec], outdir, profiler=timer)
+    if profiler:
+        profiler.uninstall()
+        profiler.export()
+
+    seconds = {}  # type: Dict[str, float]
+    for name, started, ended in timer.phases:
+        phase = name.split(":")[0]
+        seconds[phase] = seconds.get(phase, 0.0) + ended - started
+    return StackTiming(spec.stack_id, os.getpid(),
+                       seconds.get("import", 0.0) + seconds.get("lookups", 0.0),
+                       seconds.get("construct", 0.0),
+                       seconds.get("synth", 0.0) + seconds.get("prune", 0.0) + seconds.get("shard", 0.0)
+                       + seconds.get("compact", 0.0))
+
+
+def merge_assemblies(sources: Sequence[str], outdir: str) -> None:
+    """Merge single-stack cloud assemblies into one in ``outdir``."""
+    os.makedirs(outdir, exist_ok=True)
+    manifest = None  # type: Optional[Dict[str, Any]]
+    tree = {"version": "tree-0.1",
+            "tree": {"id": "App", "path": "", "children": {}}}
+
+    for source in sources:
+        with open(os.path.join(source, MANIFEST_FILE), 'r') as manifest_file:
+            part = json.load(manifest_file)
+        if manifest is None:
+            manifest = dict(part, artifacts={})
+            manifest.pop("missing", None)
+        for artifact_id, artifact in part.get("artifacts", {}).items():
+            if artifact_id == ARTIFACT_TREE:
+                continue
+            if artifact_id in manifest["artifacts"]:
+                raise ValueError(f"Artifact '{artifact_id}' is synthesized by more than one worker")
+            manifest["artifacts"][artifact_id] = artifact
+        if part.get("missing"):
+            manifest.setdefault("missing", []).extend(part["missing"])
+
+        tree_path = os.path.join(source, TREE_FILE)
+        if os.path.exists(tree_path):
+            with open(tree_path, 'r') as tree_file:
+                tree["tree"]["children"].update(json.load(tree_file)["tree"].get("children", {}))
+
+        for name in os.listdir(source):
+            if name in (MANIFEST_FILE, TREE_FILE):
+                continue
+            src_path, dst_path = os.path.join(source, name), os.path.join(outdir, name)
+            if os.path.isdir(src_path):
+                shutil.rmtree(dst_path, ignore_errors=True)
+                shutil.copytree(src_path, dst_path)
+            else:
+                shutil.copy2(src_path, dst_path)
+
+    if manifest is None:
+        raise ValueError("Nothing to merge")
+    with open(os.path.join(outdir, TREE_FILE), 'w') as tree_file:
+        json.dump(tree, tree_file, indent=2)
+    manifest["artifacts"][ARTIFACT_TREE] = {"type": "cdk:tree", "properties": {"file": TREE_FILE}}
+    with open(os.path.join(outdir, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def synth_parallel(specs: Sequence[StackSpec],
+                   outdir: str,
+                   max_workers: Optional[int] = None) -> List[StackTiming]:
+    """Synthesize ``specs`` concurrently into one cloud assembly in ``outdir``."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers_dir = os.path.join(outdir, WORKERS_DIR)
+    shutil.rmtree(workers_dir, ignore_errors=True)
+    worker_outdirs = [os.path.join(workers_dir, spec.stack_id) for spec in specs]
+
+    # The jsii runtime is a child process with pipes, it must never be forked
+    context = multiprocessing.get_context("spawn")
+    max_workers = min(max_workers or os.cpu_count() or 1, len(specs)) or 1
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        timings = list(pool.map(_synth_stack, specs, worker_outdirs))
+
+    merge_assemblies(worker_outdirs, outdir)
+    shutil.rmtree(workers_dir, ignore_errors=True)
+    return timings
+
+
+def print_timings(timings: Sequence[StackTiming], wall_s: float, file=sys.stderr) -> None:
+    print(f"{'stack':<32} {'pid':>7} {'import':>8} {'construct':>10} {'synth':>8} {'total':>8}", file=file)
+    for timing in sorted(timings, key=lambda t: t.total_s, reverse=True):
+        print(f"{timing.stack_id:<32} {timing.pid:>7} {timing.import_s:>8.2f} "
+              f"{timing.construct_s:>10.2f} {timing.synth_s:>8.2f} {timing.total_s:>8.2f}", file=file)
+    serial_s = sum(timing.total_s for timing in timings)
+    print(f"{len(timings)} stacks in {wall_s:.2f}s wall ({serial_s:.2f}s of worker time, "
+          f"{serial_s / wall_s if wall_s else 0:.1f}x)", file=file)
@@ -0,0 +1,243 @@
+"""Opt-in profiler for synth: phases, per-construct time and jsii round-trips.
+
+Enabled with ``CDK_PROFILE=<output dir>`` (or ``-c profile:output=<dir>``).
+The entry points split the run into phases (``import``, ``lookups``,
+``construct:<stack>``, ``synth``, ...) and every call the generated bindings make
+into the jsii kernel (``jsii.create``, ``jsii.invoke``, ``jsii.get``, ...) is
+timed and attributed to the line of stack code that triggered it, e.g.
+``create_basic_vpc_stack.py:38 CfnSubnet``.  On exit the output directory
+gets:
+
+* ``profile.txt``: phases and constructs sorted by time, with jsii call counts;
+* ``profile.json``: the same data, for ``compare``;
+* ``profile.speedscope.json``: open in https://www.speedscope.app;
+* ``profile.folded``: collapsed stacks for ``flamegraph.pl``.
+
+Two runs are compared with
+
+    $ python -m cdk_common.profiler compare before/profile.json after/profile.json --threshold 0.1
+
+which exits non-zero when a phase or construct got slower than the threshold.
+"""
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+JSII_CALLS = ("load", "create", "delete", "get", "set", "sget", "sset", "invoke", "sinvoke", "ainvoke")
+
+# Frames from these directories are skipped when attributing a jsii call
+_SKIPPED_PATHS = tuple(os.sep + name + os.sep for name in ("jsii", "aws_cdk", "constructs", "cdk_common"))
+
+
+def _caller_label(cls: Any = None) -> str:
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not any(path in filename for path in _SKIPPED_PATHS) and "importlib" not in filename:
+            label = f"{os.path.basename(filename)}:{frame.f_lineno}"
+            break
+        frame = frame.f_back
+    else:
+        label = "<jsii>"
+    if cls is not None:
+        label = f"{label} {getattr(cls, '__name__', cls)}"
+    return label
+
+
+class Profiler:
+
+    def __init__(self, output: str, name: str = "synth", clock=time.perf_counter) -> None:
+        self.output = output
+        self.name = name
+        self._clock = clock
+        self._origin = clock()
+        self._phase_stack = []  # type: List[str]
+        # (phase, label, method, start, end)
+        self.calls = []  # type: List[Tuple[str, str, str, float, float]]
+        # (phase, start, end)
+        self.phases = []  # type: List[Tuple[str, float, float]]
+        self._patched = {}  # type: Dict[str, Any]
+
+    @classmethod
+    def from_context(cls, context: Dict[str, Any], name: str = "synth") -> Optional["Profiler"]:
+        output = os.environ.get("CDK_PROFILE") or context.get("profile:output")
+        return cls(output, name) if output else None
+
+    def _now(self) -> float:
+        return self._clock() - self._origin
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self._phase_stack.append(name)
+        started = self._now()
+        try:
+            yield
+        finally:
+            self.phases.append((name, started, self._now()))
+            self._phase_stack.pop()
+
+    def install(self) -> None:
+        """Wrap the jsii kernel entry points used by the generated bindings."""
+        import jsii
+
+        for method in JSII_CALLS:
+            original = getattr(jsii, method, None)
+            if original is None or method in self._patched:
+                continue
+            self._patched[method] = original
+            setattr(jsii, method, self._wrap(method, original))
+
+    def uninstall(self) -> None:
+        import jsii
+
+        for method, original in self._patched.items():
+            setattr(jsii, method, original)
+        self._patched.clear()
+
+    def _wrap(self, method: str, original):
+        def wrapper(*args, **kwargs):
+            label = _caller_label(args[0] if method == "create" and args else None)
+            started = self._now()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                phase = self._phase_stack[-1] if self._phase_stack else "other"
+                self.calls.append((phase, label, method, started, self._now()))
+        wrapper.__wrapped__ = original
+        return wrapper
+
+    def summary(self) -> Dict[str, Any]:
+        phases = {}  # type: Dict[str, Dict[str, float]]
+        for name, started, ended in self.phases:
+            phase = phases.setdefault(name, {"seconds": 0.0, "jsii_calls": 0})
+            phase["seconds"] += ended - started
+        constructs = {}  # type: Dict[str, Dict[str, Any]]
+        for phase, label, method, started, ended in self.calls:
+            if phase in phases:
+                phases[phase]["jsii_calls"] += 1
+            construct = constructs.setdefault(label, {"seconds": 0.0, "jsii_calls": 0, "methods": {}})
+            construct["seconds"] += ended - started
+            construct["jsii_calls"] += 1
+            construct["methods"][method] = construct["methods"].get(method, 0) + 1
+        return {"name": self.name,
+                "total_seconds": max((ended for _, _, ended in self.phases), default=0.0),
+                "jsii_calls": len(self.calls),
+                "phases": phases,
+                "constructs": constructs}
+
+    def report(self) -> str:
+        summary = self.summary()
+        lines = [f"{summary['name']}: {summary['total_seconds']:.3f}s, {summary['jsii_calls']} jsii calls", "",
+                 f"{'phase':<40} {'seconds':>9} {'jsii calls':>11}"]
+        for name, phase in sorted(summary["phases"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"{name:<40} {phase['seconds']:>9.3f} {phase['jsii_calls']:>11}")
+        lines += ["", f"{'construct (caller)':<60} {'seconds':>9} {'jsii calls':>11}"]
+        for label, construct in sorted(summary["constructs"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"{label:<60} {construct['seconds']:>9.3f} {construct['jsii_calls']:>11}")
+        return "\n".join(lines)
+
+    def speedscope(self) -> Dict[str, Any]:
+        frames, index = [], {}  # type: List[Dict[str, str]], Dict[str, int]
+
+        def frame(name: str) -> int:
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({"name": name})
+            return index[name]
+
+        # Events have to nest, so sort opens by time and outer (phase) before inner (call)
+        events = []
+        for name, started, ended in self.phases:
+            events.append((started, 0, -ended, "O", frame(name)))
+            events.append((ended, 1, -started, "C", frame(name)))
+        for _, label, method, started, ended in self.calls:
+            events.append((started, 0, -ended, "O", frame(f"{label} [{method}]")))
+            events.append((ended, 1, -started, "C", frame(f"{label} [{method}]")))
+        # Closes before opens at the same instant, inner closes before outer ones
+        events.sort(key=lambda event: (event[0], -event[1], event[2]))
+        end = max((event[0] for event in events), default=0.0)
+        return {"$schema": "https://www.speedscope.app/file-format-schema.json",
+                "shared": {"frames": frames},
+                "profiles": [{"type": "evented",
+                              "name": self.name,
+                              "unit": "milliseconds",
+                              "startValue": 0,
+                              "endValue": end * 1000,
+                              "events": [{"type": kind, "frame": frame_id, "at": at * 1000}
+                                         for at, _, _, kind, frame_id in events]}]}
+
+    def folded(self) -> str:
+        """Collapsed stacks (``phase;caller;method microseconds``)."""
+        stacks = {}  # type: Dict[str, float]
+        in_calls = {}  # type: Dict[str, float]
+        for phase, label, method, started, ended in self.calls:
+            key = f"{phase};{label};{method}"
+            stacks[key] = stacks.get(key, 0.0) + ended - started
+            in_calls[phase] = in_calls.get(phase, 0.0) + ended - started
+        for name, started, ended in self.phases:
+            # Time of the phase spent in Python, outside of jsii
+            stacks[name] = stacks.get(name, 0.0) + max(ended - started - in_calls.pop(name, 0.0), 0.0)
+        return "\n".join(f"{key} {int(seconds * 1e6)}" for key, seconds in sorted(stacks.items())) + "\n"
+
+    def export(self) -> str:
+        os.makedirs(self.output, exist_ok=True)
+        with open(os.path.join(self.output, "profile.txt"), 'w') as report_file:
+            report_file.write(self.report() + "\n")
+        with open(os.path.join(self.output, "profile.json"), 'w') as summary_file:
+            json.dump(self.summary(), summary_file, indent=2, sort_keys=True)
+        with open(os.path.join(self.output, "profile.speedscope.json"), 'w') as speedscope_file:
+            json.dump(self.speedscope(), speedscope_file)
+        with open(os.path.join(self.output, "profile.folded"), 'w') as folded_file:
+            folded_file.write(self.folded())
+        print(f"synth profile written to {self.output}", file=sys.stderr)
+        return self.output
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any], threshold: float = 0.1,
+            min_seconds: float = 0.01) -> Tuple[List[str], bool]:
+    """Lines describing the differences between two ``profile.json`` and
+    whether anything regressed by more than ``threshold`` (relative)."""
+    lines, regressed = [], False
+    for section in ("phases", "constructs"):
+        names = sorted(set(before.get(section, {})) | set(after.get(section, {})))
+        for name in names:
+            old = before.get(section, {}).get(name, {"seconds": 0.0, "jsii_calls": 0})
+            new = after.get(section, {}).get(name, {"seconds": 0.0, "jsii_calls": 0})
+            delta = new["seconds"] - old["seconds"]
+            ratio = delta / old["seconds"] if old["seconds"] else (1.0 if delta else 0.0)
+            slower = ratio > threshold and delta > min_seconds
+            more_calls = new["jsii_calls"] > old["jsii_calls"]
+            if slower or more_calls or ratio < -threshold:
+                regressed = regressed or slower or more_calls
+                lines.append(f"{'REGRESSION' if slower or more_calls else 'improved':<11} {section[:-1]} {name}: "
+                             f"{old['seconds']:.3f}s -> {new['seconds']:.3f}s ({ratio:+.0%}), "
+                             f"jsii calls {old['jsii_calls']} -> {new['jsii_calls']}")
+    return lines, regressed
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Synth profile tools")
+    commands = parser.add_subparsers(dest="command")
+    # add_subparsers(required=...) is Python 3.7+
+    commands.required = True
+    compare_parser = commands.add_parser("compare", help="compare two profile.json files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative slowdown counted as a regression (default 0.1)")
+    args = parser.parse_args(argv)
+
+    with open(args.before, 'r') as before_file, open(args.after, 'r') as after_file:
+        lines, regressed = compare(json.load(before_file), json.load(after_file), args.threshold)
+    print("\n".join(lines) or "no significant changes")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""Offline security group reachability of synthesized templates.
+
+Answers "can X reach Y on port P" from the templates of a cloud assembly,
+without deploying anything.  ``ReachabilityIndex`` loads the security groups
+(inline and standalone ingress rules), and what they are attached to
+(instances, launch templates, load balancers), and indexes the rules:
+
+* per (destination group, protocol, source group): the merged port intervals,
+  searched with a bisection;
+* per (destination group, protocol, source CIDR): the same, a source IP being
+  matched by looking up its 33 enclosing prefixes.
+
+A query is a handful of dict lookups and bisections, independent of the
+number of rules:
+
+    index = ReachabilityIndex.from_assembly("cdk.out")
+    index.can_reach("WebServer01", "AppServer01", 22)
+    index.can_reach("203.0.113.10", "bastion", 22)
+
+Egress is not modelled: the stacks leave the default allow-all egress rule.
+Resources are named ``<stack>/<logical ID>`` or just by their logical ID
+when it is unique.  From the command line:
+
+    $ python -m cdk_common.reachability cdk.out
+    $ python -m cdk_common.reachability cdk.out --from 203.0.113.10 --to AppLbSampleStack/bastion --port 22
+    $ python -m cdk_common.reachability cdk.out --matrix reachability.json
+"""
+import bisect
+import ipaddress
+import json
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+ALL = "all"
+PROTOCOLS = {"-1": ALL, "6": "tcp", "17": "udp", "1": "icmp", "58": "icmpv6"}
+FULL_RANGE = (-1, 65535)
+# Resource type -> where its security groups are
+ATTACHMENTS = {
+    "AWS::EC2::Instance": (("SecurityGroupIds",), ("NetworkInterfaces", "GroupSet")),
+    "AWS::EC2::LaunchTemplate": (("LaunchTemplateData", "SecurityGroupIds"),
+                                 ("LaunchTemplateData", "NetworkInterfaces", "Groups")),
+    "AWS::ElasticLoadBalancingV2::LoadBalancer": (("SecurityGroups",),),
+}
+
+Interval = Tuple[int, int]
+
+
+class Rule(NamedTuple):
+    group: str
+    protocol: str
+    from_port: int
+    to_port: int
+    # Security group key or CIDR
+    source: str
+    description: Optional[str] = None
+
+    def __str__(self) -> str:
+        traffic = "all traffic" if self.protocol == ALL else f"{self.protocol} {_label((self.from_port, self.to_port))}"
+        return f"{self.group} <- {self.source} {traffic}" + (
+            f" ({self.description})" if self.description else "")
+
+
+class _Ports:
+    """Merged, sorted port intervals."""
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals: Iterable[Interval]) -> None:
+        self.starts = []  # type: List[int]
+        self.ends = []  # type: List[int]
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __contains__(self, port: int) -> bool:
+        i = bisect.bisect_right(self.starts, port) - 1
+        return i >= 0 and self.ends[i] >= port
+
+    def intervals(self) -> List[Interval]:
+        return list(zip(self.starts, self.ends))
+
+
+def _label(interval: Interval) -> str:
+    if interval == FULL_RANGE:
+        return "all"
+    return str(interval[0]) if interval[0] == interval[1] else f"{interval[0]}-{interval[1]}"
+
+
+def _protocol(value: Any) -> str:
+    value = str(value).lower()
+    return PROTOCOLS.get(value, value)
+
+
+def _ports(protocol: str, rule: Dict[str, Any]) -> Interval:
+    if protocol == ALL:
+        return FULL_RANGE
+    from_port, to_port = int(rule.get("FromPort", -1)), int(rule.get("ToPort", -1))
+    if from_port == -1:
+        return FULL_RANGE
+    return from_port, to_port
+
+
+def _network(value: str) -> Tuple[int, int]:
+    network = ipaddress.IPv4Network(value, strict=False)
+    return int(network.network_address), network.prefixlen
+
+
+def _contains(outer: Tuple[int, int], inner: Tuple[int, int]) -> bool:
+    (outer_address, outer_prefixlen), (inner_address, inner_prefixlen) = outer, inner
+    mask = (0xFFFFFFFF << (32 - outer_prefixlen)) & 0xFFFFFFFF
+    return outer_prefixlen <= inner_prefixlen and inner_address & mask == outer_address
+
+
+def _is_address(name: str) -> bool:
+    try:
+        ipaddress.IPv4Network(name, strict=False)
+    except ValueError:
+        return False
+    return True
+
+
+def _dig(value: Any, path: Tuple[str, ...]) -> List[Any]:
+    """Values at ``path`` in ``value``, lists along the way flattened."""
+    values = [value]
+    for key in path:
+        found = []
+        for item in values:
+            for element in (item if isinstance(item, list) else [item]):
+                if isinstance(element, dict) and key in element:
+                    found.append(element[key])
+        values = found
+    return [element for item in values for element in (item if isinstance(item, list) else [item])]
+
+
+class ReachabilityIndex:
+
+    def __init__(self) -> None:
+        self.rules = []  # type: List[Rule]
+        # Endpoint (instance, launch template, load balancer, or a group itself) -> its groups
+        self.groups_of = {}  # type: Dict[str, Set[str]]
+        self.groups = set()  # type: Set[str]
+        self._aliases = {}  # type: Dict[str, Set[str]]
+        self._raw_sg = {}  # type: Dict[Tuple[str, str], Dict[str, List[Interval]]]
+        self._raw_cidr = {}  # type: Dict[Tuple[str, str], Dict[Tuple[int, int], List[Interval]]]
+        self._sg = None  # type: Optional[Dict[Tuple[str, str], Dict[str, _Ports]]]
+        self._cidr = None  # type: Optional[Dict[Tuple[str, str], Dict[Tuple[int, int], _Ports]]]
+        self._prefixes = {}  # type: Dict[Tuple[str, str], List[int]]
+
+    # -- loading --------------------------------------------------------------
+
+    @classmethod
+    def from_assembly(cls, path: str) -> "ReachabilityIndex":
+        """Index of a template file or of every template of a cloud assembly."""
+        from cdk_common.template_graph import _template_files
+
+        index = cls()
+        for template_path in _template_files(path):
+            with open(template_path, 'r') as template_file:
+                index.add_template(os.path.basename(template_path).split(".")[0], json.load(template_file))
+        return index
+
+    def _key(self, stack: str, value: Any) -> str:
+        """Resource key of a ``Ref``/``Fn::GetAtt`` to a resource of ``stack``,
+        the value itself for literal IDs (``sg-...``)."""
+        if isinstance(value, dict):
+            if "Ref" in value:
+                return f"{stack}/{value['Ref']}"
+            if "Fn::GetAtt" in value:
+                target = value["Fn::GetAtt"]
+                return f"{stack}/{target[0] if isinstance(target, list) else target.split('.')[0]}"
+            return json.dumps(value, sort_keys=True)
+        return str(value)
+
+    def _add_endpoint(self, key: str, groups: Set[str]) -> None:
+        self.groups_of.setdefault(key, set()).update(groups)
+        self._aliases.setdefault(key.rsplit("/", 1)[-1], set()).add(key)
+
+    def add_rule(self, rule: Rule) -> None:
+        self.rules.append(rule)
+        self._sg = self._cidr = None
+        if _is_address(rule.source):
+            networks = self._raw_cidr.setdefault((rule.group, rule.protocol), {})
+            networks.setdefault(_network(rule.source), []).append((rule.from_port, rule.to_port))
+        else:
+            sources = self._raw_sg.setdefault((rule.group, rule.protocol), {})
+            sources.setdefault(rule.source, []).append((rule.from_port, rule.to_port))
+
+    def _add_ingress(self, stack: str, group: str, ingress: Dict[str, Any]) -> None:
+        if "CidrIp" in ingress:
+            source = self._key(stack, ingress["CidrIp"])
+        elif "SourceSecurityGroupId" in ingress:
+            source = self._key(stack, ingress["SourceSecurityGroupId"])
+        else:
+            # IPv6 and prefix lists are not modelled
+            return
+        protocol = _protocol(ingress.get("IpProtocol", ALL))
+        from_port, to_port = _ports(protocol, ingress)
+        self.add_rule(Rule(group, protocol, from_port, to_port, source, ingress.get("Description")))
+
+    def add_template(self, stack: str, template: Dict[str, Any]) -> None:
+        resources = template.get("Resources", {})
+        for logical_id, resource in resources.items():
+            properties = resource.get("Properties") or {}
+            resource_type = resource.get("Type")
+            if resource_type == "AWS::EC2::SecurityGroup":
+                group = f"{stack}/{logical_id}"
+                self.groups.add(group)
+                self._add_endpoint(group, {group})
+                for ingress in properties.get("SecurityGroupIngress") or []:
+                    self._add_ingress(stack, group, ingress)
+            elif resource_type == "AWS::EC2::SecurityGroupIngress":
+                self._add_ingress(stack, self._key(stack, properties.get("GroupId")), properties)
+            elif resource_type in ATTACHMENTS:
+                groups = {self._key(stack, value) for path in ATTACHMENTS[resource_type]
+                          for value in _dig(properties, path)}
+                if groups:
+                    self._add_endpoint(f"{stack}/{logical_id}", groups)
+
+    def _build(self) -> None:
+        if self._sg is not None:
+            return
+        self._sg = {key: {source: _Ports(intervals) for source, intervals in sources.items()}
+                    for key, sources in self._raw_sg.items()}
+        self._cidr = {key: {network: _Ports(intervals) for network, intervals in networks.items()}
+                      for key, networks in self._raw_cidr.items()}
+        self._prefixes = {key: sorted({prefixlen for _, prefixlen in networks})
+                          for key, networks in self._raw_cidr.items()}
+
+    # -- queries --------------------------------------------------------------
+
+    def resolve(self, name: str) -> str:
+        """Endpoint key of ``name`` (a key, or a logical ID unique in the assembly)."""
+        if name in self.groups_of or _is_address(name):
+            return name
+        keys = self._aliases.get(name, set())
+        if len(keys) != 1:
+            raise KeyError(f"'{name}' is {'ambiguous: ' + ', '.join(sorted(keys)) if keys else 'unknown'}")
+        return next(iter(keys))
+
+    def can_reach(self, source: str, destination: str, port: int = -1, protocol: str = "tcp") -> bool:
+        """Whether ``source`` (endpoint, group, IP or CIDR) may open a
+        ``protocol`` connection to ``destination`` on ``port``."""
+        self._build()
+        source, destination = self.resolve(source), self.resolve(destination)
+        protocols = (_protocol(protocol), ALL)
+        destination_groups = self.groups_of.get(destination, ())
+        if _is_address(source):
+            address, source_prefixlen = _network(source)
+            for group in destination_groups:
+                for protocol in protocols:
+                    networks = self._cidr.get((group, protocol))
+                    if not networks:
+                        continue
+                    for prefixlen in self._prefixes[(group, protocol)]:
+                        if prefixlen > source_prefixlen:
+                            break
+                        mask = (0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF
+                        ports = networks.get((address & mask, prefixlen))
+                        if ports is not None and port in ports:
+                            return True
+            return False
+        source_groups = self.groups_of.get(source, (source,))
+        for group in destination_groups:
+            for protocol in protocols:
+                sources = self._sg.get((group, protocol))
+                if not sources:
+                    continue
+                for source_group in source_groups:
+                    ports = sources.get(source_group)
+                    if ports is not None and port in ports:
+                        return True
+        return False
+
+    def explain(self, source: str, destination: str, port: int = -1, protocol: str = "tcp") -> List[Rule]:
+        """The rules letting ``source`` reach ``destination`` (a linear scan)."""
+        source, destination = self.resolve(source), self.resolve(destination)
+        destination_groups = self.groups_of.get(destination, set())
+        if _is_address(source):
+            source_network = _network(source)
+            matches_source = (lambda rule: _is_address(rule.source)  # noqa: E731
+                              and _contains(_network(rule.source), source_network))
+        else:
+            source_groups = self.groups_of.get(source, {source})
+            matches_source = lambda rule: rule.source in source_groups  # noqa: E731
+        return [rule for rule in self.rules
+                if rule.group in destination_groups
+                and rule.protocol in (_protocol(protocol), ALL)
+                and rule.from_port <= port <= rule.to_port
+                and matches_source(rule)]
+
+    def matrix(self) -> Dict[str, Dict[str, Dict[str, List[str]]]]:
+        """{source: {destination: {protocol: ["22", "80-81", ...]}}} for every
+        endpoint and every CIDR appearing in a rule, as sources."""
+        self._build()
+        members = {}  # type: Dict[str, List[str]]
+        for endpoint, groups in self.groups_of.items():
+            for group in groups:
+                members.setdefault(group, []).append(endpoint)
+        sg_rules, cidr_rules = {}, {}  # type: Dict[str, List[tuple]], Dict[str, List[tuple]]
+        for (group, protocol), sources in self._sg.items():
+            sg_rules.setdefault(group, []).append((protocol, sources))
+        for (group, protocol), networks in self._cidr.items():
+            cidr_rules.setdefault(group, []).append((protocol, networks))
+
+        result = {}  # type: Dict[str, Dict[str, Dict[str, List[str]]]]
+        for destination, groups in sorted(self.groups_of.items()):
+            collected = {}  # type: Dict[Tuple[str, str], List[Interval]]
+            for group in groups:
+                for protocol, sources in sg_rules.get(group, ()):
+                    for source_group, ports in sources.items():
+                        for source in members.get(source_group, [source_group]):
+                            collected.setdefault((source, protocol), []).extend(ports.intervals())
+                for protocol, networks in cidr_rules.get(group, ()):
+                    for (address, prefixlen), ports in networks.items():
+                        source = str(ipaddress.IPv4Network((address, prefixlen)))
+                        collected.setdefault((source, protocol), []).extend(ports.intervals())
+            for (source, protocol), intervals in collected.items():
+                result.setdefault(source, {}).setdefault(destination, {})[protocol] = [
+                    _label(interval) for interval in _Ports(intervals).intervals()]
+        return result
+
+    def summary(self) -> str:
+        sg_rules = sum(len(sources) for sources in self._raw_sg.values())
+        cidr_rules = sum(len(networks) for networks in self._raw_cidr.values())
+        endpoints = len(self.groups_of) - len(self.groups)
+        return (f"{len(self.groups)} security groups, {endpoints} attached resources, "
+                f"{len(self.rules)} rules ({sg_rules} group sources, {cidr_rules} CIDR sources)")
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Security group reachability of CloudFormation templates")
+    parser.add_argument("path", help="template file or cloud assembly directory (cdk.out)")
+    parser.add_argument("--from", dest="source", help="endpoint, security group, IP or CIDR")
+    parser.add_argument("--to", dest="destination", help="endpoint or security group")
+    parser.add_argument("--port", type=int, default=-1)
+    parser.add_argument("--protocol", default="tcp")
+    parser.add_argument("--matrix", metavar="FILE", help="write the reachability matrix as JSON ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    index = ReachabilityIndex.from_assembly(args.path)
+    print(index.summary())
+    if args.source or args.destination:
+        if not (args.source and args.destination):
+            parser.error("--from and --to go together")
+        try:
+            reachable = index.can_reach(args.source, args.destination, args.port, args.protocol)
+        except KeyError as error:
+            parser.error(str(error.args[0]))
+        print(f"{args.source} -> {args.destination} {args.protocol}/{args.port}: "
+              f"{'reachable' if reachable else 'unreachable'}")
+        for rule in index.explain(args.source, args.destination, args.port, args.protocol):
+            print(f"  {rule}")
+    if args.matrix:
+        matrix = index.matrix()
+        if args.matrix == "-":
+            print(json.dumps(matrix, indent=1, sort_keys=True))
+        else:
+            with open(args.matrix, 'w') as matrix_file:
+                json.dump(matrix, matrix_file, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Compiles declarative security group rules into the fewest ingress entries.
+
+The stacks used to emit one ``CfnSecurityGroupIngress`` per (protocol, port)
+pair, which multiplies quickly with more ports and more SG pairs.  Here the
+rules are:
+
+* deduplicated;
+* coalesced, for TCP/UDP, into from/to port ranges when they are contiguous
+  or overlap (22, 23, 24 -> 22-24) and share protocol and source;
+* dropped when an "all traffic" (``-1``) rule from the same source covers them;
+* inlined into the ``CfnSecurityGroup`` itself, so they cost no resource at
+  all.  Only rules that can't be inlined (the group referencing itself as a
+  source, which would be a circular dependency) become
+  ``CfnSecurityGroupIngress`` resources.
+
+``add_ingress_rules()`` returns a ``CompileReport`` with the resource-count
+reduction, which is also attached to the security group as an info annotation
+(shown by ``cdk synth``).
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+RANGE_PROTOCOLS = {"tcp", "udp", "6", "17"}
+ALL_PROTOCOLS = "-1"
+MAX_DESCRIPTION = 255
+
+
+class IngressRule(NamedTuple):
+    protocol: str
+    from_port: int
+    to_port: int
+    cidr_ip: Optional[str] = None
+    source_security_group_id: Optional[str] = None
+    # Rendered as "<PROTOCOL> <ports> <description>", e.g. "TCP 22 from home IP"
+    description: Optional[str] = None
+
+    @property
+    def source(self) -> Tuple[Optional[str], Optional[str]]:
+        return self.cidr_ip, self.source_security_group_id
+
+    @property
+    def port_label(self) -> str:
+        if self.from_port == self.to_port:
+            return str(self.from_port)
+        return f"{self.from_port}-{self.to_port}"
+
+    def render_description(self) -> Optional[str]:
+        if self.description is None:
+            return None
+        return f"{self.protocol.upper()} {self.port_label} {self.description}"[:MAX_DESCRIPTION]
+
+
+class CompileReport(NamedTuple):
+    input_rules: int
+    compiled_rules: int
+    inline_rules: int
+    standalone_rules: int
+
+    @property
+    def resources_saved(self) -> int:
+        return self.input_rules - self.standalone_rules
+
+    def __str__(self) -> str:
+        return (f"{self.input_rules} ingress rules compiled to {self.compiled_rules} "
+                f"({self.inline_rules} inline, {self.standalone_rules} standalone resources, "
+                f"{self.resources_saved} resources saved)")
+
+
+def rules_from_ports(ports: Dict[str, Iterable[int]],
+                     cidr_ip: Optional[str] = None,
+                     source_security_group_id: Optional[str] = None,
+                     description: Optional[str] = None) -> List[IngressRule]:
+    """Rules for the ``{'tcp': [22, 80], 'icmp': [-1]}`` port maps used by the stacks."""
+    return [IngressRule(protocol, port, port,
+                        cidr_ip=cidr_ip,
+                        source_security_group_id=source_security_group_id,
+                        description=description)
+            for protocol, ports_list in ports.items()
+            for port in ports_list]
+
+
+def _merge_descriptions(rules: Sequence[IngressRule]) -> Optional[str]:
+    descriptions = []
+    for rule in rules:
+        if rule.description and rule.description not in descriptions:
+            descriptions.append(rule.description)
+    return ", ".join(descriptions) or None
+
+
+def compile_rules(rules: Iterable[IngressRule]) -> List[IngressRule]:
+    """Minimal, deterministic (sorted) set of rules allowing the same traffic."""
+    groups = {}  # type: Dict[Tuple[str, Tuple[Optional[str], Optional[str]]], List[IngressRule]]
+    for rule in rules:
+        groups.setdefault((str(rule.protocol).lower(), rule.source), []).append(rule)
+
+    all_traffic_sources = {source for protocol, source in groups if protocol == ALL_PROTOCOLS}
+
+    compiled = []
+    for (protocol, source), group in groups.items():
+        if protocol != ALL_PROTOCOLS and source in all_traffic_sources:
+            continue
+        group.sort(key=lambda r: (r.from_port, r.to_port))
+
+        if protocol not in RANGE_PROTOCOLS:
+            # ICMP type/code pairs and "all traffic" can't be merged, only deduplicated
+            by_ports = {}  # type: Dict[Tuple[int, int], List[IngressRule]]
+            for rule in group:
+                by_ports.setdefault((rule.from_port, rule.to_port), []).append(rule)
+            for (from_port, to_port), same in by_ports.items():
+                compiled.append(same[0]._replace(protocol=protocol,
+                                                 description=_merge_descriptions(same)))
+            continue
+
+        run = [group[0]]
+        run_to = group[0].to_port
+        for rule in group[1:]:
+            if rule.from_port <= run_to + 1:
+                run.append(rule)
+                run_to = max(run_to, rule.to_port)
+                continue
+            compiled.append(run[0]._replace(protocol=protocol, to_port=run_to,
+                                            description=_merge_descriptions(run)))
+            run, run_to = [rule], rule.to_port
+        compiled.append(run[0]._replace(protocol=protocol, to_port=run_to,
+                                        description=_merge_descriptions(run)))
+
+    compiled.sort(key=lambda r: (r.protocol, str(r.cidr_ip), str(r.source_security_group_id),
+                                 r.from_port, r.to_port))
+    return compiled
+
+
+def add_ingress_rules(scope, id_prefix: str, security_group, rules: Iterable[IngressRule],
+                      inline: bool = True, bulk: bool = False) -> CompileReport:
+    """Compile ``rules`` and attach them to the ``ec2.CfnSecurityGroup``.
+
+    Standalone rules get logical IDs ``<id_prefix>_<protocol>_<port>`` (or
+    ``..._<from>_<to>`` for ranges), ``..._src<n>`` for the n-th source of
+    the same ports.  With ``bulk`` they are emitted in one
+    jsii call as a template fragment, with the same ID minus the non
+    alphanumeric characters as their (unhashed) logical ID.
+    """
+    from aws_cdk import core
+    from aws_cdk import aws_ec2 as ec2
+
+    from cdk_common.bulk import BulkEmitter, logical_id
+
+    rules = list(rules)
+    compiled = compile_rules(rules)
+    own_ids = {security_group.ref, security_group.attr_group_id}
+
+    inline_rules, standalone_rules = [], []
+    for rule in compiled:
+        if inline and rule.source_security_group_id not in own_ids:
+            inline_rules.append(rule)
+        else:
+            standalone_rules.append(rule)
+
+    if inline_rules:
+        existing = list(security_group.security_group_ingress or [])
+        security_group.security_group_ingress = existing + [
+            ec2.CfnSecurityGroup.IngressProperty(ip_protocol=rule.protocol,
+                                                 from_port=rule.from_port,
+                                                 to_port=rule.to_port,
+                                                 cidr_ip=rule.cidr_ip,
+                                                 source_security_group_id=rule.source_security_group_id,
+                                                 description=rule.render_description())
+            for rule in inline_rules]
+
+    emitter = BulkEmitter(scope, f"{id_prefix}_bulk")
+    for rule in standalone_rules:
+        port_id = rule.port_label.replace("-", "_") if rule.from_port >= 0 else str(rule.from_port)
+        if bulk:
+            properties = {"GroupId": security_group.attr_group_id,
+                          "IpProtocol": rule.protocol,
+                          "FromPort": rule.from_port,
+                          "ToPort": rule.to_port}
+            for key, value in (("CidrIp", rule.cidr_ip),
+                               ("SourceSecurityGroupId", rule.source_security_group_id),
+                               ("Description", rule.render_description())):
+                if value is not None:
+                    properties[key] = value
+            base_id = logical_id(id_prefix, rule.protocol,
+                                 "all" if rule.from_port < 0 else rule.port_label.replace("-", "to"))
+            # Same ports from several sources
+            rule_id, count = base_id, 1
+            while rule_id in emitter.resources:
+                count += 1
+                rule_id = f"{base_id}Src{count}"
+            emitter.add(rule_id, "AWS::EC2::SecurityGroupIngress", properties)
+            continue
+        base_id = f"{id_prefix}_{rule.protocol}_{port_id}"
+        # Same ports from several sources
+        rule_id, count = base_id, 1
+        while scope.node.try_find_child(rule_id) is not None:
+            count += 1
+            rule_id = f"{base_id}_src{count}"
+        ec2.CfnSecurityGroupIngress(scope, id=rule_id,
+                                    group_id=security_group.attr_group_id,
+                                    ip_protocol=rule.protocol,
+                                    cidr_ip=rule.cidr_ip,
+                                    source_security_group_id=rule.source_security_group_id,
+                                    from_port=rule.from_port,
+                                    to_port=rule.to_port,
+                                    description=rule.render_description())
+
+    emitter.emit()
+
+    report = CompileReport(len(rules), len(compiled), len(inline_rules), len(standalone_rules))
+    core.Annotations.of(security_group).add_info(str(report))
+    return report
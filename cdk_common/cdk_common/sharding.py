@@ -0,0 +1,461 @@
+"""Split large synthesized templates into nested stacks.
+
+A stack holds at most 500 resources and 1 MB of template; scaled-up variants
+of the stacks (hundreds of instances, subnets or standalone ingress rules)
+get there quickly.  ``shard_assembly()`` rewrites such templates of a cloud
+assembly after synth:
+
+* "hub" resources referenced by many others (the VPC, security groups) and
+  everything they depend on stay in the parent stack, along with conditional
+  resources and the CDK metadata;
+* the other resources are assigned in dependency order to the shard holding
+  most of their dependencies, as long as it has room and no cycle between
+  shards appears, so that related resources (a subnet, its route table and
+  association) end up together;
+* every shard becomes an ``AWS::CloudFormation::Stack``.  References across
+  stacks are wired through nested stack parameters (parent -> shard) and
+  outputs (shard -> parent/other shards); ``DependsOn`` edges that cross a
+  shard boundary become edges between the nested stacks.
+
+Shards that don't depend on each other are deployed by CloudFormation in
+parallel.  The shard templates are file assets of the parent stack, uploaded
+by ``cdk deploy`` like the templates of ``core.NestedStack``.
+
+By default only templates over the CloudFormation limits are sharded (into
+shards of ``DEFAULT_SHARD_SIZE`` resources); ``-c sharding:maxResources=N``
+shards every template over N resources into shards of at most N.  The plan
+and the expected critical path are printed on stderr:
+
+    $ cdk synth -c sharding:maxResources=100
+    $ python -m cdk_common.sharding cdk.out --max-resources 100   # plan only
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from cdk_common.template_graph import TemplateGraph, _depends_on, _template_files
+
+
+MAX_RESOURCES = 500
+MAX_TEMPLATE_BYTES = 1000000
+MAX_PARAMETERS = 200
+MAX_OUTPUTS = 200
+DEFAULT_SHARD_SIZE = 100
+# Resources referenced by at least this many others stay in the parent
+DEFAULT_HUB_FANOUT = 8
+# Seconds CloudFormation adds around the resources of a nested stack
+NESTED_STACK_OVERHEAD = 30
+
+NESTED_SUFFIX = ".nested.template.json"
+
+_SUB_REFERENCE = re.compile(r"\$\{([A-Za-z0-9]+)(?:\.([A-Za-z0-9.]+))?\}")
+
+# (logical ID, attribute or None for Ref) -> replacement expression, None keeps the reference
+Resolver = Callable[[str, Optional[str]], Optional[Any]]
+
+
+class ShardingError(ValueError):
+    pass
+
+
+class ShardPlan(NamedTuple):
+    # Logical IDs kept in the parent stack
+    parent: List[str]
+    # Logical IDs of every shard, in creation order
+    shards: List[List[str]]
+
+    def shard_of(self) -> Dict[str, int]:
+        return {name: index for index, names in enumerate(self.shards) for name in names}
+
+
+def _pinned(graph: TemplateGraph, hub_fanout: int) -> Set[str]:
+    dependents = {}  # type: Dict[str, int]
+    for name in graph.resources:
+        for dep in graph.dependencies(name):
+            dependents[dep] = dependents.get(dep, 0) + 1
+    roots = set()
+    for name, resource in graph.resources.items():
+        if (resource.get("Type") == "AWS::CDK::Metadata" or "Condition" in resource
+                or '"Fn::If"' in json.dumps(resource) or dependents.get(name, 0) >= hub_fanout):
+            roots.add(name)
+    # What the parent keeps can't depend on a shard
+    pinned, stack = set(roots), list(roots)
+    while stack:
+        for dep in graph.dependencies(stack.pop()):
+            if dep not in pinned:
+                pinned.add(dep)
+                stack.append(dep)
+    return pinned
+
+
+def _components(graph: TemplateGraph, order: List[str]) -> List[List[str]]:
+    """Connected groups of ``order`` (ignoring edge directions), in ``order``."""
+    group = {name: name for name in order}
+
+    def find(name: str) -> str:
+        while group[name] != name:
+            group[name] = group[group[name]]
+            name = group[name]
+        return name
+
+    for name in order:
+        for dep in graph.dependencies(name):
+            if dep in group:
+                group[find(dep)] = find(name)
+    components = {}  # type: Dict[str, List[str]]
+    for name in order:
+        components.setdefault(find(name), []).append(name)
+    return list(components.values())
+
+
+def plan_shards(template: Dict[str, Any], max_resources: int = DEFAULT_SHARD_SIZE,
+                hub_fanout: int = DEFAULT_HUB_FANOUT,
+                max_bytes: int = MAX_TEMPLATE_BYTES // 2) -> ShardPlan:
+    """Partition the resources of ``template`` by dependency locality.
+
+    Groups of resources connected to each other (but not through the parent)
+    are packed whole into shards, so shards rarely depend on each other and
+    deploy in parallel; groups larger than a shard are split along their
+    dependency order."""
+    graph = TemplateGraph(template)
+    pinned = _pinned(graph, hub_fanout)
+    sizes = {name: len(json.dumps(resource)) for name, resource in graph.resources.items()}
+    shard_of = {}  # type: Dict[str, int]
+    shards, shard_bytes, shard_deps = [], [], []  # type: List[List[str]], List[int], List[Set[int]]
+
+    def reaches(source: int, target: int) -> bool:
+        seen, stack = {source}, [source]
+        while stack:
+            for dep in shard_deps[stack.pop()]:
+                if dep == target:
+                    return True
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+        return False
+
+    def fits(index: int, count: int, size: int) -> bool:
+        return len(shards[index]) + count <= max_resources and shard_bytes[index] + size <= max_bytes
+
+    def place(name: str, index: Optional[int]) -> None:
+        if index is None:
+            index = len(shards)
+            shards.append([])
+            shard_bytes.append(0)
+            shard_deps.append(set())
+        shards[index].append(name)
+        shard_bytes[index] += sizes[name]
+        shard_deps[index].update({shard_of[dep] for dep in graph.dependencies(name) if dep in shard_of} - {index})
+        shard_of[name] = index
+
+    # Depth first from the resources nothing depends on, so that each one is
+    # visited right after its own dependencies
+    has_dependents = {dep for name in graph.resources for dep in graph.dependencies(name)}
+    leaves = sorted(name for name in graph.resources if name not in has_dependents)
+    order = [name for name in graph.topological_order(roots=leaves) if name not in pinned]
+
+    for component in _components(graph, order):
+        component_bytes = sum(sizes[name] for name in component)
+        if len(component) <= max_resources and component_bytes <= max_bytes:
+            # First fit: no edge leaves the group, so no cycle between shards
+            index = next((index for index in range(len(shards))
+                          if fits(index, len(component), component_bytes)), None)
+            for name in component:
+                place(name, index)
+                index = shard_of[name]
+            continue
+
+        for name in component:
+            dep_shards = [shard_of[dep] for dep in graph.dependencies(name) if dep in shard_of]
+            counts = {index: dep_shards.count(index) for index in dep_shards}
+            candidates = sorted(counts, key=lambda index: (-counts[index], index))
+            if shards and len(shards) - 1 not in candidates:
+                # Otherwise keep filling the latest shard
+                candidates.append(len(shards) - 1)
+            chosen = None
+            for index in candidates:
+                if not fits(index, 1, sizes[name]):
+                    continue
+                if any(reaches(other, index) for other in set(dep_shards) - {index}):
+                    continue
+                chosen = index
+                break
+            place(name, chosen)
+
+    parent = [name for name in graph.resources if name in pinned]
+    return ShardPlan(parent, shards)
+
+
+def _rewrite(value: Any, resolve: Resolver) -> Any:
+    """Copy of ``value`` with the Ref/GetAtt/Sub references replaced by ``resolve``."""
+    if isinstance(value, list):
+        return [_rewrite(item, resolve) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        key, item = next(iter(value.items()))
+        if key == "Ref" and isinstance(item, str):
+            replacement = resolve(item, None)
+            return value if replacement is None else replacement
+        if key == "Fn::GetAtt":
+            target, attribute = item if isinstance(item, list) else str(item).split(".", 1)
+            replacement = resolve(target, attribute)
+            return value if replacement is None else replacement
+        if key == "Fn::Sub":
+            template, variables = (item[0], dict(item[1]) if len(item) > 1 else {}) \
+                if isinstance(item, list) else (item, {})
+            variables = {name: _rewrite(variable, resolve) for name, variable in variables.items()}
+
+            def replace(match):
+                target, attribute = match.group(1), match.group(2)
+                if target in variables:
+                    return match.group(0)
+                replacement = resolve(target, attribute)
+                if replacement is None:
+                    return match.group(0)
+                variable = target + (attribute or "").replace(".", "")
+                variables[variable] = replacement
+                return "${" + variable + "}"
+
+            template = _SUB_REFERENCE.sub(replace, template)
+            return {"Fn::Sub": [template, variables] if variables else template}
+    return {key: _rewrite(item, resolve) for key, item in value.items()}
+
+
+def _exported_name(target: str, attribute: Optional[str]) -> str:
+    return target + re.sub(r"[^A-Za-z0-9]", "", attribute or "Ref")
+
+
+def _reference(target: str, attribute: Optional[str]) -> Dict[str, Any]:
+    return {"Ref": target} if attribute is None else {"Fn::GetAtt": [target, attribute]}
+
+
+def _template_url(key_parameter: str, bucket_parameter: str) -> Dict[str, Any]:
+    key = {"Fn::Split": ["||", {"Ref": key_parameter}]}
+    return {"Fn::Join": ["", ["https://s3.", {"Ref": "AWS::Region"}, ".", {"Ref": "AWS::URLSuffix"}, "/",
+                              {"Ref": bucket_parameter}, "/",
+                              {"Fn::Select": [0, key]}, {"Fn::Select": [1, key]}]]}
+
+
+class ShardedTemplate(NamedTuple):
+    parent: Dict[str, Any]
+    # shard logical ID -> template
+    children: Dict[str, Dict[str, Any]]
+
+
+def apply_plan(template: Dict[str, Any], plan: ShardPlan, prefix: str = "Shard") -> ShardedTemplate:
+    """Parent template with a nested stack per shard, and the shard templates.
+    The ``TemplateURL`` of the nested stacks is added by ``shard_assembly``."""
+    resources = template.get("Resources", {})
+    shard_of = plan.shard_of()
+    shard_ids = [f"{prefix}{index + 1:02d}" for index in range(len(plan.shards))]
+    clash = set(shard_ids) & set(resources)
+    if clash:
+        raise ShardingError(f"Shard logical IDs {sorted(clash)} are used by resources of the template")
+
+    children = [{"Resources": {}, "Parameters": {}, "Outputs": {}} for _ in plan.shards]
+    stack_parameters = [{} for _ in plan.shards]  # type: List[Dict[str, Any]]
+    stack_depends_on = [set() for _ in plan.shards]  # type: List[Set[str]]
+
+    def output_of(target: str, attribute: Optional[str]) -> Dict[str, Any]:
+        """Expose a shard resource to the parent, as GetAtt of the nested stack output."""
+        index = shard_of[target]
+        name = _exported_name(target, attribute)
+        children[index]["Outputs"][name] = {"Value": _reference(target, attribute)}
+        return {"Fn::GetAtt": [shard_ids[index], f"Outputs.{name}"]}
+
+    def child_resolver(index: int) -> Resolver:
+        def resolve(target: str, attribute: Optional[str]) -> Optional[Any]:
+            if shard_of.get(target) == index or target.startswith("AWS::"):
+                return None
+            if target in template.get("Parameters", {}):
+                children[index]["Parameters"][target] = dict(template["Parameters"][target])
+                stack_parameters[index][target] = {"Ref": target}
+                return None
+            if target not in resources:
+                return None
+            name = _exported_name(target, attribute)
+            children[index]["Parameters"][name] = {"Type": "String"}
+            if target in shard_of:
+                stack_parameters[index][name] = output_of(target, attribute)
+            else:
+                stack_parameters[index][name] = _reference(target, attribute)
+            return {"Ref": name}
+        return resolve
+
+    def parent_resolve(target: str, attribute: Optional[str]) -> Optional[Any]:
+        return output_of(target, attribute) if target in shard_of else None
+
+    for index, names in enumerate(plan.shards):
+        resolve = child_resolver(index)
+        for name in names:
+            resource = {key: _rewrite(value, resolve) if key not in ("Type", "DependsOn", "Metadata") else value
+                        for key, value in resources[name].items()}
+            kept = []
+            for dep in _depends_on(resources[name]):
+                if shard_of.get(dep) == index:
+                    kept.append(dep)
+                elif dep in shard_of:
+                    stack_depends_on[index].add(shard_ids[shard_of[dep]])
+                elif dep in resources:
+                    stack_depends_on[index].add(dep)
+            resource.pop("DependsOn", None)
+            if kept:
+                resource["DependsOn"] = kept
+            children[index]["Resources"][name] = resource
+        if "Mappings" in template:
+            children[index]["Mappings"] = template["Mappings"]
+
+    parent = {key: value for key, value in template.items() if key not in ("Resources", "Outputs")}
+    parent["Resources"] = {}
+    for name in plan.parent:
+        resource = {key: _rewrite(value, parent_resolve) if key not in ("Type", "DependsOn", "Metadata") else value
+                    for key, value in resources[name].items()}
+        if "DependsOn" in resource:
+            resource["DependsOn"] = sorted({shard_ids[shard_of[dep]] if dep in shard_of else dep
+                                            for dep in _depends_on(resources[name])})
+        parent["Resources"][name] = resource
+    if "Outputs" in template:
+        parent["Outputs"] = _rewrite(template["Outputs"], parent_resolve)
+
+    for index, shard_id in enumerate(shard_ids):
+        child = children[index]
+        for section, limit in (("Parameters", MAX_PARAMETERS), ("Outputs", MAX_OUTPUTS)):
+            if len(child[section]) > limit:
+                raise ShardingError(f"{shard_id} needs {len(child[section])} {section.lower()} "
+                                    f"(limit {limit}), use larger shards")
+            if not child[section]:
+                del child[section]
+        nested = {"Type": "AWS::CloudFormation::Stack", "Properties": {}}
+        if stack_parameters[index]:
+            nested["Properties"]["Parameters"] = stack_parameters[index]
+        # References between shards already order the nested stacks
+        explicit = sorted(dep for dep in stack_depends_on[index] if dep != shard_id)
+        if explicit:
+            nested["DependsOn"] = explicit
+        parent["Resources"][shard_id] = nested
+    return ShardedTemplate(parent, dict(zip(shard_ids, children)))
+
+
+def critical_path(sharded: ShardedTemplate) -> Tuple[float, List[str]]:
+    """Expected critical path of the sharded stack, a nested stack lasting
+    as long as its own critical path plus ``NESTED_STACK_OVERHEAD``."""
+    durations = {shard_id: TemplateGraph(child).critical_path()[0] + NESTED_STACK_OVERHEAD
+                 for shard_id, child in sharded.children.items()}
+    return TemplateGraph(sharded.parent, resource_durations=durations).critical_path()
+
+
+def describe(name: str, template: Dict[str, Any], sharded: ShardedTemplate) -> str:
+    before = TemplateGraph(template).critical_path()[0]
+    after, path = critical_path(sharded)
+    lines = [f"{name}: {len(template.get('Resources', {}))} resources -> "
+             f"{len(sharded.parent['Resources']) - len(sharded.children)} in the parent + "
+             f"{len(sharded.children)} nested stacks; critical path ~{before:.0f}s -> ~{after:.0f}s",
+             f"  {'shard':<10} {'resources':>9} {'bytes':>9} {'params':>7} {'outputs':>8}  depends on"]
+    graph = TemplateGraph(sharded.parent)
+    for shard_id, child in sharded.children.items():
+        nested = sharded.parent["Resources"][shard_id]
+        depends = sorted(dep for dep in graph.dependencies(shard_id) if dep in sharded.children)
+        lines.append(f"  {shard_id:<10} {len(child['Resources']):>9} {len(json.dumps(child)):>9} "
+                     f"{len(nested['Properties'].get('Parameters', {})):>7} "
+                     f"{len(child.get('Outputs', {})):>8}  {', '.join(depends) or '-'}")
+    lines.append(f"  critical path: {' -> '.join(path)}")
+    return "\n".join(lines)
+
+
+def _needs_sharding(template: Dict[str, Any], max_resources: Optional[int]) -> bool:
+    count = len(template.get("Resources", {}))
+    if max_resources:
+        return count > max_resources
+    return count > MAX_RESOURCES or len(json.dumps(template)) > MAX_TEMPLATE_BYTES
+
+
+def _add_asset(directory: str, template_file: str, asset_path: str) -> Tuple[str, str, str]:
+    """Register ``asset_path`` as a file asset of the stack synthesized to
+    ``template_file``; returns the bucket, key and hash parameter names."""
+    with open(os.path.join(directory, asset_path), 'rb') as asset_file:
+        asset_hash = hashlib.sha256(asset_file.read()).hexdigest()
+    suffix = asset_hash[:8].upper()
+    parameters = {"s3BucketParameter": f"AssetParameters{asset_hash}S3Bucket{suffix}",
+                  "s3KeyParameter": f"AssetParameters{asset_hash}S3VersionKey{suffix}",
+                  "artifactHashParameter": f"AssetParameters{asset_hash}ArtifactHash{suffix}"}
+
+    manifest_path = os.path.join(directory, "manifest.json")
+    with open(manifest_path, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    for artifact_id, artifact in manifest.get("artifacts", {}).items():
+        if artifact.get("properties", {}).get("templateFile") == template_file:
+            entries = artifact.setdefault("metadata", {}).setdefault(f"/{artifact_id}", [])
+            entries.append({"type": "aws:cdk:asset",
+                            "data": dict(parameters, path=asset_path, id=asset_hash,
+                                         packaging="file", sourceHash=asset_hash)})
+            break
+    else:
+        raise ShardingError(f"No stack artifact synthesizes {template_file}")
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return parameters["s3BucketParameter"], parameters["s3KeyParameter"], parameters["artifactHashParameter"]
+
+
+def shard_assembly(directory: str, max_resources: Optional[int] = None,
+                   hub_fanout: int = DEFAULT_HUB_FANOUT, file=sys.stderr) -> int:
+    """Shard the templates of a cloud assembly that need it; returns the
+    number of nested stacks created."""
+    created = 0
+    for path in _template_files(directory):
+        if path.endswith(NESTED_SUFFIX):
+            continue
+        with open(path, 'r') as template_file:
+            template = json.load(template_file)
+        if not _needs_sharding(template, max_resources):
+            continue
+        plan = plan_shards(template, max_resources or DEFAULT_SHARD_SIZE, hub_fanout)
+        sharded = apply_plan(template, plan)
+        template_file_name = os.path.basename(path)
+        stack_name = template_file_name[:-len(".template.json")]
+        print(describe(stack_name, template, sharded), file=file)
+
+        parent = sharded.parent
+        parent.setdefault("Parameters", {})
+        for shard_id, child in sharded.children.items():
+            asset_path = f"{stack_name}{shard_id}{NESTED_SUFFIX}"
+            with open(os.path.join(directory, asset_path), 'w') as child_file:
+                json.dump(child, child_file, indent=1)
+            bucket, key, artifact_hash = _add_asset(directory, template_file_name, asset_path)
+            parent["Parameters"][bucket] = {"Type": "String", "Description": f'S3 bucket for {asset_path}'}
+            parent["Parameters"][key] = {"Type": "String", "Description": f'S3 key for {asset_path}'}
+            parent["Parameters"][artifact_hash] = {"Type": "String",
+                                                   "Description": f'Artifact hash for {asset_path}'}
+            parent["Resources"][shard_id]["Properties"]["TemplateURL"] = _template_url(key, bucket)
+        with open(path, 'w') as template_file:
+            json.dump(parent, template_file, indent=1)
+        created += len(sharded.children)
+    return created
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Nested stack sharding plan of CloudFormation templates")
+    parser.add_argument("path", help="template file or cloud assembly directory (cdk.out)")
+    parser.add_argument("--max-resources", type=int, default=DEFAULT_SHARD_SIZE,
+                        help=f"resources per shard (default {DEFAULT_SHARD_SIZE})")
+    parser.add_argument("--hub-fanout", type=int, default=DEFAULT_HUB_FANOUT,
+                        help="resources referenced this many times stay in the parent")
+    args = parser.parse_args(argv)
+
+    for path in _template_files(args.path):
+        if path.endswith(NESTED_SUFFIX):
+            continue
+        with open(path, 'r') as template_file:
+            template = json.load(template_file)
+        plan = plan_shards(template, args.max_resources, args.hub_fanout)
+        print(describe(os.path.basename(path), template, apply_plan(template, plan)))
+        print()
+
+
+if __name__ == "__main__":
+    main()
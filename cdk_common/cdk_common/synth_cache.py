@@ -0,0 +1,228 @@
+"""Content-addressed cache of synthesized cloud assemblies.
+
+Building the construct tree through jsii and synthesizing it is most of the
+wall time of ``cdk synth``, even when nothing that ends up in the templates
+changed.  ``SynthCache.run(build)`` hashes everything the synth depends on:
+
+* the app's sources (``app.py``, the stack package, including ``configure.sh``
+  and any other data file, and ``cdk_common`` itself);
+* the context values (``CDK_CONTEXT_JSON``, minus cached lookup entries);
+* ``CDK_DEFAULT_ACCOUNT``/``CDK_DEFAULT_REGION`` and the installed CDK version;
+* the resolved lookups (home IP, AMI ID, AZs), of every region the app
+  builds stacks for when it passes ``lookups=``;
+
+and when an assembly for that key exists it is copied to the output directory
+without importing ``aws_cdk`` at all.  Otherwise ``build()`` runs and its
+assembly is stored under ``.cdk.synth-cache/<key>``.
+
+Force a rebuild with ``cdk synth -c synthCache:rebuild=true``,
+``CDK_SYNTH_REBUILD=1`` or ``python app.py --rebuild``, and disable the cache
+with ``-c synthCache:disable=true``.  Every run prints a hit/miss line on
+stderr; ``python -m cdk_common.synth_cache <project dir>`` prints the totals.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from cdk_common.lookups import LookupCache, Lookups, _is_truthy
+
+
+CACHE_DIR = ".cdk.synth-cache"
+STATS_FILE = "stats.json"
+MAX_ENTRIES = 10
+
+# Bump when the layout of the cache (or what goes into the key) changes
+KEY_VERSION = "1"
+
+SKIPPED_DIRS = {"__pycache__", ".venv", "cdk.out", CACHE_DIR, ".pytest_cache"}
+SKIPPED_SUFFIXES = (".pyc", ".swp", ".egg-info")
+
+COMMON_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def app_context() -> Dict[str, Any]:
+    """Context the CDK CLI hands to the app, without creating a ``core.App``."""
+    try:
+        context = json.loads(os.environ.get("CDK_CONTEXT_JSON") or "{}")
+    except ValueError:
+        return {}
+    return context if isinstance(context, dict) else {}
+
+
+def _source_files(root: str) -> Iterable[str]:
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames
+                             if d not in SKIPPED_DIRS and not d.endswith(SKIPPED_SUFFIXES))
+        for filename in sorted(filenames):
+            if not filename.endswith(SKIPPED_SUFFIXES):
+                yield os.path.join(dirpath, filename)
+
+
+def _copy_tree(src: str, dst: str) -> None:
+    # shutil.copytree() only learned to copy into an existing directory in 3.8
+    os.makedirs(dst, exist_ok=True)
+    for name in os.listdir(src):
+        src_path, dst_path = os.path.join(src, name), os.path.join(dst, name)
+        if os.path.isdir(src_path):
+            _copy_tree(src_path, dst_path)
+        else:
+            shutil.copy2(src_path, dst_path)
+
+
+def _cdk_version() -> Optional[str]:
+    try:
+        from importlib import metadata
+    except ImportError:
+        return None
+    try:
+        return metadata.version("aws-cdk.core")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+class SynthCache:
+    """Skips construction and synth of an app whose inputs did not change."""
+
+    def __init__(self,
+                 project_dir: str,
+                 sources: Iterable[str],
+                 context: Optional[Dict[str, Any]] = None,
+                 outdir: Optional[str] = None,
+                 rebuild: Optional[bool] = None,
+                 lookups: Optional[Callable[[], Dict[str, Any]]] = None) -> None:
+        self.project_dir = os.path.abspath(project_dir)
+        self.cache_dir = os.path.join(self.project_dir, CACHE_DIR)
+        self.sources = [os.path.abspath(source) for source in sources]
+        self.context = app_context() if context is None else context
+        self.outdir = outdir or os.environ.get("CDK_OUTDIR")
+        if rebuild is None:
+            rebuild = (_is_truthy(self.context.get("synthCache:rebuild", False))
+                       or _is_truthy(os.environ.get("CDK_SYNTH_REBUILD", ""))
+                       or "--rebuild" in sys.argv[1:])
+        self.rebuild = rebuild
+        self.disabled = _is_truthy(self.context.get("synthCache:disable", False))
+        # The lookups of the default region unless the app resolves more
+        self._lookups = lookups
+        self._key = None  # type: Optional[str]
+
+    @classmethod
+    def for_app(cls, app_file: str, package: str, **kwargs) -> "SynthCache":
+        """Cache for the ``app.py`` of one of the projects and its stack package."""
+        project_dir = os.path.dirname(os.path.abspath(app_file))
+        return cls(project_dir,
+                   sources=[app_file, os.path.join(project_dir, package), COMMON_DIR],
+                   **kwargs)
+
+    def lookups(self) -> Dict[str, Any]:
+        if self._lookups is not None:
+            return self._lookups()
+        # Same shared instance the stacks use, so they don't resolve twice
+        return Lookups.from_context(self.context.get).prefetch()
+
+    def key(self) -> str:
+        if self._key is not None:
+            return self._key
+        digest = hashlib.sha256()
+
+        def update(label: str, data: bytes) -> None:
+            digest.update(f"{label}:{len(data)}:".encode())
+            digest.update(data)
+
+        update("version", KEY_VERSION.encode())
+        for source in self.sources:
+            files = [source] if os.path.isfile(source) else _source_files(source)
+            for path in files:
+                with open(path, 'rb') as source_file:
+                    update(os.path.relpath(path, os.path.dirname(source)), source_file.read())
+
+        context = {key: value for key, value in self.context.items()
+                   if not LookupCache.is_entry(key, value) and not key.startswith("synthCache:")}
+        update("context", json.dumps(context, sort_keys=True).encode())
+        update("env", json.dumps([os.environ.get("CDK_DEFAULT_ACCOUNT"),
+                                  os.environ.get("CDK_DEFAULT_REGION"),
+                                  _cdk_version()]).encode())
+        update("lookups", json.dumps(self.lookups(), sort_keys=True).encode())
+        self._key = digest.hexdigest()
+        return self._key
+
+    def run(self, build: Callable[[], str]) -> str:
+        """Restore the cached assembly or call ``build()`` (which returns the
+        assembly directory) and cache its result.  Returns the assembly directory.
+        """
+        started = time.perf_counter()
+        if self.disabled:
+            return build()
+
+        key = self.key()
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry) and not self.rebuild:
+            assembly = self._restore(entry)
+            self._record("hit", key, time.perf_counter() - started)
+            return assembly
+
+        assembly = build()
+        self._store(assembly, entry)
+        self._record("rebuild" if self.rebuild else "miss", key, time.perf_counter() - started)
+        return assembly
+
+    def _restore(self, entry: str) -> str:
+        os.utime(entry)  # Keeps recently used entries from being evicted
+        if not self.outdir:
+            return entry
+        _copy_tree(entry, self.outdir)
+        return self.outdir
+
+    def _store(self, assembly: str, entry: str) -> None:
+        tmp_entry = f"{entry}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        shutil.copytree(assembly, tmp_entry)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_entry, entry)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+        entries = sorted((path for path in entries if os.path.isdir(path) and not path.endswith(".tmp")),
+                         key=os.path.getmtime, reverse=True)
+        for stale in entries[MAX_ENTRIES:]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            with open(os.path.join(self.cache_dir, STATS_FILE), 'r') as stats_file:
+                return json.load(stats_file)
+        except (OSError, ValueError):
+            return {"hit": 0, "miss": 0, "rebuild": 0}
+
+    def _record(self, outcome: str, key: str, elapsed: float) -> None:
+        print(f"synth cache {outcome.upper()} {key[:12]} ({elapsed:.2f}s) "
+              f"{os.path.basename(self.project_dir)}", file=sys.stderr)
+        stats = self.stats()
+        stats[outcome] = stats.get(outcome, 0) + 1
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, STATS_FILE), 'w') as stats_file:
+            json.dump(stats, stats_file, indent=2, sort_keys=True)
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print synth cache hits and misses")
+    parser.add_argument("project_dirs", nargs="+")
+    args = parser.parse_args(argv)
+
+    print(f"{'project':<20} {'hits':>6} {'misses':>7} {'rebuilds':>9} {'hit rate':>9}")
+    for project_dir in args.project_dirs:
+        stats = SynthCache(project_dir, sources=[], context={}).stats()
+        total = sum(stats.values())
+        rate = stats.get("hit", 0) / total if total else 0.0
+        print(f"{os.path.basename(os.path.abspath(project_dir)):<20} {stats.get('hit', 0):>6} "
+              f"{stats.get('miss', 0):>7} {stats.get('rebuild', 0):>9} {rate:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""Resource dependency graph of a synthesized CloudFormation template.
+
+CloudFormation creates resources in parallel unless one depends on another,
+through a ``Ref``/``Fn::GetAtt``/``Fn::Sub`` reference or an explicit
+``DependsOn``.  The stacks add several explicit ``DependsOn`` edges
+(``add_depends_on``); this module builds the resource DAG from the template
+and classifies every explicit edge:
+
+* ``implied``: the resource already references its dependency;
+* ``transitive``: the dependency is already reached through other edges;
+* ``serializing``: nothing else orders the two resources, so the edge only
+  delays the dependent one (possibly lengthening the critical path).
+
+The first two can always be removed; serializing edges are reported with the
+time removing them would save on the critical path, computed from rough
+per-resource-type creation times (``DURATIONS``).  Pruning never removes an
+edge ``warnings()`` relies on, even with ``--prune all``: a route through an
+internet gateway keeps its ``DependsOn`` on the gateway attachment, an
+instance running user data keeps its ``DependsOn`` on the default route (NAT
+or internet gateway) of its subnet.  Other serializing edges can still stand
+for an ordering the template doesn't show (something the instance reaches at
+boot), so ``all`` is not safe in general: every serializing edge it drops is
+printed, to be reviewed.
+
+    $ python -m cdk_common.template_graph cdk.out
+    $ python -m cdk_common.template_graph cdk.out/create-basic-vpc.template.json --prune redundant
+
+In an app, ``prune_assembly()`` rewrites the templates of a cloud assembly
+after synth (the ``dependencies:prune`` context value).
+"""
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+# Rough creation times in seconds, used to weight the critical path
+DURATIONS = {
+    "AWS::EC2::VPC": 15,
+    "AWS::EC2::Subnet": 5,
+    "AWS::EC2::RouteTable": 5,
+    "AWS::EC2::SubnetRouteTableAssociation": 5,
+    "AWS::EC2::Route": 5,
+    "AWS::EC2::InternetGateway": 15,
+    "AWS::EC2::VPCGatewayAttachment": 20,
+    "AWS::EC2::EIP": 5,
+    "AWS::EC2::NatGateway": 120,
+    "AWS::EC2::VPCEndpoint": 60,
+    "AWS::EC2::SecurityGroup": 10,
+    "AWS::EC2::SecurityGroupIngress": 5,
+    "AWS::EC2::SecurityGroupEgress": 5,
+    "AWS::EC2::Instance": 60,
+    "AWS::EC2::LaunchTemplate": 5,
+    "AWS::EC2::PlacementGroup": 5,
+    "AWS::ElasticLoadBalancingV2::LoadBalancer": 180,
+    "AWS::ElasticLoadBalancingV2::TargetGroup": 15,
+    "AWS::ElasticLoadBalancingV2::Listener": 5,
+    "AWS::AutoScaling::AutoScalingGroup": 120,
+    "AWS::AutoScaling::ScalingPolicy": 5,
+    "AWS::AutoScaling::WarmPool": 60,
+    "AWS::CloudFront::Distribution": 300,
+    "AWS::CloudFormation::Stack": 60,
+    "AWS::CDK::Metadata": 0,
+}
+DEFAULT_DURATION = 10
+
+IMPLIED = "implied"
+TRANSITIVE = "transitive"
+SERIALIZING = "serializing"
+
+_SUB_REFERENCE = re.compile(r"\$\{([A-Za-z0-9]+)(?:\.[A-Za-z0-9.]+)?\}")
+
+
+class EdgeReport(NamedTuple):
+    resource: str
+    depends_on: str
+    kind: str
+    # Seconds the critical path gets shorter when only this edge is removed
+    saving: float
+
+
+def _references(value: Any, found: Set[str]) -> Set[str]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "Ref" and isinstance(item, str):
+                found.add(item)
+            elif key == "Fn::GetAtt":
+                found.add(item[0] if isinstance(item, list) else str(item).split(".")[0])
+            elif key == "Fn::Sub":
+                template = item[0] if isinstance(item, list) else item
+                found.update(_SUB_REFERENCE.findall(template))
+                if isinstance(item, list) and len(item) > 1:
+                    _references(item[1], found)
+            else:
+                _references(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _references(item, found)
+    return found
+
+
+def _ref(value: Any) -> Optional[str]:
+    return value.get("Ref") if isinstance(value, dict) else None
+
+
+def _depends_on(resource: Dict[str, Any]) -> List[str]:
+    depends_on = resource.get("DependsOn", [])
+    return [depends_on] if isinstance(depends_on, str) else list(depends_on)
+
+
+class TemplateGraph:
+    """DAG of the resources of one template (edges point at dependencies)."""
+
+    def __init__(self, template: Dict[str, Any], durations: Optional[Dict[str, float]] = None,
+                 resource_durations: Optional[Dict[str, float]] = None) -> None:
+        self.template = template
+        self.resources = template.get("Resources", {})  # type: Dict[str, Dict[str, Any]]
+        self.durations = dict(DURATIONS, **(durations or {}))
+        # Per logical ID, e.g. the critical path of a nested stack
+        self.resource_durations = resource_durations or {}
+        self.references = {}  # type: Dict[str, Set[str]]
+        self.explicit = {}  # type: Dict[str, Set[str]]
+        for name, resource in self.resources.items():
+            refs = _references({key: value for key, value in resource.items()
+                                if key not in ("Type", "DependsOn", "Metadata")}, set())
+            self.references[name] = {ref for ref in refs if ref in self.resources and ref != name}
+            self.explicit[name] = {dep for dep in _depends_on(resource) if dep in self.resources}
+
+    def duration(self, name: str) -> float:
+        if name in self.resource_durations:
+            return self.resource_durations[name]
+        return self.durations.get(self.resources[name].get("Type"), DEFAULT_DURATION)
+
+    def dependencies(self, name: str, without: Optional[Tuple[str, str]] = None) -> Set[str]:
+        deps = self.references[name] | self.explicit[name]
+        if without is not None and without[0] == name and without[1] not in self.references[name]:
+            deps = deps - {without[1]}
+        return deps
+
+    def topological_order(self, roots: Optional[Iterable[str]] = None) -> List[str]:
+        """Dependencies first, depth first from ``roots`` (then the rest)."""
+        order, state = [], {}  # type: List[str], Dict[str, int]
+        for root in list(roots or []) + sorted(self.resources):
+            if root in state:
+                continue
+            stack = [(root, iter(sorted(self.dependencies(root))))]
+            state[root] = 1
+            while stack:
+                node, deps = stack[-1]
+                for dep in deps:
+                    if state.get(dep) == 1:
+                        raise ValueError(f"Circular dependency between {node} and {dep}")
+                    if dep not in state:
+                        state[dep] = 1
+                        stack.append((dep, iter(sorted(self.dependencies(dep)))))
+                        break
+                else:
+                    stack.pop()
+                    state[node] = 2
+                    order.append(node)
+        return order
+
+    def critical_path(self, without: Optional[Tuple[str, str]] = None) -> Tuple[float, List[str]]:
+        """(estimated seconds, resources) of the longest chain of dependencies."""
+        finish, previous = {}, {}  # type: Dict[str, float], Dict[str, Optional[str]]
+        for name in self.topological_order():
+            start, before = 0.0, None
+            for dep in self.dependencies(name, without):
+                if finish[dep] > start:
+                    start, before = finish[dep], dep
+            finish[name], previous[name] = start + self.duration(name), before
+        if not finish:
+            return 0.0, []
+        node = max(sorted(finish), key=finish.get)
+        total, path = finish[node], []
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        return total, path[::-1]
+
+    def _reachable(self, source: str, target: str, without: Optional[Tuple[str, str]] = None) -> bool:
+        seen, stack = {source}, [source]
+        while stack:
+            for dep in self.dependencies(stack.pop(), without):
+                if dep == target:
+                    return True
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+        return False
+
+    def classify(self, savings: bool = True) -> List[EdgeReport]:
+        total = self.critical_path()[0] if savings else 0.0
+        reports = []
+        for name in sorted(self.explicit):
+            for dep in sorted(self.explicit[name]):
+                if dep in self.references[name]:
+                    kind = IMPLIED
+                elif self._reachable(name, dep, without=(name, dep)):
+                    kind = TRANSITIVE
+                else:
+                    kind = SERIALIZING
+                saving = 0.0
+                if savings and kind == SERIALIZING:
+                    saving = total - self.critical_path(without=(name, dep))[0]
+                reports.append(EdgeReport(name, dep, kind, saving))
+        return reports
+
+    def warnings(self) -> List[str]:
+        """Dependencies CloudFormation needs but that no reference implies:
+        routes through an internet gateway on its attachment, instances
+        running user data (yum, ...) on the default route of their subnet."""
+        attachments = {}  # type: Dict[str, str]
+        route_tables = {}  # type: Dict[str, str]
+        default_routes = {}  # type: Dict[str, str]
+        for name, resource in sorted(self.resources.items()):
+            properties = resource.get("Properties", {})
+            if resource.get("Type") == "AWS::EC2::VPCGatewayAttachment":
+                gateway = _ref(properties.get("InternetGatewayId"))
+                if gateway:
+                    attachments[gateway] = name
+            elif resource.get("Type") == "AWS::EC2::SubnetRouteTableAssociation":
+                subnet, route_table = _ref(properties.get("SubnetId")), _ref(properties.get("RouteTableId"))
+                if subnet and route_table:
+                    route_tables[subnet] = route_table
+            elif resource.get("Type") == "AWS::EC2::Route" and properties.get("DestinationCidrBlock") == "0.0.0.0/0":
+                route_table = _ref(properties.get("RouteTableId"))
+                if route_table:
+                    default_routes[route_table] = name
+        warnings = []
+        for name, resource in sorted(self.resources.items()):
+            properties = resource.get("Properties", {})
+            if resource.get("Type") == "AWS::EC2::Route":
+                gateway = _ref(properties.get("GatewayId"))
+                if gateway not in attachments:
+                    continue
+                attachment = attachments[gateway]
+                if not self._reachable(name, attachment):
+                    warnings.append(f"{name} routes through {gateway} but does not depend "
+                                    f"on its attachment {attachment}")
+            elif resource.get("Type") == "AWS::EC2::Instance" and "UserData" in properties:
+                subnets = [properties.get("SubnetId")] + [interface.get("SubnetId")
+                                                          for interface in properties.get("NetworkInterfaces", [])
+                                                          if isinstance(interface, dict)]
+                for subnet in filter(None, map(_ref, subnets)):
+                    route = default_routes.get(route_tables.get(subnet))
+                    if route and not self._reachable(name, route):
+                        warnings.append(f"{name} runs user data in {subnet} but does not depend "
+                                        f"on its default route {route}")
+        return warnings
+
+    def pruned(self, kinds: Iterable[str] = (IMPLIED, TRANSITIVE)) -> Dict[str, Any]:
+        """Copy of the template without the explicit edges of the given kinds,
+        except those ``warnings()`` needs (a route through an internet gateway
+        must wait for its attachment, an instance for its default route),
+        which are kept."""
+        return self._prune(kinds)[0]
+
+    def pruned_edges(self, kinds: Iterable[str] = (IMPLIED, TRANSITIVE)) -> List[EdgeReport]:
+        """The edges ``pruned()`` removes, with their kind in this template."""
+        return self._prune(kinds)[1]
+
+    def _prune(self, kinds: Iterable[str]) -> Tuple[Dict[str, Any], List[EdgeReport]]:
+        kinds = set(kinds)
+        remove = {}  # type: Dict[str, Set[str]]
+        kept = set()  # type: Set[Tuple[str, str]]
+        original = {(edge.resource, edge.depends_on): edge for edge in self.classify(savings=False)}
+        allowed = set(self.warnings())
+        # Classification is per edge, so remove them one by one against the
+        # current graph: two edges can each be transitive only through the other
+        graph = self
+        while True:
+            edge = next((e for e in graph.classify(savings=False)
+                         if e.kind in kinds and (e.resource, e.depends_on) not in kept), None)
+            if edge is None:
+                break
+            remove.setdefault(edge.resource, set()).add(edge.depends_on)
+            candidate = TemplateGraph(_without_edges(self.template, remove), self.durations, self.resource_durations)
+            if set(candidate.warnings()) <= allowed:
+                graph = candidate
+            else:
+                remove[edge.resource].discard(edge.depends_on)
+                kept.add((edge.resource, edge.depends_on))
+        removed = [original[(name, dep)] for name in sorted(remove) for dep in sorted(remove[name])]
+        return graph.template, removed
+
+
+def _without_edges(template: Dict[str, Any], remove: Dict[str, Set[str]]) -> Dict[str, Any]:
+    resources = {}
+    for name, resource in template.get("Resources", {}).items():
+        if name in remove and "DependsOn" in resource:
+            resource = dict(resource)
+            kept = [dep for dep in _depends_on(resource) if dep not in remove[name]]
+            if kept:
+                resource["DependsOn"] = kept
+            else:
+                del resource["DependsOn"]
+        resources[name] = resource
+    return dict(template, Resources=resources)
+
+
+def report(graph: TemplateGraph, title: str = "") -> str:
+    total, path = graph.critical_path()
+    lines = [f"{title}{': ' if title else ''}{len(graph.resources)} resources, "
+             f"critical path ~{total:.0f}s"]
+    elapsed = 0.0
+    for name in path:
+        elapsed += graph.duration(name)
+        lines.append(f"  {elapsed:>6.0f}s  {name} ({graph.resources[name].get('Type')})")
+    edges = graph.classify()
+    if edges:
+        lines.append("  explicit DependsOn edges:")
+        for edge in edges:
+            saving = f", -{edge.saving:.0f}s on the critical path" if edge.saving else ""
+            lines.append(f"    {edge.resource} -> {edge.depends_on}: {edge.kind}{saving}")
+    for warning in graph.warnings():
+        lines.append(f"  warning: {warning}")
+    return "\n".join(lines)
+
+
+def _template_files(path: str) -> List[str]:
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if name.endswith(".template.json"))
+    return [path]
+
+
+PRUNE_KINDS = {"redundant": (IMPLIED, TRANSITIVE), "all": (IMPLIED, TRANSITIVE, SERIALIZING)}
+
+
+def _print_serializing(title: str, edges: Iterable[EdgeReport], file) -> None:
+    for edge in edges:
+        if edge.kind == SERIALIZING:
+            print(f"{title}: dropped serializing {edge.resource} -> {edge.depends_on}", file=file)
+
+
+def prune_assembly(directory: str, mode: str = "redundant", file=sys.stderr) -> int:
+    """Rewrite the templates of a cloud assembly without the ``mode`` edges,
+    printing the serializing ones (``all``) to ``file``.  Returns the number
+    of DependsOn edges removed."""
+    removed = 0
+    for path in _template_files(directory):
+        with open(path, 'r') as template_file:
+            template = json.load(template_file)
+        pruned, edges = TemplateGraph(template)._prune(PRUNE_KINDS[mode])
+        if edges:
+            with open(path, 'w') as template_file:
+                json.dump(pruned, template_file, indent=1)
+            _print_serializing(os.path.basename(path), edges, file)
+            removed += len(edges)
+    return removed
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Critical path and DependsOn analysis of CloudFormation templates")
+    parser.add_argument("path", help="template file or cloud assembly directory (cdk.out)")
+    parser.add_argument("--durations", help="JSON file of {resource type: seconds} overrides")
+    parser.add_argument("--prune", choices=sorted(PRUNE_KINDS),
+                        help="rewrite the templates without redundant (or all flagged, printing the "
+                             "serializing ones) DependsOn edges")
+    args = parser.parse_args(argv)
+
+    durations = None
+    if args.durations:
+        with open(args.durations, 'r') as durations_file:
+            durations = json.load(durations_file)
+
+    for path in _template_files(args.path):
+        with open(path, 'r') as template_file:
+            graph = TemplateGraph(json.load(template_file), durations)
+        print(report(graph, os.path.basename(path)))
+        if args.prune:
+            template, edges = graph._prune(PRUNE_KINDS[args.prune])
+            _print_serializing("  pruned", edges, sys.stdout)
+            pruned = TemplateGraph(template, durations)
+            with open(path, 'w') as template_file:
+                json.dump(pruned.template, template_file, indent=1)
+            print(f"  pruned: critical path ~{pruned.critical_path()[0]:.0f}s")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Synthesizing the stacks in tests, without network access.
+
+    template = synth_template(AppLbSampleStack, context={"web_fleet": True})
+    asgs = resources_of_type(template, "AWS::AutoScaling::AutoScalingGroup")
+
+The lookups are served from ``STUB_CONTEXT`` (offline, into a throwaway
+cache file), the same values ``benchmarks/bench_synth.py`` uses.
+"""
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+
+STUB_CONTEXT = {"lookups:offline": True,
+                "home_ip": "203.0.113.10",
+                "ami_id": "ami-0de9f803fcac87f46",
+                "availability_zones": "eu-central-1a,eu-central-1b,eu-central-1c",
+                "baked_amis": {},
+                "synthCache:disable": True}
+
+
+def synth_template(stack_class, context: Optional[Dict[str, Any]] = None,
+                   stack_id: str = "TestStack", **kwargs) -> Dict[str, Any]:
+    """Template of ``stack_class`` built alone in an app with ``STUB_CONTEXT``
+    and ``context`` (which wins)."""
+    from aws_cdk import core
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = core.App(outdir=tmp, context=dict(STUB_CONTEXT,
+                                                **{"lookups:cacheFile": os.path.join(tmp, "cdk.context.json")},
+                                                **(context or {})))
+        stack = stack_class(app, stack_id, **kwargs)
+        return app.synth().get_stack_by_name(stack.stack_name).template
+
+
+def resources_of_type(template: Dict[str, Any], resource_type: str) -> Dict[str, Dict[str, Any]]:
+    """{logical ID: resource} of the ``resource_type`` resources of ``template``."""
+    return {logical_id: resource for logical_id, resource in template.get("Resources", {}).items()
+            if resource.get("Type") == resource_type}
+
+
+def ref(template: Dict[str, Any], resource_type: str) -> Dict[str, str]:
+    """``{"Ref": ...}`` of the only ``resource_type`` resource of ``template``."""
+    found = resources_of_type(template, resource_type)
+    assert len(found) == 1, f"expected one {resource_type}, found {sorted(found)}"
+    return {"Ref": next(iter(found))}
+
+
+def _target(value: Any) -> Optional[str]:
+    """Logical ID behind a ``Ref``/``Fn::GetAtt``."""
+    if isinstance(value, dict):
+        if "Ref" in value:
+            return value["Ref"]
+        if "Fn::GetAtt" in value:
+            return value["Fn::GetAtt"][0]
+    return None
+
+
+def subnet_routes(template: Dict[str, Any], destination: str = "0.0.0.0/0") -> Dict[str, Dict[str, Any]]:
+    """``{subnet ID: {"az": ..., "route_table": ..., "nat": ..., "gateway": ...}}``,
+    following each subnet's route table association to its ``destination`` route."""
+    routes = {_target(route["Properties"]["RouteTableId"]): route["Properties"]
+              for route in resources_of_type(template, "AWS::EC2::Route").values()
+              if route["Properties"].get("DestinationCidrBlock") == destination}
+    subnets = resources_of_type(template, "AWS::EC2::Subnet")
+    result = {}
+    for association in resources_of_type(template, "AWS::EC2::SubnetRouteTableAssociation").values():
+        subnet_id = _target(association["Properties"]["SubnetId"])
+        route_table = _target(association["Properties"]["RouteTableId"])
+        route = routes.get(route_table, {})
+        result[subnet_id] = {"az": subnets[subnet_id]["Properties"]["AvailabilityZone"],
+                             "route_table": route_table,
+                             "nat": _target(route.get("NatGatewayId")),
+                             "gateway": _target(route.get("GatewayId"))}
+    return result
+
+
+def nat_gateway_azs(template: Dict[str, Any]) -> Dict[str, str]:
+    """``{NAT gateway ID: AZ of its subnet}``."""
+    subnets = resources_of_type(template, "AWS::EC2::Subnet")
+    return {logical_id: subnets[_target(nat["Properties"]["SubnetId"])]["Properties"]["AvailabilityZone"]
+            for logical_id, nat in resources_of_type(template, "AWS::EC2::NatGateway").items()}
+
+
+def check_nat_per_az(template: Dict[str, Any]) -> None:
+    """Assert the per-AZ NAT topology: one NAT gateway (and EIP) per AZ, each
+    used by the private subnets of its AZ, gateway endpoints on their route tables."""
+    routes = subnet_routes(template)
+    private = {subnet: route for subnet, route in routes.items() if route["nat"]}
+    nat_azs = nat_gateway_azs(template)
+    assert private
+    # One NAT gateway, with its own EIP, per AZ
+    assert len(set(nat_azs.values())) == len(nat_azs)
+    eips = resources_of_type(template, "AWS::EC2::EIP")
+    assert len(eips) == len(nat_azs)
+    assert {nat["Properties"]["AllocationId"]["Fn::GetAtt"][0]
+            for nat in resources_of_type(template, "AWS::EC2::NatGateway").values()} == set(eips)
+    # Every private subnet goes out through the NAT gateway of its own AZ
+    for subnet, route in private.items():
+        assert nat_azs[route["nat"]] == route["az"], subnet
+    # and no NAT gateway is left without a route (still billed)
+    assert {route["nat"] for route in private.values()} == set(nat_azs)
+    # The gateway endpoints are on the private route tables
+    private_route_tables = [{"Ref": route["route_table"]} for route in private.values()]
+    endpoints = resources_of_type(template, "AWS::EC2::VPCEndpoint")
+    assert endpoints
+    for endpoint in endpoints.values():
+        assert endpoint["Properties"]["VpcEndpointType"] == "Gateway"
+        assert sorted(endpoint["Properties"]["RouteTableIds"], key=str) == sorted(private_route_tables, key=str)
@@ -0,0 +1,209 @@
+"""User data composition: package-relative scripts, multipart, gzip, size report.
+
+EC2 accepts at most 16 KB of user data (before base64).  Scripts are read
+relative to the package that ships them, combined into a cloud-init
+``multipart/mixed`` document when there are several, ``{{ name }}``
+placeholders are substituted per instance, and the result is gzipped (which
+cloud-init detects and inflates) whenever that makes it smaller:
+
+    configure = UserDataPart.from_file(package_file(__file__, "configure.sh"))
+    rendered = render([configure], variables={"server_name": "WebServer01"})
+    instance = ec2.CfnInstance(self, ..., user_data=rendered.cfn_value())
+    annotate(instance, rendered)
+
+Rendering is memoized by the hash of its inputs, so the same script on N
+instances is composed and compressed once.  ``annotate()`` puts the payload
+size on the construct (``cdk synth`` prints it) and fails the synth when the
+limit is exceeded.  The same report for scripts on disk:
+
+    $ python -m cdk_common.user_data app_lb_sample/app_lb_sample/configure.sh --var server_name=web
+"""
+import base64
+import gzip
+import hashlib
+import io
+import os
+import re
+import sys
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence
+
+
+USER_DATA_LIMIT = 16 * 1024
+# Fraction of the limit above which annotate() warns
+WARN_RATIO = 0.75
+
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+# Left in the string by unresolved CDK tokens (Refs, Fn::GetAtt, ...)
+TOKEN_MARKER = "${Token["
+
+CONTENT_TYPES = (("#cloud-config", "text/cloud-config"),
+                 ("#!", "text/x-shellscript"),
+                 ("#include", "text/x-include-url"),
+                 ("#cloud-boothook", "text/cloud-boothook"))
+
+
+def package_file(module_file: str, name: str) -> str:
+    """``name`` next to ``module_file`` (pass ``__file__``), wherever the package lives."""
+    return os.path.join(os.path.dirname(os.path.abspath(module_file)), name)
+
+
+class UserDataPart(NamedTuple):
+    content: str
+    content_type: str = "text/x-shellscript"
+    filename: Optional[str] = None
+
+    @classmethod
+    def from_text(cls, content: str, filename: Optional[str] = None) -> "UserDataPart":
+        """Part whose content type follows its first line (``#!``, ``#cloud-config``, ...)."""
+        for prefix, content_type in CONTENT_TYPES:
+            if content.startswith(prefix):
+                return cls(content, content_type, filename)
+        return cls(content, filename=filename)
+
+    @classmethod
+    def from_file(cls, path: str) -> "UserDataPart":
+        return cls.from_text(_read(path), filename=os.path.basename(path))
+
+
+class RenderedUserData(NamedTuple):
+    text: str
+    # What EC2 receives (gzip or UTF-8); None while text holds CDK tokens
+    payload: Optional[bytes]
+    compressed: bool
+    digest: str
+
+    @property
+    def raw_bytes(self) -> int:
+        return len(self.text.encode())
+
+    @property
+    def payload_bytes(self) -> int:
+        return len(self.payload) if self.payload is not None else self.raw_bytes
+
+    @property
+    def ratio(self) -> float:
+        return self.payload_bytes / USER_DATA_LIMIT
+
+    def cfn_value(self) -> str:
+        """Base64 ``UserData`` property value: a literal when the payload is
+        known at synth, ``Fn::Base64`` of the text otherwise."""
+        if self.payload is not None:
+            return base64.b64encode(self.payload).decode()
+        from aws_cdk import core
+
+        return core.Fn.base64(self.text)
+
+    def summary(self) -> str:
+        approx = "~" if self.payload is None else ""
+        return (f"user data {approx}{self.payload_bytes} B"
+                f"{f' (gzip of {self.raw_bytes} B)' if self.compressed else ''}, "
+                f"{self.ratio:.0%} of the {USER_DATA_LIMIT // 1024} KB limit")
+
+
+_files = {}  # type: Dict[tuple, str]
+_rendered = {}  # type: Dict[str, RenderedUserData]
+
+
+def _read(path: str) -> str:
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _files:
+        with open(path, 'r') as script_file:
+            _files[key] = script_file.read()
+    return _files[key]
+
+
+def substitute(text: str, variables: Dict[str, str]) -> str:
+    """Replace the ``{{ name }}`` placeholders; ``$VAR``/``$(cmd)`` are left to the shell."""
+    missing = sorted({name for name in PLACEHOLDER.findall(text) if name not in variables})
+    if missing:
+        raise ValueError(f"user data: no value for {', '.join(missing)}")
+    return PLACEHOLDER.sub(lambda match: str(variables[match.group(1)]), text)
+
+
+def compose(parts: Sequence[UserDataPart], boundary: str) -> str:
+    """The part itself when there is one, a cloud-init multipart document otherwise."""
+    if len(parts) == 1:
+        return parts[0].content
+    document = MIMEMultipart(boundary=boundary)
+    for index, part in enumerate(parts):
+        _, subtype = part.content_type.split("/", 1)
+        charset = "utf-8" if re.search(r"[^\x00-\x7f]", part.content) else "us-ascii"
+        mime_part = MIMEText(part.content, subtype, charset)
+        mime_part.add_header("Content-Disposition", "attachment",
+                             filename=part.filename or f"part-{index:03d}")
+        document.attach(mime_part)
+    return document.as_string()
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 keeps the template identical from one synth to the next
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as gzip_file:
+        gzip_file.write(data)
+    return buffer.getvalue()
+
+
+def render(parts: Iterable[UserDataPart],
+           variables: Optional[Dict[str, str]] = None,
+           compress: Optional[bool] = None) -> RenderedUserData:
+    """Compose, substitute and (``compress=None``: when smaller) gzip ``parts``."""
+    parts = [part if isinstance(part, UserDataPart) else UserDataPart.from_text(part) for part in parts]
+    variables = dict(variables or {})
+    key = hashlib.sha256(repr((parts, sorted(variables.items()), compress)).encode()).hexdigest()
+    if key in _rendered:
+        return _rendered[key]
+
+    text = substitute(compose(parts, boundary=f"==cdk-{key[:16]}=="), variables)
+    payload, compressed = None, False
+    if TOKEN_MARKER in text:
+        if compress:
+            raise ValueError("user data: parts holding CDK tokens can't be compressed")
+    else:
+        payload = text.encode()
+        if compress is not False:
+            gzipped = _gzip(payload)
+            if compress or len(gzipped) < len(payload):
+                payload, compressed = gzipped, True
+    rendered = RenderedUserData(text, payload, compressed, hashlib.sha256(text.encode()).hexdigest())
+    _rendered[key] = rendered
+    return rendered
+
+
+def annotate(construct, rendered: RenderedUserData) -> None:
+    """Size of ``rendered`` as an info/warning annotation of ``construct``, an
+    error (the synth fails) above the EC2 limit."""
+    from aws_cdk import core
+
+    annotations = core.Annotations.of(construct)
+    if rendered.payload_bytes > USER_DATA_LIMIT:
+        annotations.add_error(rendered.summary())
+    elif rendered.ratio > WARN_RATIO:
+        annotations.add_warning(rendered.summary())
+    else:
+        annotations.add_info(rendered.summary())
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Size of the user data built from scripts")
+    parser.add_argument("scripts", nargs="+")
+    parser.add_argument("--var", action="append", default=[], metavar="NAME=VALUE")
+    parser.add_argument("--compress", choices=("auto", "always", "never"), default="auto")
+    args = parser.parse_args(argv)
+
+    try:
+        rendered = render([UserDataPart.from_file(path) for path in args.scripts],
+                          variables=dict(var.split("=", 1) for var in args.var),
+                          compress={"auto": None, "always": True, "never": False}[args.compress])
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    print(rendered.summary())
+    sys.exit(1 if rendered.payload_bytes > USER_DATA_LIMIT else 0)
+
+
+if __name__ == "__main__":
+    main()
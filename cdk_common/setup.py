@@ -0,0 +1,42 @@
+import setuptools
+
+
+with open("README.md") as fp:
+    long_description = fp.read()
+
+
+setuptools.setup(
+    name="cdk_common",
+    version="0.0.1",
+
+    description="Shared helpers for the CDK Python apps in this repository",
+    long_description=long_description,
+    long_description_content_type="text/markdown",
+
+    author="author",
+
+    packages=setuptools.find_packages(),
+
+    install_requires=[
+        "requests",
+    ],
+
+    python_requires=">=3.6",
+
+    classifiers=[
+        "Development Status :: 4 - Beta",
+
+        "Intended Audience :: Developers",
+
+        "License :: OSI Approved :: Apache Software License",
+
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+
+        "Topic :: Utilities",
+
+        "Typing :: Typed",
+    ],
+)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# cdk_common, as the app.py of the projects sees it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,62 @@
+import json
+import os
+
+from cdk_common.compact import CompactOptions, compact_template
+from cdk_common.deploy_plan import (ADD, CREATE, DEPLOY, REMOVE, REPLACE, SKIP, STACK_TAGS, UPDATE, diff_templates,
+                                    plan_assembly, record)
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "deploy_plan")
+ASSEMBLY = os.path.join(FIXTURES, "assembly")
+DEPLOYED = os.path.join(FIXTURES, "deployed")
+
+
+def _plans():
+    return {plan.stack: plan for plan in plan_assembly(ASSEMBLY, DEPLOYED)}
+
+
+def _load(*path):
+    with open(os.path.join(FIXTURES, *path), 'r') as template_file:
+        return json.load(template_file)
+
+
+def test_stack_actions():
+    assert {stack: plan.action for stack, plan in _plans().items()} == {
+        "network": DEPLOY, "storage": SKIP, "tagged": DEPLOY, "new": CREATE}
+
+
+def test_resource_changes():
+    changes = {change.logical_id: change for change in _plans()["network"].changes}
+    # VPC: only its tags moved to the stack, a no-op
+    assert set(changes) == {"Subnet", "Web", "WebSG", "LegacyEIP", "WebEIP"}
+    assert (changes["Subnet"].action, changes["Subnet"].properties) == (REPLACE, ["CidrBlock"])
+    # Replaced because the subnet it references is
+    assert (changes["Web"].action, changes["Web"].properties, changes["Web"].caused_by) == (
+        REPLACE, ["SubnetId"], ["Subnet"])
+    assert (changes["WebSG"].action, changes["WebSG"].properties) == (UPDATE, ["SecurityGroupIngress"])
+    assert changes["LegacyEIP"].action == REMOVE
+    assert changes["WebEIP"].action == ADD
+
+
+def test_stack_tags_only():
+    plan = _plans()["tagged"]
+    assert plan.changes == []
+    assert plan.sections == [STACK_TAGS]
+
+
+def test_compact_equals_verbose():
+    verbose = _load("deployed", "network.template.json")
+    compacted, report = compact_template(verbose, CompactOptions())
+    assert report.tags_collapsed == {"project": "demo"}
+    assert diff_templates(verbose, compacted, new_tags=report.tags_collapsed).action == SKIP
+    # Without the manifest tags the resources lost a tag
+    assert diff_templates(verbose, compacted).sections == [STACK_TAGS]
+
+
+def test_record_keeps_the_stack_tags(tmp_path):
+    snapshots = str(tmp_path)
+    assert record(ASSEMBLY, snapshots, ["tagged", "network"]) == ["tagged", "network"]
+    with open(os.path.join(snapshots, "tagged.tags.json"), 'r') as tags_file:
+        assert json.load(tags_file) == {"owner": "platform-team", "project": "demo"}
+    plans = plan_assembly(ASSEMBLY, snapshots, ["tagged", "network"])
+    assert [plan.action for plan in plans] == [SKIP, SKIP]
@@ -0,0 +1,19 @@
+from cdk_common.environments import Environment, load_environments
+
+
+def test_stack_context():
+    assert Environment("dev").context is None
+    assert Environment("dev").stack_context(0) == {"environment": "dev"}
+    env = Environment("prod", context={"instance_profile": "compute"}, cidr="10.20.0.0/16")
+    assert env.stack_context(1) == {"instance_profile": "compute", "environment": "prod",
+                                    "vpc_cidr": "10.20.16.0/20"}
+    # The environment's own context is left as it was
+    assert env.context == {"instance_profile": "compute"}
+
+
+def test_matrix():
+    environments = load_environments({"regions": ["eu-central-1", "eu-west-1"],
+                                      "context": {"instance_profile": "burstable"}})
+    assert [(env.name, env.region, env.cidr) for env in environments] == [
+        ("eu-central-1", "eu-central-1", "10.0.0.0/16"), ("eu-west-1", "eu-west-1", "10.1.0.0/16")]
+    assert environments[0].context is not environments[1].context
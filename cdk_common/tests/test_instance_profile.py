@@ -0,0 +1,19 @@
+import pytest
+
+from cdk_common.instance_profile import PRESETS, InstanceProfile
+
+
+def test_cluster_placement_falls_back_to_spread_across_azs():
+    network = PRESETS["network"]
+    assert network.placement == "cluster"
+    assert network.for_azs(["eu-central-1a", "eu-central-1a"]) is network
+    assert network.for_azs(["eu-central-1a", "eu-central-1b"]).placement == "spread"
+    assert PRESETS["compute"].for_azs(["eu-central-1a", "eu-central-1b"]) is PRESETS["compute"]
+
+
+def test_require_ena():
+    assert InstanceProfile.from_context({"preset": "network", "instance_type": "c5n.xlarge"}).require_ena
+    with pytest.raises(ValueError, match="ENA"):
+        InstanceProfile.from_context({"preset": "compute", "instance_type": "c4.large"})
+    # Without the check, any family goes
+    InstanceProfile.from_context({"preset": "compute", "instance_type": "c4.large", "require_ena": False})
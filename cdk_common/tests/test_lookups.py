@@ -0,0 +1,30 @@
+import threading
+
+import pytest
+
+from cdk_common.lookups import LookupCache, LookupFailedError, Lookups
+
+
+def _lookups(tmp_path, region, context):
+    return Lookups(cache=LookupCache(str(tmp_path / "cdk.context.json")), region=region, offline=True,
+                   context=context)
+
+
+def test_prefetch_reads_the_context_on_the_calling_thread(tmp_path):
+    threads = set()
+
+    def context(key):
+        threads.add(threading.get_ident())
+        return {"home_ip": "203.0.113.10", "availability_zones": "eu-west-1a,eu-west-1b"}.get(key)
+
+    results = _lookups(tmp_path, "eu-west-1", context).prefetch()
+    assert threads == {threading.get_ident()}
+    assert results["home_ip"] == "203.0.113.10"
+    assert results["availability_zones"] == ["eu-west-1a", "eu-west-1b"]
+
+
+def test_offline_azs_need_the_context_outside_the_known_regions(tmp_path):
+    assert _lookups(tmp_path, "eu-central-1", lambda key: None).availability_zones() == [
+        "eu-central-1a", "eu-central-1b", "eu-central-1c"]
+    with pytest.raises(LookupFailedError, match="availability_zones"):
+        _lookups(tmp_path, "ap-northeast-1", lambda key: None).availability_zones()
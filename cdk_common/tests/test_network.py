@@ -0,0 +1,35 @@
+import pytest
+
+from cdk_common.network import PRESETS, NetworkTopology, _endpoint_id
+
+
+class FakeNode:
+    path = "Stack"
+
+    def __init__(self, children=()):
+        self.children = set(children)
+
+    def try_find_child(self, construct_id):
+        return object() if construct_id in self.children else None
+
+
+class FakeScope:
+    def __init__(self, children=()):
+        self.node = FakeNode(children)
+
+
+def test_per_az_preset():
+    topology = NetworkTopology.from_context('{"preset": "per-az", "interface_endpoints": ["ssm", "ecr.api"]}')
+    assert topology == PRESETS["per-az"]._replace(interface_endpoints=("ssm", "ecr.api"))
+
+
+def test_endpoint_ids():
+    taken = {}
+    assert _endpoint_id(FakeScope(), "s3", taken) == "Endpoint_s3"
+    assert _endpoint_id(FakeScope(), "ecr.api", taken) == "Endpoint_ecr.api"
+    # Same logical ID (Endpointecrapi) as ecr.api
+    with pytest.raises(ValueError, match="ecr-api"):
+        _endpoint_id(FakeScope(), "ecr-api", taken)
+    # The helper called twice on a scope
+    with pytest.raises(ValueError, match="dynamodb"):
+        _endpoint_id(FakeScope({"Endpoint_dynamodb"}), "dynamodb", {})
@@ -0,0 +1,32 @@
+import pytest
+
+from cdk_common.sg_rules import IngressRule, compile_rules
+
+
+def test_compile_merges_ranges_per_source():
+    rules = [IngressRule("tcp", port, port, cidr_ip="10.0.0.0/8") for port in (22, 23, 24, 80)]
+    rules.append(IngressRule("tcp", 22, 22, cidr_ip="192.168.0.0/16"))
+    assert [(rule.cidr_ip, rule.from_port, rule.to_port) for rule in compile_rules(rules)] == [
+        ("10.0.0.0/8", 22, 24), ("10.0.0.0/8", 80, 80), ("192.168.0.0/16", 22, 22)]
+
+
+def test_standalone_rules_from_two_sources_on_one_port():
+    pytest.importorskip("aws_cdk")
+    from aws_cdk import core
+    from aws_cdk import aws_ec2 as ec2
+
+    from cdk_common.sg_rules import add_ingress_rules
+    from cdk_common.testing import resources_of_type, synth_template
+
+    class RulesStack(core.Stack):
+        def __init__(self, scope, construct_id, **kwargs):
+            super().__init__(scope, construct_id, **kwargs)
+            group = ec2.CfnSecurityGroup(self, id="SG", group_description="test", vpc_id="vpc-12345678")
+            add_ingress_rules(self, "sg_in", group,
+                              [IngressRule("tcp", 443, 443, cidr_ip="10.0.0.0/8"),
+                               IngressRule("tcp", 443, 443, cidr_ip="192.168.0.0/16")],
+                              inline=False)
+
+    ingress = resources_of_type(synth_template(RulesStack), "AWS::EC2::SecurityGroupIngress")
+    assert {logical_id: rule["Properties"]["CidrIp"] for logical_id, rule in ingress.items()} == {
+        "sgintcp443": "10.0.0.0/8", "sgintcp443src2": "192.168.0.0/16"}
@@ -0,0 +1,15 @@
+from cdk_common.synth_cache import SynthCache
+
+
+def _key(tmp_path, lookups):
+    source = tmp_path / "app.py"
+    source.write_text("print('app')\n")
+    return SynthCache(str(tmp_path), sources=[str(source)], context={}, lookups=lambda: lookups).key()
+
+
+def test_key_follows_the_lookups_of_every_region(tmp_path):
+    lookups = {"default": {"ami_id": "ami-1"}, "regions": {"eu-west-1": {"ami_id": "ami-2"}}}
+    key = _key(tmp_path, lookups)
+    assert _key(tmp_path, lookups) == key
+    # A lookup of another region than the default one changed
+    assert _key(tmp_path, dict(lookups, regions={"eu-west-1": {"ami_id": "ami-3"}})) != key
@@ -0,0 +1,91 @@
+import io
+import json
+
+from cdk_common.template_graph import IMPLIED, SERIALIZING, TRANSITIVE, TemplateGraph, prune_assembly
+
+
+def _template():
+    return {"Resources": {
+        "VPC": {"Type": "AWS::EC2::VPC"},
+        "IGW": {"Type": "AWS::EC2::InternetGateway"},
+        "Attachment": {"Type": "AWS::EC2::VPCGatewayAttachment",
+                       "Properties": {"VpcId": {"Ref": "VPC"}, "InternetGatewayId": {"Ref": "IGW"}}},
+        "RouteTable": {"Type": "AWS::EC2::RouteTable", "Properties": {"VpcId": {"Ref": "VPC"}}},
+        "Route": {"Type": "AWS::EC2::Route",
+                  "Properties": {"RouteTableId": {"Ref": "RouteTable"}, "GatewayId": {"Ref": "IGW"}},
+                  "DependsOn": ["Attachment"]},
+        "SecurityGroup": {"Type": "AWS::EC2::SecurityGroup",
+                          "Properties": {"VpcId": {"Ref": "VPC"}},
+                          "DependsOn": ["VPC", "RouteTable"]},
+    }}
+
+
+def test_classify():
+    kinds = {(edge.resource, edge.depends_on): edge.kind for edge in TemplateGraph(_template()).classify()}
+    assert kinds == {("Route", "Attachment"): SERIALIZING,
+                     ("SecurityGroup", "VPC"): IMPLIED,
+                     ("SecurityGroup", "RouteTable"): SERIALIZING}
+
+
+def test_prune_all_keeps_the_attachment_edge():
+    graph = TemplateGraph(_template())
+    assert not graph.warnings()
+    pruned = TemplateGraph(graph.pruned((IMPLIED, TRANSITIVE, SERIALIZING)))
+    assert pruned.resources["Route"]["DependsOn"] == ["Attachment"]
+    assert "DependsOn" not in pruned.resources["SecurityGroup"]
+    assert not pruned.warnings()
+
+
+def test_warning_without_the_attachment_edge():
+    template = _template()
+    del template["Resources"]["Route"]["DependsOn"]
+    assert TemplateGraph(template).warnings() == [
+        "Route routes through IGW but does not depend on its attachment Attachment"]
+
+
+def _nat_template():
+    template = _template()
+    template["Resources"].update({
+        "Subnet": {"Type": "AWS::EC2::Subnet", "Properties": {"VpcId": {"Ref": "VPC"}}},
+        "PrivateRouteTable": {"Type": "AWS::EC2::RouteTable", "Properties": {"VpcId": {"Ref": "VPC"}}},
+        "Association": {"Type": "AWS::EC2::SubnetRouteTableAssociation",
+                        "Properties": {"SubnetId": {"Ref": "Subnet"}, "RouteTableId": {"Ref": "PrivateRouteTable"}}},
+        "EIP": {"Type": "AWS::EC2::EIP"},
+        "NatGateway": {"Type": "AWS::EC2::NatGateway",
+                       "Properties": {"AllocationId": {"Fn::GetAtt": ["EIP", "AllocationId"]},
+                                      "SubnetId": {"Ref": "Subnet"}}},
+        "NatRoute": {"Type": "AWS::EC2::Route",
+                     "Properties": {"RouteTableId": {"Ref": "PrivateRouteTable"},
+                                    "DestinationCidrBlock": "0.0.0.0/0",
+                                    "NatGatewayId": {"Ref": "NatGateway"}}},
+        "AppServer": {"Type": "AWS::EC2::Instance",
+                      "Properties": {"SubnetId": {"Ref": "Subnet"}, "UserData": "IyEvYmluL2Jhc2gKeXVtIHVwZGF0ZSAteQo="},
+                      "DependsOn": ["NatRoute"]},
+    })
+    return template
+
+
+def test_prune_all_keeps_the_nat_route_edge():
+    graph = TemplateGraph(_nat_template())
+    assert not graph.warnings()
+    pruned = TemplateGraph(graph.pruned((IMPLIED, TRANSITIVE, SERIALIZING)))
+    assert pruned.resources["AppServer"]["DependsOn"] == ["NatRoute"]
+    assert not pruned.warnings()
+    assert [(edge.resource, edge.depends_on) for edge in graph.pruned_edges((IMPLIED, TRANSITIVE, SERIALIZING))] \
+        == [("SecurityGroup", "RouteTable"), ("SecurityGroup", "VPC")]
+
+
+def test_warning_without_the_nat_route_edge():
+    template = _nat_template()
+    del template["Resources"]["AppServer"]["DependsOn"]
+    assert TemplateGraph(template).warnings() == [
+        "AppServer runs user data in Subnet but does not depend on its default route NatRoute"]
+
+
+def test_prune_assembly_prints_the_serializing_edges(tmp_path):
+    (tmp_path / "network.template.json").write_text(json.dumps(_nat_template()))
+    output = io.StringIO()
+    assert prune_assembly(str(tmp_path), "all", file=output) == 2
+    assert output.getvalue() == "network.template.json: dropped serializing SecurityGroup -> RouteTable\n"
+    pruned = json.loads((tmp_path / "network.template.json").read_text())
+    assert pruned["Resources"]["AppServer"]["DependsOn"] == ["NatRoute"]
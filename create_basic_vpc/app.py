@@ -1,11 +1,9 @@
 #!/usr/bin/env python3
 
-from aws_cdk import core
+from cdk_common.entrypoint import synth_app
+from cdk_common.parallel_synth import StackSpec
 
-from create_basic_vpc.create_basic_vpc_stack import CreateBasicVpcStack
-
-
-app = core.App()
-CreateBasicVpcStack(app, "create-basic-vpc")
-
-app.synth()
+# Reuses the previous cloud assembly when none of the inputs changed,
+# CDK_PROFILE=<dir> profiles the synth instead
+synth_app(__file__, "create_basic_vpc",
+          [StackSpec("create-basic-vpc", "create_basic_vpc.create_basic_vpc_stack:CreateBasicVpcStack")])
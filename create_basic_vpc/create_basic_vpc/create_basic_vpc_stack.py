@@ -1,33 +1,55 @@
 from aws_cdk import core
-from aws_cdk import aws_ec2 as ec2
-import requests
+from cdk_common.cidr import SubnetAllocator
+from cdk_common.instance_profile import InstanceProfile
+from cdk_common.lookups import Lookups
+from cdk_common.network import NetworkTopology, add_vpc_endpoints, az_suffix
+from cdk_common.sg_rules import add_ingress_rules, rules_from_ports
 
 
 class CreateBasicVpcStack(core.Stack):
 
     def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
+        # Service modules are loaded when the stack is built, not when the app imports it
+        from aws_cdk import aws_ec2 as ec2
+
+        lookups = Lookups.for_scope(self)
+        azs = lookups.availability_zones()
+        ami_id = lookups.ami_id()
+        # Single NAT gateway by default, -c network_topology=per-az for one per AZ + VPC endpoints
+        topology = NetworkTopology.from_context(self.node.try_get_context("network_topology"))
+        # t2.micro by default, -c instance_profile=compute for fixed performance instances, gp3, ...
+        instance_profile = InstanceProfile.from_context(self.node.try_get_context("instance_profile"))
 
         # Create an empty VPC
         # If you don't specify any other resources EXCEPT the VPC, there's a standard template applied
+        # Set per environment by the root app (-c vpc_cidr=10.1.0.0/20)
+        vpc_cidr = self.node.try_get_context("vpc_cidr") or "192.168.0.0/20"
         vpc = ec2.Vpc(self, id="MyVPC",
                       nat_gateways=0,
-                      cidr="192.168.0.0/20",
+                      cidr=vpc_cidr,
                       max_azs=1,
                       subnet_configuration=[], )
 
+        # Subnet CIDRs are carved out of the VPC CIDR, checked for overlaps
+        subnets = SubnetAllocator(vpc_cidr)
+        # Left free so the existing subnets keep their addresses
+        subnets.allocate_one("spare", prefix=24)
+        app_alloc = subnets.allocate_one("Application", prefix=24, az=azs[0])
+        web_alloc = subnets.allocate_one("Webhost", prefix=24, az=azs[1 % len(azs)])
+
         # A couple of subnets
         app_subnet = ec2.CfnSubnet(self, id="Application",
                                    vpc_id=vpc.vpc_id,
-                                   availability_zone="eu-central-1a",
-                                   cidr_block="192.168.1.0/24",
+                                   availability_zone=app_alloc.az,
+                                   cidr_block=app_alloc.cidr_block,
                                    map_public_ip_on_launch=False,
                                    tags=[core.CfnTag(key="Name", value="Application")])
 
         web_subnet = ec2.CfnSubnet(self, id="Webhost",
                                    vpc_id=vpc.vpc_id,
-                                   availability_zone="eu-central-1b",
-                                   cidr_block="192.168.2.0/24",
+                                   availability_zone=web_alloc.az,
+                                   cidr_block=web_alloc.cidr_block,
                                    map_public_ip_on_launch=True,
                                    tags=[core.CfnTag(key="Name", value="WebHost")])
 
@@ -49,14 +71,32 @@ class CreateBasicVpcStack(core.Stack):
                                            subnet_id=app_subnet.ref,
                                            route_table_id=private_rt.ref)
 
+        # The NAT gateway lives in the public subnet, unless it has to be in the
+        # private subnet's AZ, which then gets a small public subnet of its own
+        nat_subnet = web_subnet
+        if topology.nat_per_az and app_alloc.az != web_alloc.az:
+            nat_subnet_id = f"Public_{az_suffix(app_alloc.az)}"
+            nat_alloc = subnets.allocate_one(nat_subnet_id, prefix=28, az=app_alloc.az)
+            nat_subnet = ec2.CfnSubnet(self, id=nat_subnet_id,
+                                       vpc_id=vpc.vpc_id,
+                                       availability_zone=nat_alloc.az,
+                                       cidr_block=nat_alloc.cidr_block,
+                                       map_public_ip_on_launch=True,
+                                       tags=[core.CfnTag(key="Name", value=nat_subnet_id)])
+            ec2.CfnSubnetRouteTableAssociation(self, id=f"{nat_subnet_id}RTAssoc",
+                                               subnet_id=nat_subnet.ref,
+                                               route_table_id=public_rt.ref)
+
+        core.Annotations.of(vpc).add_info(subnets.summary())
+
         # A gateway (Internet Gateway in this case)
         igw = ec2.CfnInternetGateway(self, id="MyIGW",
                                      tags=[core.CfnTag(key="Name", value="IGW")])
 
         # How to associate a gateway to a VPC (IGW in this case - for VGW use vpn_gateway_id=blablabla)
-        ec2.CfnVPCGatewayAttachment(self, id="IGW_Assoc",
-                                    vpc_id=vpc.vpc_id,
-                                    internet_gateway_id=igw.ref)
+        igw_assoc = ec2.CfnVPCGatewayAttachment(self, id="IGW_Assoc",
+                                                vpc_id=vpc.vpc_id,
+                                                internet_gateway_id=igw.ref)
 
         # Elastic IP
         eip_01 = ec2.CfnEIP(self, id="EIP01")
@@ -64,7 +104,7 @@ class CreateBasicVpcStack(core.Stack):
         # NAT gateway
         ngw = ec2.CfnNatGateway(self, id="NAT_GW",
                                 allocation_id=eip_01.attr_allocation_id,
-                                subnet_id=web_subnet.ref,
+                                subnet_id=nat_subnet.ref,
                                 tags=[core.CfnTag(key="Name", value="NAT_GW")])
 
         ngw.add_depends_on(eip_01)
@@ -75,7 +115,8 @@ class CreateBasicVpcStack(core.Stack):
                                      destination_cidr_block="0.0.0.0/0",
                                      gateway_id=igw.ref)
 
-        default_route_public.add_depends_on(igw)
+        # The reference to the IGW is not enough, the route fails until the IGW is attached to the VPC
+        default_route_public.add_depends_on(igw_assoc)
 
         default_route_private = ec2.CfnRoute(self, id="DefaultRouteprivate",
                                             route_table_id=private_rt.ref,
@@ -84,6 +125,13 @@ class CreateBasicVpcStack(core.Stack):
 
         default_route_private.add_depends_on(ngw)
 
+        # S3/DynamoDB (and optional interface) endpoints, so bulk traffic skips NAT
+        add_vpc_endpoints(self, topology,
+                          vpc_id=vpc.vpc_id,
+                          vpc_cidr=vpc_cidr,
+                          route_table_ids=[private_rt.ref],
+                          subnets_by_az={app_alloc.az: app_subnet.ref})
+
         ### Security Groups ###
         # PUBLIC SUBNET SG
         sg_public = ec2.CfnSecurityGroup(self, id="SG_PUBLIC",
@@ -92,21 +140,17 @@ class CreateBasicVpcStack(core.Stack):
                                          vpc_id=vpc.vpc_id,
                                          tags=[core.CfnTag(key="Name", value="SG_Public")])
 
-        my_home_ip = requests.get("https://api.my-ip.io/ip.json").json()['ip']
+        my_home_ip = lookups.home_ip()
 
         ports_pub = {'tcp': [22, 80],
                      'icmp': [-1]
                     }
 
-        for protocl, ports_list in ports_pub.items():
-            for port in ports_list:
-                ec2.CfnSecurityGroupIngress(self, id=f"sg_pub_in_{protocl}_{port}",
-                                            group_id=sg_public.attr_group_id,
-                                            ip_protocol=protocl,
-                                            cidr_ip=f"{my_home_ip}/32",
-                                            to_port=port,
-                                            from_port=port,
-                                            description=f"{protocl.upper()} {port} from home IP")
+        # Merged into port ranges and inlined into the SG where possible
+        add_ingress_rules(self, "sg_pub_in", sg_public,
+                          rules_from_ports(ports_pub,
+                                           cidr_ip=f"{my_home_ip}/32",
+                                           description="from home IP"))
 
         # SG INGRESS ENTRIES - ICMP - EXAMPLE
         # sg_in_icmp = ec2.CfnSecurityGroupIngress(self, id="SG_PUB_IN_ICMP",
@@ -136,15 +180,10 @@ class CreateBasicVpcStack(core.Stack):
                       'icmp':[-1]
                       }
 
-        for protocl, ports_list in ports_priv.items():
-            for port in ports_list:
-                ec2.CfnSecurityGroupIngress(self, id=f"sg_priv_in_{protocl}_{port}",
-                                            group_id=sg_private.attr_group_id,
-                                            description=f"{protocl.upper()}:{port} from the public subnet only",
-                                            ip_protocol=protocl,
-                                            from_port=port,
-                                            to_port=port,
-                                            source_security_group_id=sg_public.ref)
+        add_ingress_rules(self, "sg_priv_in", sg_private,
+                          rules_from_ports(ports_priv,
+                                           source_security_group_id=sg_public.ref,
+                                           description="from the public subnet only"))
 
         ### EC2 Instances ###
         # Generate some user data _ WIP
@@ -152,17 +191,21 @@ class CreateBasicVpcStack(core.Stack):
 
         # One in the public subnet
         webserver01 = ec2.CfnInstance(self, id="WebServer01",
-                                     image_id="ami-0de9f803fcac87f46",
-                                     instance_type="t2.micro",
+                                     image_id=ami_id,
+                                     instance_type=instance_profile.instance_type,
                                      subnet_id=web_subnet.ref,
                                      key_name="proton_mail_kp",
                                      security_group_ids=[sg_public.ref],
                                      tags=[core.CfnTag(key="Name", value="WebServer01")])
 
         appserver01 = ec2.CfnInstance(self, id="AppServer01",
-                                             image_id="ami-0de9f803fcac87f46",
-                                             instance_type="t2.micro",
+                                             image_id=ami_id,
+                                             instance_type=instance_profile.instance_type,
                                              subnet_id=app_subnet.ref,
                                              key_name="proton_mail_kp",
                                              security_group_ids=[sg_private.ref],
-                                             tags=[core.CfnTag(key="Name", value="AppServer01")])
\ No newline at end of file
+                                             tags=[core.CfnTag(key="Name", value="AppServer01")])
+        # WebServer01 and AppServer01 are in two AZs, no cluster placement group
+        server_profile = instance_profile.for_azs([web_alloc.az, app_alloc.az], self)
+        server_profile.apply(webserver01)
+        server_profile.apply(appserver01)
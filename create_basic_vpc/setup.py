@@ -19,7 +19,8 @@ setuptools.setup(
     packages=setuptools.find_packages(where="create_basic_vpc"),
 
     install_requires=[
-        "aws-cdk.core==1.91.0",
+        "aws-cdk.core==1.93.0",
+        "aws-cdk.aws-cloudwatch==1.93.0",
     ],
 
     python_requires=">=3.6",
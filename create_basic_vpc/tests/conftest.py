@@ -0,0 +1,6 @@
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The project and cdk_common, as the app.py of the project sees them
+sys.path[:0] = [PROJECT_DIR, os.path.join(os.path.dirname(PROJECT_DIR), "cdk_common")]
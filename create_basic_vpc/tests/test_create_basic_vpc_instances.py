@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip("aws_cdk")
+
+from cdk_common.testing import resources_of_type, synth_template
+
+from create_basic_vpc.create_basic_vpc_stack import CreateBasicVpcStack
+
+
+def test_network_preset_across_azs_uses_a_spread_group():
+    template = synth_template(CreateBasicVpcStack, context={"instance_profile": "network"})
+    (group_id, group), = resources_of_type(template, "AWS::EC2::PlacementGroup").items()
+    # A cluster placement group can't hold instances of two AZs
+    assert group["Properties"]["Strategy"] == "spread"
+    instances = resources_of_type(template, "AWS::EC2::Instance")
+    assert {name: instance["Properties"]["PlacementGroupName"] for name, instance in instances.items()} == {
+        "WebServer01": {"Ref": group_id}, "AppServer01": {"Ref": group_id}}
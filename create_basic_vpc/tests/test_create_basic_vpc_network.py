@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("aws_cdk")
+
+from cdk_common.testing import check_nat_per_az, nat_gateway_azs, resources_of_type, subnet_routes, synth_template
+
+from create_basic_vpc.create_basic_vpc_stack import CreateBasicVpcStack
+
+
+def test_single_nat_gateway_by_default():
+    template = synth_template(CreateBasicVpcStack)
+    assert len(nat_gateway_azs(template)) == 1
+    assert not resources_of_type(template, "AWS::EC2::VPCEndpoint")
+    routes = subnet_routes(template)
+    assert routes["Application"]["nat"] and routes["Webhost"]["gateway"]
+
+
+def test_per_az_topology():
+    template = synth_template(CreateBasicVpcStack, context={"network_topology": "per-az"})
+    check_nat_per_az(template)
+    # The private subnet's AZ gets a public subnet for its NAT gateway
+    routes = subnet_routes(template)
+    assert nat_gateway_azs(template)[routes["Application"]["nat"]] == routes["Application"]["az"]
+    assert routes["Application"]["az"] != routes["Webhost"]["az"]
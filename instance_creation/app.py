@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 
-from aws_cdk import core
-
-from instance_creation.instance_creation_stack import InstanceCreationStack
-
-
-app = core.App()
-InstanceCreationStack(app, "instance-creation")
-
-app.synth()
+from cdk_common.entrypoint import synth_app
+from cdk_common.parallel_synth import StackSpec
+
+# Reuses the previous cloud assembly when none of the inputs changed,
+# CDK_PROFILE=<dir> profiles the synth instead
+synth_app(__file__, "instance_creation",
+          [StackSpec("instance-creation", "instance_creation.instance_creation_stack:InstanceCreationStack"),
+           StackSpec("instance-creation-ami", "instance_creation.ami_stack:InstanceCreationAmiStack")])
@@ -1,25 +1,45 @@
 from aws_cdk import core
-from aws_cdk import aws_ec2 as ec2
-import requests
+from cdk_common.ami_pipeline import image_and_user_data
+from cdk_common.cidr import SubnetAllocator
+from cdk_common.instance_profile import InstanceProfile
+from cdk_common.lookups import Lookups
+from cdk_common.sg_rules import add_ingress_rules, rules_from_ports
+from cdk_common.user_data import UserDataPart, annotate, render
+
+from instance_creation.ami_stack import CONFIGURE_SCRIPT, IMAGE_NAME
 
 
 class InstanceCreationStack(core.Stack):
 
     def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
+        # Service modules are loaded when the stack is built, not when the app imports it
+        from aws_cdk import aws_ec2 as ec2
+
+        lookups = Lookups.for_scope(self)
+        azs = lookups.availability_zones()
 
+        # Set per environment by the root app (-c vpc_cidr=10.1.0.0/20)
+        vpc_cidr = self.node.try_get_context("vpc_cidr") or "192.168.0.0/20"
         vpc = ec2.Vpc(self, id="MyVPC",
                       nat_gateways=0,
-                      cidr="192.168.0.0/20",
+                      cidr=vpc_cidr,
                       max_azs=1,
                       subnet_configuration=[])
 
+        subnets = SubnetAllocator(vpc_cidr)
+        # Left free so the existing subnet keeps its address
+        subnets.allocate_one("spare", prefix=24)
+        subnet_alloc = subnets.allocate_one("MySubnet", prefix=24, az=azs[0])
+
         subnet = ec2.Subnet(self, id="MySubnet",
-                            availability_zone="eu-central-1a",
-                            cidr_block="192.168.1.0/24",
+                            availability_zone=subnet_alloc.az,
+                            cidr_block=subnet_alloc.cidr_block,
                             vpc_id=vpc.vpc_id,
                             map_public_ip_on_launch=True)
 
+        core.Annotations.of(vpc).add_info(subnets.summary())
+
         igw = ec2.CfnInternetGateway(self, id="MyIGW",
                                      tags=[core.CfnTag(key="Name", value="IGW")])
 
@@ -39,31 +59,34 @@ class InstanceCreationStack(core.Stack):
                                          vpc_id=vpc.vpc_id,
                                          tags=[core.CfnTag(key="Name", value="SG_Public")])
 
-        my_home_ip = requests.get("https://api.ipify.org").text
+        my_home_ip = lookups.home_ip()
 
         ports_pub = {'tcp': [22, 80],
                      'icmp': [-1]
                      }
 
-        for protocol, ports_list in ports_pub.items():
-            for port in ports_list:
-                ec2.CfnSecurityGroupIngress(self, id=f"sg_pub_in_{protocol}_{port}",
-                                            group_id=sg_public.attr_group_id,
-                                            ip_protocol=protocol,
-                                            cidr_ip=f"{my_home_ip}/32",
-                                            to_port=port,
-                                            from_port=port,
-                                            description=f"{protocol.upper()} {port} from home IP")
+        add_ingress_rules(self, "sg_pub_in", sg_public,
+                          rules_from_ports(ports_pub,
+                                           cidr_ip=f"{my_home_ip}/32",
+                                           description="from home IP"))
 
-        with open("/home/dragos/Documents/AWS_CDK/instance_creation/instance_creation/configure.sh", 'r') as config_file:
-            ud = core.Fn.base64(config_file.read())
+        script = UserDataPart.from_file(CONFIGURE_SCRIPT).content
+        # AMI baked by InstanceCreationAmi when there is one, else configure.sh runs at boot
+        image_id, user_data = image_and_user_data(lookups, IMAGE_NAME, script,
+                                                  environment=self.node.try_get_context("environment"))
 
+        # -c instance_profile=network for a c5n in a cluster placement group, ...
+        instance_profile = InstanceProfile.from_context(self.node.try_get_context("instance_profile"))
         instance = ec2.CfnInstance(self, id="MyInstance",
-                                   image_id="ami-0de9f803fcac87f46",
-                                   instance_type="t2.micro",
+                                   image_id=image_id,
+                                   instance_type=instance_profile.instance_type,
                                    subnet_id=subnet.subnet_id,
                                    key_name="proton_mail_kp",
                                    security_group_ids=[sg_public.ref],
                                    tags=[core.CfnTag(key="Name", value="MyInstance")])
+        instance_profile.apply(instance)
         # COMMENT
-        instance.user_data = ud
+        if user_data:
+            rendered = render([UserDataPart.from_text(user_data, filename="configure.sh")])
+            instance.user_data = rendered.cfn_value()
+            annotate(instance, rendered)
@@ -19,7 +19,11 @@ setuptools.setup(
     packages=setuptools.find_packages(where="instance_creation"),
 
     install_requires=[
-        "aws-cdk.core==1.91.0",
+        "aws-cdk.core==1.93.0",
+        "aws-cdk.aws-cloudwatch==1.93.0",
+        "aws-cdk.aws-iam==1.93.0",
+        "aws-cdk.aws-imagebuilder==1.93.0",
+        "aws-cdk.aws-ssm==1.93.0",
     ],
 
     python_requires=">=3.6",